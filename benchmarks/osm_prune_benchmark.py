@@ -0,0 +1,122 @@
+"""Benchmark of the OSM pruning step: the previous SimpleHandler passes against the osmium filter chain of OSMPruner."""
+import os
+import sys
+import tempfile
+import time
+
+import osmium
+from osmium.osm.mutable import Node, Relation, Way
+
+from geo_classes.OSMPruner import OSMPruner
+
+GRID = 700  # Synthetic extract of GRID x GRID nodes
+HIGHWAY_EVERY = 4  # Every n-th grid row is a highway, the other rows are split into buildings
+
+
+class NodesIdentifierHandler(osmium.SimpleHandler):
+    """First pass of the previous 0_OSM_preprocessing_prune.py."""
+
+    def __init__(self):
+        super().__init__()
+        self.count_nodes = 0
+        self.highway_nodes = set()
+
+    def node(self, n):
+        self.count_nodes += 1
+
+    def way(self, w):
+        if "highway" in w.tags:
+            self.highway_nodes.update([n.ref for n in w.nodes])
+
+
+class HighwayNodesWaysHandler(osmium.SimpleHandler):
+    """Second pass of the previous 0_OSM_preprocessing_prune.py."""
+
+    def __init__(self, highway_nodes_set, writers):
+        super().__init__()
+        self.highway_nodes_set = highway_nodes_set
+        self.writers = writers
+
+    def way(self, w):
+        if "highway" in w.tags:
+            for writer in self.writers:
+                writer.add_way(w)
+
+    def node(self, n):
+        if n.id in self.highway_nodes_set:
+            for writer in self.writers:
+                writer.add_node(n)
+
+
+def write_sample(path):
+    """Write a synthetic extract: a grid of nodes, highway rows, buildings and multipolygon relations."""
+    writer = osmium.SimpleWriter(path)
+    for row in range(GRID):
+        for col in range(GRID):
+            tags = {"amenity": "bench"} if (row * GRID + col) % 50 == 0 else {}
+            writer.add_node(Node(id=row * GRID + col + 1, location=(14.0 + col * 1e-4, 46.0 + row * 1e-4), tags=tags))
+    way_id = 1
+    for row in range(GRID):
+        node_ids = [row * GRID + col + 1 for col in range(GRID)]
+        if row % HIGHWAY_EVERY == 0:
+            for start in range(0, GRID - 1, 50):
+                writer.add_way(Way(id=way_id, nodes=node_ids[start : start + 51], tags={"highway": "residential"}))
+                way_id += 1
+        else:
+            for start in range(0, GRID - 4, 5):
+                building = node_ids[start : start + 4] + [node_ids[start]]
+                writer.add_way(Way(id=way_id, nodes=building, tags={"building": "yes"}))
+                if way_id % 10 == 0:
+                    writer.add_relation(
+                        Relation(id=way_id, members=[("w", way_id, "outer")], tags={"type": "multipolygon"})
+                    )
+                way_id += 1
+    writer.close()
+
+
+def legacy_prune(input_file, output_files):
+    handler = NodesIdentifierHandler()
+    handler.apply_file(input_file)
+    writers = [osmium.SimpleWriter(output_file) for output_file in output_files]
+    HighwayNodesWaysHandler(handler.highway_nodes, writers).apply_file(input_file)
+    for writer in writers:
+        writer.close()
+
+
+def count_objects(path):
+    nodes = ways = relations = 0
+    for obj in osmium.FileProcessor(path):
+        nodes += obj.is_node()
+        ways += obj.is_way()
+        relations += obj.is_relation()
+    return nodes, ways, relations
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        if len(sys.argv) > 1:
+            input_file = sys.argv[1]
+        else:
+            input_file = os.path.join(directory, "sample.osm.pbf")
+            write_sample(input_file)
+        print(f"Input: {input_file}, {os.path.getsize(input_file) / 1e6:.1f} MB")
+
+        for bz2 in (False, True):
+            results = {}
+            for name, prune in [("SimpleHandler", legacy_prune), ("OSMPruner", lambda i, o: OSMPruner(i).prune(o))]:
+                output_files = [os.path.join(directory, f"{name}.osm.pbf")]
+                if bz2:
+                    output_files.append(os.path.join(directory, f"{name}.osm.bz2"))
+                start = time.perf_counter()
+                prune(input_file, output_files)
+                elapsed = time.perf_counter() - start
+                results[name] = count_objects(output_files[0])
+                print(f"{name:>13} (bz2: {bz2!s:5}): {elapsed:6.2f} s")
+                for output_file in output_files:
+                    os.remove(output_file)
+            assert results["SimpleHandler"] == results["OSMPruner"], results
+        print(f"Output: {results['OSMPruner'][0]} nodes, {results['OSMPruner'][1]} ways, identical for both")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark of the asyncio Overpass client against a local stub server with limited capacity."""
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from setup.OverpassClient import AsyncOverpassClient
+
+QUERIES = 500
+CAPACITY = 6  # Queries the stub runs at once, further queries wait in line
+QUEUE = 6  # Queries the stub lets wait, it answers 429 to the rest
+SERVICE_TIME = 0.05  # Seconds per query
+PORT = 8089
+
+RESPONSE = json.dumps(
+    {
+        "version": 0.6,
+        "elements": [{"type": "node", "id": 1, "lat": 46.05, "lon": 14.5, "tags": {"highway": "crossing"}}],
+    }
+)
+
+
+def stub_server():
+    workers = asyncio.Semaphore(CAPACITY)
+    in_progress = 0
+
+    async def interpreter(request):
+        nonlocal in_progress
+        await request.read()
+        if in_progress >= CAPACITY + QUEUE:
+            return web.Response(status=429)
+        in_progress += 1
+        try:
+            async with workers:
+                await asyncio.sleep(SERVICE_TIME)
+        finally:
+            in_progress -= 1
+        return web.Response(text=RESPONSE, content_type="application/json")
+
+    app = web.Application()
+    app.router.add_post("/api/interpreter", interpreter)
+    return app
+
+
+async def run(max_concurrency):
+    client = AsyncOverpassClient(
+        f"http://127.0.0.1:{PORT}/api/interpreter", max_concurrency=max_concurrency, retry_delay=0.05, retries=20
+    )
+    start = time.perf_counter()
+    results = await asyncio.gather(*[client.query("node(1); out;") for _ in range(QUERIES)])
+    elapsed = time.perf_counter() - start
+    await client.close()
+    assert all(len(result.nodes) == 1 for result in results)
+    print(f"max_concurrency={max_concurrency:3d}: {QUERIES / elapsed:7.1f} queries/s, {client}")
+
+
+async def main():
+    runner = web.AppRunner(stub_server())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    print(f"{QUERIES} queries against a stub running {CAPACITY} queries at once and queueing {QUEUE}")
+    try:
+        for max_concurrency in (1, 4, 16, 64):
+            await run(max_concurrency)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
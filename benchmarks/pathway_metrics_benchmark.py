@@ -0,0 +1,92 @@
+"""Benchmark of the per-edge metric calculation: the previous per-node Python loops against the NumPy kernel."""
+import math
+import time
+
+import numpy as np
+from geopy import distance as geopy_distance
+
+from graph.PathwayHelpers.PathMetrics import batch_path_metrics, path_metrics
+
+EDGES = 2000
+HILL_GRADIENT_BINS = [-0.15, -0.09, -0.06, -0.03, -0.01, 0.01, 0.03, 0.06, 0.09, 0.15]
+
+
+def latlon_to_cartesian(lat, lon):
+    R = 6371  # Earth radius in kilometers
+    phi = np.radians(float(lat))
+    theta = np.radians(float(lon))
+    return np.array([R * np.cos(phi) * np.cos(theta), R * np.cos(phi) * np.sin(theta), R * np.sin(phi)])
+
+
+def calculate_angle(p1, p2, p3):
+    v1 = p2 - p1
+    v2 = p3 - p2
+    cos_angle = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
+    return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+
+def loop_metrics(lats, lons, altitudes):
+    """Metrics as previously computed by OverpyNodesReader, Pathway and HillAscentContainer."""
+    distances = [0]
+    for i in range(1, len(lats)):
+        flat_distance = geopy_distance.distance((lats[i], lons[i]), (lats[i - 1], lons[i - 1])).meters
+        distances.append(math.sqrt(flat_distance**2 + abs(altitudes[i] - altitudes[i - 1]) ** 2) + distances[-1])
+
+    ascent = 0
+    descent = 0
+    for i in range(1, len(altitudes)):
+        if altitudes[i] > altitudes[i - 1]:
+            ascent += altitudes[i] - altitudes[i - 1]
+        if altitudes[i] < altitudes[i - 1]:
+            descent += altitudes[i - 1] - altitudes[i]
+
+    cartesian_nodes = [latlon_to_cartesian(lat, lon) for lat, lon in zip(lats, lons)]
+    angle = sum(
+        calculate_angle(cartesian_nodes[i], cartesian_nodes[i + 1], cartesian_nodes[i + 2])
+        for i in range(len(cartesian_nodes) - 2)
+    )
+
+    buckets = [0] * (len(HILL_GRADIENT_BINS) + 1)
+    for i in range(len(altitudes) - 1):
+        distance = distances[i + 1] - distances[i]
+        gradient = (altitudes[i + 1] - altitudes[i]) / distance if distance != 0 else 0
+        buckets[sum(gradient >= edge for edge in HILL_GRADIENT_BINS)] += distance
+
+    return distances[-1], ascent, descent, angle, angle / distances[-1], buckets
+
+
+def random_edges(count, seed=0):
+    rng = np.random.default_rng(seed)
+    edges = []
+    for _ in range(count):
+        nodes = int(rng.integers(2, 40))
+        lats = 46.0 + np.cumsum(rng.normal(0, 0.0005, nodes))
+        lons = 14.5 + np.cumsum(rng.normal(0, 0.0005, nodes))
+        altitudes = 300 + np.cumsum(rng.normal(0, 3, nodes))
+        edges.append((lats.tolist(), lons.tolist(), altitudes.tolist()))
+    return edges
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    edges = random_edges(EDGES)
+    total_nodes = sum(len(edge[0]) for edge in edges)
+    print(f"{EDGES} edges, {total_nodes} nodes")
+
+    loop_time = timed(lambda: [loop_metrics(*edge) for edge in edges])
+    kernel_time = timed(lambda: [path_metrics(*edge) for edge in edges])
+
+    offsets = np.concatenate([[0], np.cumsum([len(edge[0]) for edge in edges])])
+    lats = np.concatenate([edge[0] for edge in edges])
+    lons = np.concatenate([edge[1] for edge in edges])
+    altitudes = np.concatenate([edge[2] for edge in edges])
+    batch_time = timed(lambda: batch_path_metrics(lats, lons, altitudes, offsets))
+
+    print(f"Python loops:        {loop_time / EDGES * 1e6:8.1f} us/edge")
+    print(f"Kernel, per edge:    {kernel_time / EDGES * 1e6:8.1f} us/edge ({loop_time / kernel_time:.1f}x)")
+    print(f"Kernel, whole batch: {batch_time / EDGES * 1e6:8.1f} us/edge ({loop_time / batch_time:.1f}x)")
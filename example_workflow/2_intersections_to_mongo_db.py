@@ -1,10 +1,14 @@
 """ 1. Parse map and identify intersections. The script uses Overpass API to get the map data. """
 
 from geo_classes.IntersectionMongoParser import IntersectionMongoParser
+from setup.Constants import INTERSECTION_SOURCE
 from setup.GeoConnector import GeoConnector
 from setup.MapBoundaries import MapBoundaries
 
 if __name__ == "__main__":
+    if INTERSECTION_SOURCE == "pbf":
+        print("Intersections were saved by 1_OSM_preprocessing_helper_collections.py (INTERSECTION_SOURCE = pbf).")
+        exit(0)
     map_boundaries = MapBoundaries()
     geo_connector = GeoConnector()
     print("Parsing map and saving intersections to Mongo database...")
@@ -17,3 +21,4 @@ if __name__ == "__main__":
     parser = IntersectionMongoParser(geo_connector=geo_connector, map_boundaries=map_boundaries)
     parser.parse_map()
     print("Parsing complete.")
+    geo_connector.close()
@@ -13,6 +13,7 @@ async def main():
     parser = ProcessedIntersectionMongoParser(geo_connector)
     await parser.parse_to_mongo()
     print("Parsing complete.")
+    geo_connector.close()
 
 
 if __name__ == "__main__":
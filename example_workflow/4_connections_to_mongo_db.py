@@ -1,5 +1,7 @@
 """2. Generate identified connections to neo4j graph"""
 from geo_classes.ConnectionMongoParser import ConnectionMongoParser
+from geo_classes.ConnectionStreamBuilder import ConnectionStreamBuilder
+from setup.Constants import CONNECTION_BUILDER
 from setup.GeoConnector import GeoConnector
 import asyncio
 
@@ -11,9 +13,13 @@ async def main():
     print("#" * 50)
     print(geo_connector)
     print("#" * 50)
-    parser = ConnectionMongoParser(geo_connector)
+    if CONNECTION_BUILDER == "stream":
+        parser = ConnectionStreamBuilder(geo_connector)
+    else:
+        parser = ConnectionMongoParser(geo_connector)
     await parser.parse_to_graph()
     print("Generating complete.")
+    geo_connector.close()
 
 
 if __name__ == "__main__":
@@ -16,6 +16,7 @@ async def main():
     await merger.merge()
     merger.remove_unused_nodes()
     print("Merging complete.")
+    geo_connector.close()
 
 
 if __name__ == "__main__":
@@ -13,6 +13,7 @@ async def main():
     print("#" * 50)
     splitter = IntersectionSplitter(geo_connector)
     await splitter.split()
+    geo_connector.close()
 
 
 if __name__ == "__main__":
@@ -18,6 +18,7 @@ async def main():
         geo_connector, collection_nodes="intersections_splitted", collection_paths="paths_splitted"
     )
     graph_exporter_neo4j.export_to_neo4j()
+    geo_connector.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+"""9. Apply OSM change files (.osc) to the generated graph, regenerating only the affected region."""
+import argparse
+import os
+
+from geo_classes.IncrementalUpdater import IncrementalUpdater
+from setup.GeoConnector import GeoConnector
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply OSM change files without running the whole workflow again.")
+    parser.add_argument("change_files", nargs="*", help="Change files (.osc or .osc.gz), applied in the given order")
+    args = parser.parse_args()
+
+    geo_connector = GeoConnector()
+    print("Applying OSM changes...")
+    print("#" * 50)
+    print(geo_connector)
+    print("#" * 50)
+    updater = IncrementalUpdater(geo_connector)
+
+    # Finish the updates interrupted in an earlier run first, the change files build on each other
+    names = {os.path.basename(change_file) for change_file in args.change_files}
+    for region in updater.pending():
+        if region["_id"] not in names:
+            updater.finish_region(region)
+
+    for change_file in args.change_files:
+        updater.update(change_file)
+    print("Update complete.")
+    geo_connector.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import redis
+
+from setup.Batching import chunks
+
+
+class AddressedNodes:
+    def __init__(self, redis_db: redis.client.Redis, key: str = "addressed_nodes", batch_size: int = 10000):
+        """
+        Progress of stage 4: a Redis set of the intersection IDs whose paths were added. Workers check and mark the IDs
+        of their own tile with pipelined SMISMEMBER / SADD commands, the keyspace is never listed.
+        :param redis_db: Redis client storing the progress
+        :param key: Key of the Redis set
+        :param batch_size: Number of IDs per command
+        """
+        self.redis_db = redis_db
+        self.key = key
+        self.batch_size = batch_size
+
+    def addressed(self, node_ids: list) -> list[bool]:
+        """
+        Check which intersections are addressed.
+        :param node_ids: Intersection IDs
+        :return: List of booleans, in the order of node_ids
+        """
+        pipeline = self.redis_db.pipeline(transaction=False)
+        for batch in chunks(node_ids, self.batch_size):
+            pipeline.smismember(self.key, batch)
+        return [bool(found) for result in pipeline.execute() for found in result]
+
+    def add(self, node_ids: list) -> None:
+        pipeline = self.redis_db.pipeline(transaction=False)
+        for batch in chunks(node_ids, self.batch_size):
+            pipeline.sadd(self.key, *batch)
+        pipeline.execute()
+
+    def remove(self, node_ids: list) -> None:
+        """Forget intersections, the next stage 4 run adds their paths again."""
+        pipeline = self.redis_db.pipeline(transaction=False)
+        for batch in chunks(node_ids, self.batch_size):
+            pipeline.srem(self.key, *batch)
+        pipeline.execute()
+
+    def count(self) -> int:
+        return self.redis_db.scard(self.key)
+
+    def clear(self) -> None:
+        self.redis_db.delete(self.key)
@@ -7,7 +7,8 @@ from setup import GeoConnector
 import time
 from pymongo.database import Collection
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from setup.CollectionPartitioner import CollectionPartitioner
 from setup.Constants import MULTI
 
 
@@ -48,7 +49,6 @@ class ConnectionMerger:
         for merger in batch:
             self.merge_relationship(merger, client, session)
         session.end_session()
-        client.close()
 
     async def merge(self):
         c = True
@@ -107,6 +107,39 @@ class ConnectionMerger:
         with open("merge_log.txt", "a") as file:
             file.write(f"{index}, {total_relationships}, {total_nodes}\n")
 
+    def merge_region(self, node_ids) -> set:
+        """
+        Merge the paths around the given intersections only, like merge() does for the whole collection, and remove
+        the intersections of the region left without paths. Used by IncrementalUpdater after regenerating the paths
+        of a changed region.
+        :param node_ids: Intersection IDs of the region
+        :return: The intersection IDs of the region extended with the ends of the merged paths (including the
+        intersections merged or removed)
+        """
+        client: MongoClient = self.geo_connector.mongo_db()
+        paths: Collection = client["geo_data"].paths
+        region = set(node_ids)
+        candidates = set(node_ids)
+        session = client.start_session()
+        while True:
+            mergers = self.identify_mergers(candidates)
+            if len(mergers) == 0:
+                break
+            for merger in mergers:
+                candidates.discard(merger.node)
+                try:
+                    self.merge_relationship(merger, client, session)
+                except Exception as e:
+                    print(f"Skipping merge of {merger.node}: {e}")
+                    continue
+                region.update(merger.new_relationship)
+                candidates.update(merger.new_relationship)
+        session.end_session()
+
+        paths.delete_many({"$expr": {"$eq": ["$start_node", "$end_node"]}, "start_node": {"$in": list(region)}})
+        self.remove_nodes(query={"_id": {"$in": list(region)}})
+        return region
+
     def merge_nodes(self, nodes_a, nodes_b):
         # Initialize an empty dictionary to keep track of seen node IDs
         seen_ids = {}
@@ -120,14 +153,11 @@ class ConnectionMerger:
                 unique_nodes.append(node)
         return unique_nodes
 
-    def remove_nodes(self, skip=None, limit=None):
+    def remove_nodes(self, query=None):
         geo_connector: MongoClient = self.geo_connector.mongo_db()
         paths: Collection = geo_connector["geo_data"].paths
         intersections: Collection = geo_connector["geo_data"].intersections
-        if skip is not None and limit is not None:
-            batch = intersections.find().skip(skip).limit(limit)
-        else:
-            batch = intersections.find()
+        batch = intersections.find(query or {})
 
         for i in batch:
             node_id = i["_id"]
@@ -135,7 +165,6 @@ class ConnectionMerger:
             count_end = paths.count_documents({"end_node": node_id})
             if count_start == 0 and count_end == 0:
                 intersections.delete_one({"_id": node_id})
-        geo_connector.close()
 
     def remove_unused_nodes(self):
         geo_connector: MongoClient = self.geo_connector.mongo_db()
@@ -150,17 +179,9 @@ class ConnectionMerger:
             self.remove_nodes()
         else:
             pool = multiprocessing.Pool(processes=multiprocessing.cpu_count() - 1)
-            batch_size = 10000
-            for i in range(0, intersections.count_documents({}), batch_size):
-                skip = i
-                limit = batch_size
-                pool.apply_async(
-                    self.remove_nodes,
-                    args=(
-                        skip,
-                        limit,
-                    ),
-                )
+            partitioner = CollectionPartitioner(intersections, batch_size=10000)
+            for query in partitioner.partitions():
+                pool.apply_async(self.remove_nodes, args=(query,))
             pool.close()
             pool.join()
 
@@ -190,6 +211,7 @@ class ConnectionMerger:
             "car_access": doc1["car_access"] and doc2["car_access"],
             "valid": doc1["valid"] and doc2["valid"],
             "nodes": self.merge_nodes(doc1["nodes"], doc2["nodes"]),
+            "way_ids": sorted(set(doc1.get("way_ids", [])) | set(doc2.get("way_ids", []))),
         }
         return merged_doc
 
@@ -252,8 +274,8 @@ class ConnectionMerger:
                 paths.delete_one({"_id": path_backward_part_1["_id"]})
                 paths.delete_one({"_id": path_backward_part_2["_id"]})
 
-                paths.insert_one(path_forward)
-                paths.insert_one(path_backward)
+                self.insert_merged_path(paths, path_forward)
+                self.insert_merged_path(paths, path_backward)
 
                 intersections.delete_one({"_id": merger.node})
 
@@ -262,18 +284,44 @@ class ConnectionMerger:
             print("Error in merging the paths")
         a = 100
 
-    def identify_mergers(self):
+    @staticmethod
+    def insert_merged_path(paths: Collection, path: dict) -> None:
+        """
+        Insert a merged path. Paths are unique per (start_node, end_node): when the merged intersection was a detour
+        next to an existing path between the same intersections, the shorter of both paths is kept.
+        :param paths: The paths collection
+        :param path: Merged path document
+        """
+        try:
+            paths.insert_one(path)
+        except DuplicateKeyError:
+            path.pop("_id", None)
+            paths.replace_one(
+                {"start_node": path["start_node"], "end_node": path["end_node"], "distance": {"$gt": path["distance"]}},
+                path,
+            )
+
+    def identify_mergers(self, node_ids=None):
+        """
+        Find the intersections with exactly two neighbours, connected in both directions, whose paths can be merged.
+        :param node_ids: Only consider these intersections, None for all of them
+        :return: List of PathOptimizationProposal
+        """
         mongo: MongoClient = self.geo_connector.mongo_db()
         db = mongo.geo_data
         collection = db.paths
+        query = {}
+        if node_ids is not None:
+            node_ids = set(node_ids)
+            query = {"$or": [{"start_node": {"$in": list(node_ids)}}, {"end_node": {"$in": list(node_ids)}}]}
 
         node_merge_proposals: Dict[int, PathOptimizationProposal] = defaultdict(
             lambda: PathOptimizationProposal(None, [], [])
         )
 
-        paths = collection.find({}, {"_id": 1, "start_node": 1, "end_node": 1})
+        paths = collection.find(query, {"_id": 1, "start_node": 1, "end_node": 1})
         i = 0
-        total_paths = collection.count_documents({})  # Optional: use to limit print updates
+        total_paths = collection.count_documents(query)  # Optional: use to limit print updates
 
         for path in paths:
             i += 1
@@ -293,7 +341,7 @@ class ConnectionMerger:
             pop_end.a_relationships.append(path["_id"])
 
             # Print progress (optional, adjust frequency)
-            if i % (total_paths // 100) == 0:  # Print at 1% intervals
+            if i % max(total_paths // 100, 1) == 0:  # Print at 1% intervals
                 print(f"Processed {i}/{total_paths} paths", end="\r")
 
         print(f"\nFinished processing {i} paths.")
@@ -305,6 +353,8 @@ class ConnectionMerger:
         for node_id, pop in node_merge_proposals.items():
             if node_id in locked_node_ids:
                 continue
+            if node_ids is not None and node_id not in node_ids:
+                continue  # Only part of the paths of nodes outside of the region were read
             pop.merge = pop.to_merge_proposal()
             i += 1
             if pop.merge:
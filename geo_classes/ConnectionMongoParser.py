@@ -1,17 +1,41 @@
 """3. Find intersections from neo4j and identify pathways between them"""
 import multiprocessing
+import os
 import time
 import overpy
 from pymongo.collection import Collection
 from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from geo_classes.AddressedNodes import AddressedNodes
+from geo_classes.DuplicatePathRemover import DuplicatePathRemover
+from geo_classes.IntersectionIndex import IntersectionIndex
+from geo_classes.TileScheduler import TileScheduler
+from geo_classes.WayCache import WayCache
 from graph.Pathway import Pathway
+from graph.PathwayHelpers.SegmentMemo import RedisSegmentStore, SegmentMemo
 
+from setup.Batching import chunks
 from setup.GeoConnector import GeoConnector
 from setup.MapBoundaries import MapBoundaries
-from setup.Constants import MULTI, OVERPASS_API_URL
+from setup.Constants import (
+    MULTI,
+    INTERSECTION_INDEX_FILE,
+    ADDRESSED_FLUSH_SIZE,
+    WAY_CACHE_SIZE,
+    TILE_ELEVATION_BATCH_SIZE,
+    SEGMENT_MEMO,
+    SEGMENT_MEMO_SIZE,
+    SEGMENT_MEMO_REDIS_DB,
+)
 import pymongo
 from datetime import datetime
 
+# Intersection ID index of the current process, see ConnectionMongoParser.intersection_index()
+shared_intersection_index: IntersectionIndex | None = None
+# Parsed ways of the current process, see ConnectionMongoParser.way_cache()
+shared_way_cache: WayCache | None = None
+
 
 class ConnectionMongoParser:
     def __init__(self, geo_connector: GeoConnector):
@@ -20,6 +44,7 @@ class ConnectionMongoParser:
         :param geo_connector:
         """
         self.geo_connector = geo_connector
+        self.tile_elevations: dict[int, float] = {}  # Node ID -> elevation, see prefetch_elevations()
 
     async def parse_to_graph(self):
         geo_connector = GeoConnector()
@@ -28,26 +53,23 @@ class ConnectionMongoParser:
         db = client.geo_data
         collection: pymongo.collection.Collection = db.paths
 
-        # ensure index creation
-        start_node_end_node_index = collection.create_index(
-            [
-                ("start_node", ASCENDING),  # Use ASCENDING or DESCENDING based on your need
-                ("end_node", ASCENDING),  # You can use DESCENDING if you need a descending order index
-            ]
-        )
+        create_path_indexes(collection)
         total = geo_connector.mongo_db().get_database("geo_data").get_collection("intersections").count_documents({})
-        red = geo_connector.redis_db()
-        addressed_nodes = []
-        cursor = "0"
-        while cursor != 0:
-            cursor, new_keys = red.scan(cursor, match="*", count=10000)
-            addressed_nodes.extend(new_keys)
+        addressed = AddressedNodes(geo_connector.redis_db()).count()
 
         print("Adding connections")
         print("Total nodes: " + str(total))
-        print("Addressed nodes: " + str(len(addressed_nodes)))
-        print("Unaddressed nodes: " + str(total - len(addressed_nodes)))
-        print(f"Progress: {len(addressed_nodes) / total}")
+        print("Addressed nodes: " + str(addressed))
+        print("Unaddressed nodes: " + str(total - addressed))
+        print(f"Progress: {addressed / total}")
+
+        # Build the intersection ID index once per run, workers memory-map it instead of querying Mongo
+        print("Building intersection index...")
+        print(f"Intersection index: {len(self.build_intersection_index())} intersections")
+        print(f"Node store: {len(geo_connector.node_store())} nodes")
+        if self.segment_memo() is not None:
+            # Segments memoized by earlier runs may carry elevations of another elevation backend
+            self.segment_memo().clear()
 
         map_boundaries_search = MapBoundaries()
 
@@ -63,41 +85,75 @@ class ConnectionMongoParser:
         else:
             GRID = 1
 
-        proto_queries_list = map_boundaries_search.generate_grid_queries(GRID)
+        cells = map_boundaries_search.generate_grid_cells(GRID)
+        costs = self.estimate_tile_costs(map_boundaries_search, GRID)
+        tiles = [
+            {"cell": (row, column), "query": generate_query_for_lat_lon(bounds), "cost": costs.get((row, column), 0)}
+            for row, column, bounds in cells
+        ]
+        tiles = [tile for tile in tiles if tile["cost"] > 0]
+        print(f"Tiles: {len(tiles)} of {len(cells)} contain intersections")
 
-        queries = [[generate_query_for_lat_lon(pq) for pq in pql] for pql in proto_queries_list]
-
-        print("Query iterations: " + str(len(queries)))
-        for query in queries:
-            print("Query iteration length: " + str(len(query)))
-
-        self.process_queries(queries, multi=MULTI)
+        self.process_tiles(tiles, multi=MULTI)
 
     def worker(self, query):
         self.parse_query_to_graph(query)
 
-    def process_queries(self, queries, multi):
-        # Define the worker function
+    def estimate_tile_costs(self, map_boundaries: MapBoundaries, grid_size: int) -> dict[tuple[int, int], int]:
+        """
+        Count the intersections of every grid cell with a single aggregation, as the estimated cost of its tile.
+        :param map_boundaries: Boundaries divided into the grid
+        :param grid_size: Number of rows and columns of the grid
+        :return: Dictionary of (row, column) -> number of intersections
+        """
+        intersections = self.geo_connector.mongo_db().get_database("geo_data").get_collection("intersections")
+        lat_step = (map_boundaries.max_lat - map_boundaries.min_lat) / grid_size
+        lon_step = (map_boundaries.max_lon - map_boundaries.min_lon) / grid_size
 
-        # Create a pool of worker processes
+        def cell_index(field: str, minimum: float, step: float) -> dict:
+            return {"$min": [{"$floor": {"$divide": [{"$subtract": [f"${field}", minimum]}, step]}}, grid_size - 1]}
+
+        result = intersections.aggregate(
+            [
+                {
+                    "$match": {
+                        "lat": {"$gt": map_boundaries.min_lat, "$lt": map_boundaries.max_lat},
+                        "lon": {"$gt": map_boundaries.min_lon, "$lt": map_boundaries.max_lon},
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": {
+                            "row": cell_index("lat", map_boundaries.min_lat, lat_step),
+                            "column": cell_index("lon", map_boundaries.min_lon, lon_step),
+                        },
+                        "count": {"$sum": 1},
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        return {(int(cell["_id"]["row"]), int(cell["_id"]["column"])): cell["count"] for cell in result}
+
+    def process_tiles(self, tiles: list[dict], multi: bool):
+        """
+        Generate the paths of the tiles, the most expensive first. With multi, the tiles run on one long-lived pool,
+        neighbouring tiles never at the same time (see TileScheduler).
+        :param tiles: List of {"cell": (row, column), "query": intersection filter, "cost": number of intersections}
+        :param multi: Use a worker pool
+        """
         if multi is True:
-            # Use pool.map to run the worker function in parallel
-            for query_batch in queries:
-                pool = multiprocessing.Pool(processes=multiprocessing.cpu_count() - 1)
-                print(query_batch)
-                pool.map(self.worker, query_batch)
-                pool.close()
-                pool.join()
+            scheduler = TileScheduler(tiles, processes=max(multiprocessing.cpu_count() - 1, 1))
+            failed = scheduler.run(self.worker)
+            if failed:
+                print(f"Failed tiles (run stage 4 again to retry them): {failed}")
         else:
-            for query_batch in queries:
-                for query in query_batch:
-                    self.worker(query)
+            for tile in sorted(tiles, key=lambda tile: tile["cost"], reverse=True):
+                self.worker(tile["query"])
 
     def parse_query_to_graph(self, query: str):
         geo_connector = GeoConnector()
-        api = overpy.Overpass(url=OVERPASS_API_URL)
-
-        addressed_nodes = geo_connector.redis_db().keys()
+        api = geo_connector.overpass_api()
 
         # For testing purposes
         to_delete = []
@@ -108,76 +164,150 @@ class ConnectionMongoParser:
         intersections = client.get_database("geo_data").get_collection("intersections")
         paths = client.get_database("geo_data").get_collection("paths")
 
-        client_secondary = geo_connector.mongo_db()
-        mongo_query_highways: Collection = client_secondary.get_database("geo_data").get_collection("highways_helper")
-        mongo_query_nodes: Collection = client_secondary.get_database("geo_data").get_collection("nodes_helper")
+        mongo_query_highways: Collection = client.get_database("geo_data").get_collection("highways_helper")
 
         map_boundary_nodes = list(intersections.find(query))
 
         total = len(map_boundary_nodes)
 
-        for record in map_boundary_nodes:
+        # Only the intersections of this tile are checked, the finished ones are marked in batches
+        addressed_nodes = self.redis_db_addressed_get([record["_id"] for record in map_boundary_nodes])
+        self.tile_elevations = self.prefetch_elevations(
+            [record["_id"] for record, addressed in zip(map_boundary_nodes, addressed_nodes) if not addressed],
+            mongo_query_highways,
+        )
+        finished = []
+        # Paths of the tile waiting for the next insert, pathways found from both of their ends are only kept once
+        edges = []
+        seen_edges = set()
+
+        for record, addressed in zip(map_boundary_nodes, addressed_nodes):
             key = record["_id"]
             i += 1
-            if str(key).encode() not in addressed_nodes:
+            if not addressed:
                 node_index += 1
                 print(f"Querying node: {key}\t Progress: {i / total:.2%} P: {node_index} {self.time_print()}")
 
-                query_result = self.find_ways_of_node(key, mongo_query_highways, mongo_query_nodes)
+                query_result = self.find_ways_of_node(key, mongo_query_highways)
                 pathways = self.find_connections(
                     query_result,
                     key,
                     [],
                     api,
                     collection_highways=mongo_query_highways,
-                    collection_nodes=mongo_query_nodes,
                 )
 
                 for pathway in pathways:
+                    if not self.intersection_exists([pathway.intersection_a.id, pathway.intersection_b.id]):
+                        continue
                     two_way_relationship = pathway.give_two_way_relationship()
-                    intersections_exists = self.intersection_exists(
-                        [pathway.intersection_a.id, pathway.intersection_b.id]
-                    )
-                    if (
-                        self.exists(pathway.intersection_a, pathway.intersection_b, paths) is False
-                        and pathway.forward is True
-                        and intersections_exists
-                    ):
-                        two_way_relationship[0]["valid"] = True
-                        paths.insert_one(two_way_relationship[0])
-                    if (
-                        self.exists(pathway.intersection_b, pathway.intersection_a, paths) is False
-                        and pathway.backward is True
-                        and intersections_exists
-                    ):
-                        two_way_relationship[1]["valid"] = True
-                        paths.insert_one(two_way_relationship[1])
-                self.redis_db_addressed_set(key)
+                    for relationship, allowed in zip(two_way_relationship, (pathway.forward, pathway.backward)):
+                        edge = (relationship["start_node"], relationship["end_node"])
+                        if allowed is True and edge not in seen_edges:
+                            seen_edges.add(edge)
+                            relationship["valid"] = True
+                            edges.append(relationship)
+                finished.append(key)
+                if len(finished) >= ADDRESSED_FLUSH_SIZE:
+                    # The paths are written before their intersections are marked as addressed
+                    insert_paths(paths, edges)
+                    edges = []
+                    self.redis_db_addressed_set(finished)
+                    finished = []
                 print("Addded" + self.time_print())
 
             else:
                 print("S", end=" ")
-                to_delete.append(str(key).encode())
-        client.close()
-        client_secondary.close()
+                to_delete.append(key)
+        insert_paths(paths, edges)
+        self.redis_db_addressed_set(finished)
+        print(self.way_cache())
+        if self.segment_memo() is not None:
+            print(self.segment_memo())
+        print(geo_connector.elevation_provider())
 
     def time_print(self):
         now = datetime.now()
         current_time = now.strftime("%H:%M:%S")
         return " [" + current_time + "] "
 
-    def find_ways_of_node(self, node_id, collection_highways, collection_nodes):
+    def prefetch_elevations(self, node_ids, collection_highways) -> dict[int, float]:
+        """
+        Fetch the elevations of all nodes of the ways through the given intersections, de-duplicated and in batches
+        of TILE_ELEVATION_BATCH_SIZE coordinates, so the pathways of a tile do not request their elevations one by
+        one. Ways whose segments are all in the segment memo are skipped, their pathways need no elevations. Pathways
+        continuing on ways outside of the tile fetch the elevations of their nodes when generated.
+        :param node_ids: Intersection IDs of the tile
+        :param collection_highways: The highways_helper collection
+        :return: Dictionary of node ID -> elevation
+        """
+        way_ids = sorted(
+            {way_id for ways in self.geo_connector.node_store().ways_of_nodes(node_ids) if ways for way_id in ways}
+        )
+        memo = self.segment_memo()
+        memoized = 0
+        coordinates = {}
+        for batch in chunks(way_ids, WAY_CACHE_SIZE // 2):
+            for way in self.way_cache().get_many(collection_highways, batch):
+                if memo is not None and self.segments_memoized(way, memo):
+                    memoized += 1
+                    continue
+                for node in way.nodes:
+                    coordinates[node.id] = (float(node.lat), float(node.lon))
+
+        elevations = {}
+        provider = self.geo_connector.elevation_provider()
+        for batch in chunks(list(coordinates), TILE_ELEVATION_BATCH_SIZE):
+            lats = [coordinates[node_id][0] for node_id in batch]
+            lons = [coordinates[node_id][1] for node_id in batch]
+            elevations.update(zip(batch, provider.elevations(lats, lons).tolist()))
+        print(
+            f"Prefetched the elevations of {len(elevations)} nodes on {len(way_ids) - memoized} ways, "
+            f"{memoized} ways memoized {self.time_print()}"
+        )
+        return elevations
+
+    def segments_memoized(self, way, memo: SegmentMemo) -> bool:
+        """
+        Check if all segments of a way, split at its intersections and ends, are in the segment memo.
+        :param way: Way with resolved nodes
+        :param memo: Segment memo
+        :return: True if no pathway along the way needs elevations
+        """
+        nodes = way.nodes
+        if len(nodes) < 2:
+            return False
+        keys = self.check_for_intersections(nodes)
+        bounds = sorted({0, len(nodes) - 1, *[i for i, key in enumerate(keys) if key is not None]})
+        return all(memo.contains(nodes[start : end + 1], way.id) for start, end in zip(bounds, bounds[1:]))
+
+    def tile_altitudes(self, nodes) -> list[float] | None:
+        """
+        Get the prefetched elevations of the nodes of a pathway.
+        :param nodes: Nodes of the pathway
+        :return: List of elevations, None if one of the nodes was not prefetched
+        """
         try:
-            result_ways = collection_nodes.find_one({"_id": node_id})
-            result = list(collection_highways.find({"_id": {"$in": result_ways["ways"]}}))
-            result = replace_id(result)
+            return [self.tile_elevations[node.id] for node in nodes]
+        except KeyError:
+            return None
 
-            result = Result(result)
+    def find_ways_of_node(self, node_id, collection_highways):
+        """
+        Get the ways of a node with their resolved nodes. The way IDs of the node come from the memory-mapped node
+        store, the ways themselves from the way cache of the process, which reads its misses from highways_helper.
+        :param node_id: Node ID
+        :param collection_highways: The highways_helper collection
+        :return: Result
+        """
+        way_ids = self.geo_connector.node_store().ways_of(node_id)
+        try:
+            result = Result(self.way_cache().get_many(collection_highways, way_ids))
         except Exception as e:
             print(e)
             print("Error on find_ways_of_node")
             print(node_id)
-            print(result_ways["ways"])
+            print(way_ids)
             raise e
         return result
 
@@ -197,51 +327,89 @@ class ConnectionMongoParser:
             i -= 1
         return -1
 
+    def build_intersection_index(self) -> IntersectionIndex:
+        """
+        Build the intersection ID index from the intersections collection and use it in the current process.
+        :return: IntersectionIndex
+        """
+        global shared_intersection_index
+        shared_intersection_index = IntersectionIndex.build(
+            self.geo_connector.mongo_db().get_database("geo_data").get_collection("intersections"),
+            INTERSECTION_INDEX_FILE,
+        )
+        return shared_intersection_index
+
+    def intersection_index(self) -> IntersectionIndex:
+        """
+        Get the intersection ID index, memory-mapping the index file on first use in the current process.
+        :return: IntersectionIndex
+        """
+        global shared_intersection_index
+        if shared_intersection_index is None:
+            if os.path.exists(INTERSECTION_INDEX_FILE):
+                shared_intersection_index = IntersectionIndex.load(INTERSECTION_INDEX_FILE)
+            else:
+                shared_intersection_index = IntersectionIndex.build(
+                    self.geo_connector.mongo_db().get_database("geo_data").get_collection("intersections"),
+                    INTERSECTION_INDEX_FILE,
+                )
+        return shared_intersection_index
+
+    @staticmethod
+    def way_cache() -> WayCache:
+        """
+        Get the way cache of the current process.
+        :return: WayCache
+        """
+        global shared_way_cache
+        if shared_way_cache is None:
+            shared_way_cache = WayCache(lambda document: W(replace_id(document)), size=WAY_CACHE_SIZE)
+        return shared_way_cache
+
+    @staticmethod
+    def segment_memo() -> SegmentMemo | None:
+        """
+        Get the segment memo selected with SEGMENT_MEMO, created once per process.
+        :return: SegmentMemo, None if SEGMENT_MEMO is None
+        """
+        if SEGMENT_MEMO is None:
+            return None
+
+        def create():
+            store = RedisSegmentStore(GeoConnector.redis_db(SEGMENT_MEMO_REDIS_DB)) if SEGMENT_MEMO == "redis" else None
+            return SegmentMemo(store=store, size=SEGMENT_MEMO_SIZE)
+
+        return GeoConnector.shared_client("segment_memo", create)
+
     def mongo_node_count(self, node_ids):
+        return self.intersection_index().count(node_ids)
+
+    def redis_db_addressed_get(self, keys):
         while True:
             try:
-                if "all_nodes" not in globals():
-                    global all_nodes
-                    all_nodes = (
-                        self.geo_connector.mongo_db()
-                        .get_database("geo_data")
-                        .get_collection("intersections")
-                        .distinct("_id")
-                    )
+                return AddressedNodes(self.geo_connector.redis_db()).addressed(keys)
             except Exception as e:
                 print(e)
-                print("Error on (node_count")
-                print(*node_ids)
+                print("redis_db_addressed.addressed(keys)")
                 time.sleep(1)
-            else:
-                break
-        return sum(x in node_ids for x in all_nodes)
 
-    def redis_db_addressed_set(self, key):
+    def redis_db_addressed_set(self, keys):
+        if not keys:
+            return
         while True:
             try:
-                self.geo_connector.redis_db().set(key, 1)
+                AddressedNodes(self.geo_connector.redis_db()).add(keys)
             except Exception as e:
                 print(e)
-                print("redis_db_addressed.set(key, len(pathways))")
-                print(key)
+                print("redis_db_addressed.add(keys)")
+                print(keys)
                 time.sleep(1)
             else:
                 break
 
     def check_for_intersections(self, nodes):
-        if "all_nodes" not in globals():
-            global all_nodes
-            all_nodes = (
-                self.geo_connector.mongo_db().get_database("geo_data").get_collection("intersections").distinct("_id")
-            )
-        intersections = []
-        for node in nodes:
-            if node.id in all_nodes:
-                intersections.append(True)
-            else:
-                intersections.append(None)
-        return intersections
+        is_intersection = self.intersection_index().contains([node.id for node in nodes])
+        return [True if found else None for found in is_intersection]
 
     def find_connections(
         self,
@@ -251,7 +419,6 @@ class ConnectionMongoParser:
         api: overpy.Overpass,
         depth=0,
         collection_highways=None,
-        collection_nodes=None,
     ):
         way: overpy.Way
         pathways = []
@@ -273,24 +440,7 @@ class ConnectionMongoParser:
                     node_ids = list(map(lambda node: node.id, nodes))
 
                     if len(node_ids) > 1 and depth < 4:  # If any other node except for intersection is found
-                        # print("Get mget keys")
-                        while True:
-                            try:
-                                if "all_nodes" not in globals():
-                                    global all_nodes
-                                    all_nodes = (
-                                        self.geo_connector.mongo_db()
-                                        .get_database("geo_data")
-                                        .get_collection("intersections")
-                                        .distinct("_id")
-                                    )
-                                keys = self.check_for_intersections(nodes)
-                            except Exception as e:
-                                print(e)
-                                print("keys = redis_db.mget(list(map(lambda node: node.id, nodes)))")
-                                time.sleep(1)
-                            else:
-                                break
+                        keys = self.check_for_intersections(nodes)
                         starting_node_index = node_ids.index(starting_id)
                         intersection_after = self.find_forward_intersections(
                             starting_node_index, node_ids, keys, starting_id
@@ -303,9 +453,7 @@ class ConnectionMongoParser:
                             )
                             if intersection_before == -1:  # Not found before ?----x
                                 i_before_nodes.extend(nodes[: starting_node_index + 1])
-                                sub_query_ways = self.find_ways_of_node(
-                                    node_ids[0], collection_highways, collection_nodes
-                                )
+                                sub_query_ways = self.find_ways_of_node(node_ids[0], collection_highways)
                                 if len(sub_query_ways.way_ids) > 1:
                                     result = self.find_connections(
                                         query_way_result=sub_query_ways,
@@ -314,7 +462,6 @@ class ConnectionMongoParser:
                                         api=api,
                                         depth=depth + 1,
                                         collection_highways=collection_highways,
-                                        collection_nodes=collection_nodes,
                                     )
                                     if result != None:
                                         # check if way.tags["surface"] exists if it does not set surface to Unknown
@@ -329,6 +476,8 @@ class ConnectionMongoParser:
                                             path_type=way.tags["highway"],
                                             surface_type=surface_type,
                                             way=way,
+                                            memo=self.segment_memo(),
+                                            altitudes=self.tile_altitudes(i_before_nodes),
                                         )
                                         if len(result) == 1:
                                             pathway = pathway + result[0]
@@ -342,7 +491,12 @@ class ConnectionMongoParser:
                                     surface_type = "Unknown"
                                 pathway = Pathway()
                                 pathway.generate(
-                                    i_before_nodes, path_type=way.tags["highway"], surface_type=surface_type, way=way
+                                    i_before_nodes,
+                                    path_type=way.tags["highway"],
+                                    surface_type=surface_type,
+                                    way=way,
+                                    memo=self.segment_memo(),
+                                    altitudes=self.tile_altitudes(i_before_nodes),
                                 )
                                 pathways.append(pathway)
                                 # OK
@@ -352,7 +506,7 @@ class ConnectionMongoParser:
                                     nodes[starting_node_index:]
                                 )  # i_after_nodes.extend(nodes[starting_node_index - 1 :])
                                 sub_query_ways = self.find_ways_of_node(
-                                    node_ids[len(node_ids) - 1], collection_highways, collection_nodes
+                                    node_ids[len(node_ids) - 1], collection_highways
                                 )
                                 if len(sub_query_ways.way_ids) > 1:
                                     result = self.find_connections(
@@ -362,7 +516,6 @@ class ConnectionMongoParser:
                                         api=api,
                                         depth=depth + 1,
                                         collection_highways=collection_highways,
-                                        collection_nodes=collection_nodes,
                                     )
                                     if result != None:
                                         if "surface" in way.tags:
@@ -376,6 +529,8 @@ class ConnectionMongoParser:
                                             path_type=way.tags["highway"],
                                             surface_type=surface_type,
                                             way=way,
+                                            memo=self.segment_memo(),
+                                            altitudes=self.tile_altitudes(i_after_nodes),
                                         )
                                         if len(result) == 1:
                                             pathway = pathway + result[0]
@@ -390,7 +545,12 @@ class ConnectionMongoParser:
 
                                 pathway = Pathway()
                                 pathway.generate(
-                                    i_after_nodes, path_type=way.tags["highway"], surface_type=surface_type, way=way
+                                    i_after_nodes,
+                                    path_type=way.tags["highway"],
+                                    surface_type=surface_type,
+                                    way=way,
+                                    memo=self.segment_memo(),
+                                    altitudes=self.tile_altitudes(i_after_nodes),
                                 )
                                 pathways.append(pathway)
                                 # OK
@@ -399,25 +559,41 @@ class ConnectionMongoParser:
         return pathways
 
     def intersection_exists(self, id: int | list[int]):
-        if "all_nodes" not in globals():
-            global all_nodes
-            all_nodes = (
-                self.geo_connector.mongo_db().get_database("geo_data").get_collection("intersections").distinct("_id")
-            )
         if isinstance(id, int):
-            return id in all_nodes
+            return id in self.intersection_index()
         elif isinstance(id, list):
-            return all(x in all_nodes for x in id)
-
-    def exists(self, node_a, node_b, paths: pymongo.collection) -> bool:
-        """
-        Check if a connection between two intersections already exists in the database.
-        :param paths: MongoDB collection3
-        :param node_a: Intersection A
-        :param node_b: Intersection B
-        :return: True if the connection exists, False otherwise
-        """
-        return paths.count_documents({"start_node": node_a.id, "end_node": node_b.id}) > 0
+            return bool(self.intersection_index().contains(id).all())
+
+
+def create_path_indexes(paths: Collection) -> None:
+    """
+    Create the indexes of the paths collection. Paths are unique per (start_node, end_node), the non-unique index of
+    earlier versions is replaced and duplicates written by earlier runs are removed first.
+    :param paths: The paths collection
+    """
+    index = paths.index_information().get("start_node_1_end_node_1")
+    if index is not None and not index.get("unique", False):
+        paths.drop_index("start_node_1_end_node_1")
+        DuplicatePathRemover(GeoConnector()).remove_duplicates()
+    paths.create_index([("start_node", ASCENDING), ("end_node", ASCENDING)], unique=True)
+    paths.create_index("way_ids")  # Paths of a changed way, see IncrementalUpdater
+
+
+def insert_paths(paths: Collection, documents: list[dict]) -> int:
+    """
+    Insert paths with one unordered bulk insert. Paths whose (start_node, end_node) already exists are skipped.
+    :param paths: The paths collection
+    :param documents: Path documents
+    :return: Number of inserted paths
+    """
+    if not documents:
+        return 0
+    try:
+        return len(paths.insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nInserted", 0)
 
 
 def replace_id(d):
@@ -436,7 +612,7 @@ def replace_id(d):
 class N:
     def __init__(self, data):
         self.id = data["id"]
-        self.ways = data["ways"]
+        self.ways = data.get("ways")  # Not read by default, see WAY_PROJECTION
         self.lat = data["lat"]
         self.lon = data["lon"]
         self.tags = data["tags"]
@@ -450,6 +626,6 @@ class W:
 
 
 class Result:
-    def __init__(self, data):
-        self.ways = [W(way) for way in data]
+    def __init__(self, ways: list[W]):
+        self.ways = ways
         self.way_ids = [way.id for way in self.ways]
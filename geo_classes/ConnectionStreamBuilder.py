@@ -0,0 +1,149 @@
+"""3. Identify pathways between intersections in a single pass over highways_helper"""
+from collections import defaultdict
+
+from pymongo.collection import Collection
+
+from geo_classes.ConnectionMongoParser import W, create_path_indexes, insert_paths, replace_id
+from geo_classes.IntersectionIndex import IntersectionIndex
+from geo_classes.WayCache import WAY_PROJECTION
+from graph.Pathway import Pathway
+from setup.Constants import INTERSECTION_INDEX_FILE
+from setup.GeoConnector import GeoConnector
+
+
+class ConnectionStreamBuilder:
+    def __init__(self, geo_connector: GeoConnector, batch_size: int = 1000, max_chain_ways: int | None = 4):
+        """
+        Alternative to ConnectionMongoParser, which generates the paths collection by reading every way of
+        highways_helper exactly once. Each way is split at intersection nodes, pieces that end in a node joining
+        exactly two ways are stitched into chains, and both directions of every pathway are inserted in bulk.
+        :param geo_connector: A GeoConnector object for connecting to MongoDB.
+        :param batch_size: Number of path documents per insert_many call
+        :param max_chain_ways: Maximum number of ways stitched into one pathway (4 matches the recursion depth of
+        ConnectionMongoParser.find_connections), None for no limit
+        """
+        self.geo_connector = geo_connector
+        self.batch_size = batch_size
+        self.max_chain_ways = max_chain_ways
+
+        self.intersection_index: IntersectionIndex | None = None
+        self.pieces = {}  # piece id -> (node list, way), for pieces with at least one non-intersection end
+        self.joins = defaultdict(list)  # non-intersection node id -> ids of the pieces ending in it
+        self.emitted = set()  # (start_node, end_node) pairs already written
+        self.buffer = []
+        self.paths: Collection | None = None
+        self.inserted = 0
+
+    async def parse_to_graph(self):
+        client = self.geo_connector.mongo_db()
+        db = client.geo_data
+        self.paths = db.paths
+        create_path_indexes(self.paths)
+
+        print("Building intersection index...")
+        self.intersection_index = IntersectionIndex.build(db.intersections, INTERSECTION_INDEX_FILE)
+        print(f"Intersection index: {len(self.intersection_index)} intersections")
+
+        highways: Collection = db.highways_helper
+        total = highways.estimated_document_count()
+        print(f"Splitting {total} ways at intersections...")
+        for i, doc in enumerate(highways.find({}, WAY_PROJECTION, batch_size=self.batch_size)):
+            self.split_way(W(replace_id(doc)))
+            if i % 10000 == 0:
+                print(f"Processed {i}/{total} ways, inserted {self.inserted} paths", end="\r")
+
+        print(f"\nStitching {len(self.pieces)} way pieces across non-intersection joins...")
+        self.stitch_pieces()
+        self.flush()
+        print(f"Inserted {self.inserted} paths.")
+
+    def split_way(self, way: W):
+        """
+        Split a way at intersection nodes. Pieces between two intersections are emitted right away, the remaining
+        pieces are kept for stitching.
+        :param way: Way with resolved nodes
+        """
+        if "highway" not in way.tags or len(way.nodes) < 2:
+            return
+
+        is_intersection = self.intersection_index.contains([node.id for node in way.nodes])
+        split_points = sorted({0, len(way.nodes) - 1, *is_intersection.nonzero()[0].tolist()})
+
+        for start, end in zip(split_points, split_points[1:]):
+            nodes = way.nodes[start : end + 1]
+            if nodes[0].id == nodes[-1].id:
+                continue
+            if is_intersection[start] and is_intersection[end]:
+                self.emit([(nodes, way)])
+            else:
+                piece_id = len(self.pieces)
+                self.pieces[piece_id] = (nodes, way)
+                if not is_intersection[start]:
+                    self.joins[nodes[0].id].append(piece_id)
+                if not is_intersection[end]:
+                    self.joins[nodes[-1].id].append(piece_id)
+
+    def stitch_pieces(self):
+        """Walk from every piece with an intersection end through the joins until the next intersection."""
+        visited = set()
+        for piece_id, (nodes, way) in self.pieces.items():
+            if piece_id in visited:
+                continue
+            if nodes[0].id in self.joins and nodes[-1].id in self.joins:
+                continue  # Middle piece, reached from one of the chain ends
+            chain = self.walk_chain(piece_id)
+            if chain is None:
+                visited.add(piece_id)
+                continue
+            visited.update(chain)
+            self.emit([self.pieces[chain_piece_id] for chain_piece_id in chain])
+
+    def walk_chain(self, piece_id):
+        """
+        Follow a chain of pieces starting at the intersection end of the given piece.
+        :param piece_id: Piece with exactly one intersection end
+        :return: List of piece IDs ordered along the chain, None if the chain is a dead end
+        """
+        nodes, _ = self.pieces[piece_id]
+        node_id = nodes[-1].id if nodes[-1].id in self.joins else nodes[0].id
+        chain = [piece_id]
+        while node_id in self.joins:
+            piece_ids = self.joins[node_id]
+            if len(piece_ids) != 2 or piece_ids[0] == piece_ids[1]:
+                return None  # Dead end or branching at a node that is not an intersection
+            if self.max_chain_ways is not None and len(chain) >= self.max_chain_ways:
+                return None
+            next_piece_id = piece_ids[1] if piece_ids[0] == chain[-1] else piece_ids[0]
+            next_nodes, _ = self.pieces[next_piece_id]
+            node_id = next_nodes[-1].id if next_nodes[0].id == node_id else next_nodes[0].id
+            chain.append(next_piece_id)
+        return chain
+
+    def emit(self, pieces):
+        """
+        Generate the pathway of a chain of pieces and buffer both of its directions.
+        :param pieces: List of (node list, way) tuples, ordered along the pathway
+        """
+        pathway = None
+        for nodes, way in pieces:
+            piece_pathway = Pathway()
+            piece_pathway.generate(
+                nodes, path_type=way.tags["highway"], surface_type=way.tags.get("surface", "Unknown"), way=way
+            )
+            pathway = piece_pathway if pathway is None else pathway + piece_pathway
+
+        two_way_relationship = pathway.give_two_way_relationship()
+        for relationship, allowed in zip(two_way_relationship, (pathway.forward, pathway.backward)):
+            key = (relationship["start_node"], relationship["end_node"])
+            if allowed is True and key not in self.emitted:
+                self.emitted.add(key)
+                relationship["valid"] = True
+                self.buffer.append(relationship)
+
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.inserted += insert_paths(self.paths, self.buffer)
+            self.buffer = []
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from pymongo.collection import Collection
+
+# Stages of an incremental update, in the order they run
+STAGES = ["applied", "paths", "merged", "split", "exported"]
+
+
+class DirtyRegionTracker:
+    def __init__(self, collection: Collection):
+        """
+        Progress of the incremental updates: one document per change file with the region it affects (the changed
+        ways, the ways whose paths are regenerated and the intersections whose paths, splits and Neo4j nodes are
+        replaced) and the last finished stage. Together with the way_ids of the paths it links the changed ways to
+        the edges derived from them, so an interrupted update continues with the stage it stopped at.
+        :param collection: Collection storing the regions, e.g. geo_data.dirty_regions
+        """
+        self.collection = collection
+
+    def start(self, name: str, region: dict) -> dict:
+        """
+        Record the region of an applied change file.
+        :param name: Name of the change file
+        :param region: Region fields (ways, rebuilt_ways, intersections, ...)
+        :return: The region document
+        """
+        document = {"_id": name, "stage": STAGES[0], "updated": datetime.now(), **region}
+        self.collection.replace_one({"_id": name}, document, upsert=True)
+        return document
+
+    def get(self, name: str) -> dict | None:
+        return self.collection.find_one({"_id": name})
+
+    def finish(self, region: dict, stage: str, **fields) -> None:
+        """
+        Mark a stage of a region finished.
+        :param region: The region document, updated in place
+        :param stage: Finished stage
+        :param fields: Region fields changed by the stage
+        """
+        region.update(stage=stage, updated=datetime.now(), **fields)
+        self.collection.update_one(
+            {"_id": region["_id"]}, {"$set": {"stage": stage, "updated": region["updated"], **fields}}
+        )
+
+    @staticmethod
+    def done(region: dict, stage: str) -> bool:
+        return STAGES.index(region["stage"]) >= STAGES.index(stage)
+
+    def pending(self) -> list[dict]:
+        """Regions with unfinished stages, oldest first."""
+        return list(self.collection.find({"stage": {"$ne": STAGES[-1]}}).sort("updated", 1))
@@ -45,3 +45,26 @@ class DuplicatePathRemover:
         print(f"Number of paths with duplicates: {len(paths_with_duplicates)}")
         timer.stop()
         print(f"Duplicate path time taken (2/2) : {timer}")
+
+    def remove_duplicates(self) -> int:
+        """
+        Keep the shortest path per (start_node, end_node), e.g. before the unique index is created on paths written by
+        earlier runs.
+        :return: Number of removed paths
+        """
+        mongo: MongoClient = self.geo_connector.mongo_db()
+        mongo_paths = mongo["geo_data"]["paths"]
+
+        duplicates = mongo_paths.aggregate(
+            [
+                {"$sort": {"distance": 1}},  # The first ID of each group is the shortest path
+                {"$group": {"_id": {"start": "$start_node", "end": "$end_node"}, "ids": {"$push": "$_id"}}},
+                {"$match": {"ids.1": {"$exists": True}}},
+            ],
+            allowDiskUse=True,
+        )
+        removed = 0
+        for duplicate in duplicates:
+            removed += mongo_paths.delete_many({"_id": {"$in": duplicate["ids"][1:]}}).deleted_count
+        print(f"Removed {removed} duplicate paths")
+        return removed
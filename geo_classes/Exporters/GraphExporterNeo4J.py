@@ -4,6 +4,7 @@ import os
 from py2neo import Graph
 from pymongo import MongoClient
 from setup import GeoConnector
+from setup.CollectionPartitioner import CollectionPartitioner
 from setup.Constants import MULTI
 
 
@@ -26,28 +27,27 @@ class GraphExporterNeo4J:
             except Exception as e:
                 print(e)
 
-    def export_to_neo4j(self):
+    def export_to_neo4j(self, query_nodes=None, query_paths=None):
+        """
+        Export the nodes and paths collections into Neo4j.
+        :param query_nodes: Filter of the exported nodes, None for all of them
+        :param query_paths: Filter of the exported paths, None for all of them
+        """
         if MULTI:
-            self.export_to_neo4j_multi()
+            self.export_to_neo4j_multi(query_nodes, query_paths)
         else:
-            self.export_to_neo4j_single()
+            self.export_to_neo4j_single(query_nodes, query_paths)
+
+    def export_to_neo4j_multi(self, query_nodes=None, query_paths=None):
+        database = self.geo_connector.mongo_db().get_database("geo_data")
 
-    def export_to_neo4j_multi(self):
         # Generate intersection files in parallel
-        count_intersections = (
-            self.geo_connector.mongo_db()
-            .get_database("geo_data")
-            .get_collection(self.collection_nodes)
-            .count_documents({})
+        partitioner = CollectionPartitioner(
+            database.get_collection(self.collection_nodes), query=query_nodes, batch_size=self.limit
         )
-        skip = 0
-        limit = self.limit
-        process_id = 0
         pool = multiprocessing.Pool(processes=multiprocessing.cpu_count())
-        while skip < count_intersections:
-            pool.apply_async(self.process_intersections, args=(skip, limit, process_id))
-            skip += limit
-            process_id += 1
+        for process_id, query in enumerate(partitioner.partitions()):
+            pool.apply_async(self.process_intersections, args=(query, process_id))
         pool.close()
         pool.join()
 
@@ -55,68 +55,45 @@ class GraphExporterNeo4J:
         self.process_files_sequentially("Intersection", "id")
 
         # Generate path files in parallel
-        count_paths = (
-            self.geo_connector.mongo_db()
-            .get_database("geo_data")
-            .get_collection(self.collection_paths)
-            .count_documents({})
+        partitioner = CollectionPartitioner(
+            database.get_collection(self.collection_paths), query=query_paths, batch_size=self.limit
         )
-        skip = 0
-        process_id = 0
         pool = multiprocessing.Pool(processes=multiprocessing.cpu_count() - 1)
-        while skip < count_paths:
-            pool.apply_async(self.process_paths, args=(skip, limit, process_id))
-            skip += limit
-            process_id += 1
+        for process_id, query in enumerate(partitioner.partitions()):
+            pool.apply_async(self.process_paths, args=(query, process_id))
         pool.close()
         pool.join()
 
         # Process path files sequentially
         self.process_files_sequentially("PATH_TO", "start_node", "end_node")
 
-    def export_to_neo4j_single(self):
+    def export_to_neo4j_single(self, query_nodes=None, query_paths=None):
+        database = self.geo_connector.mongo_db().get_database("geo_data")
+
         # Process intersections
-        count = (
-            self.geo_connector.mongo_db()
-            .get_database("geo_data")
-            .get_collection(self.collection_nodes)
-            .count_documents({})
+        partitioner = CollectionPartitioner(
+            database.get_collection(self.collection_nodes), query=query_nodes, batch_size=self.limit
         )
-        skip = 0
-        limit = self.limit
-        process_id = 0
-        while skip < count:
-            self.process_intersections(skip=skip, limit=limit, process_id=process_id)
-            skip += limit
-            process_id += 1
+        for process_id, query in enumerate(partitioner.partitions()):
+            self.process_intersections(query=query, process_id=process_id)
 
         self.process_files_sequentially("Intersection", "id")
 
         # Process paths
-        count = (
-            self.geo_connector.mongo_db()
-            .get_database("geo_data")
-            .get_collection(self.collection_paths)
-            .count_documents({})
+        partitioner = CollectionPartitioner(
+            database.get_collection(self.collection_paths), query=query_paths, batch_size=self.limit
         )
-        skip = 0
-        process_id = 0
-        while skip < count:
-            self.process_paths(skip=skip, limit=limit, process_id=process_id)
-            skip += limit
-            process_id += 1
+        for process_id, query in enumerate(partitioner.partitions()):
+            self.process_paths(query=query, process_id=process_id)
 
         self.process_files_sequentially("PATH_TO", "start_node", "end_node")
 
-    def process_intersections(self, skip=None, limit=None, process_id=None):
+    def process_intersections(self, query=None, process_id=None):
         mongo: MongoClient = self.geo_connector.mongo_db()
         database = mongo.get_database("geo_data")
         collection_intersections = database.get_collection(self.collection_nodes)
 
-        if skip is not None and limit is not None:
-            intersections = collection_intersections.find().skip(skip).limit(limit)
-        else:
-            intersections = collection_intersections.find()
+        intersections = collection_intersections.find(query or {})
 
         temp_file = os.path.join(self.temp_dir, f"intersections_{process_id}.json")
 
@@ -140,17 +117,12 @@ class GraphExporterNeo4J:
             if batch:
                 json.dump(batch, f)
 
-        mongo.close()
-
-    def process_paths(self, skip=None, limit=None, process_id=None):
+    def process_paths(self, query=None, process_id=None):
         mongo: MongoClient = self.geo_connector.mongo_db()
         database = mongo.get_database("geo_data")
         collection_paths = database.get_collection(self.collection_paths)
 
-        if skip is not None and limit is not None:
-            paths = collection_paths.find({}, {"nodes": 0}).skip(skip).limit(limit)
-        else:
-            paths = collection_paths.find({}, {"node": 0})
+        paths = collection_paths.find(query or {}, {"nodes": 0})
 
         temp_file = os.path.join(self.temp_dir, f"paths_{process_id}.json")
 
@@ -187,8 +159,6 @@ class GraphExporterNeo4J:
             if batch:
                 json.dump(batch, f)
 
-        mongo.close()
-
     def process_files_sequentially(self, label, id_key, end_id_key=None):
         neo4j = self.geo_connector.neo4j_db()
         neo4j.run("CREATE INDEX intersections_id IF NOT EXISTS FOR (i:Intersection) ON (i.id)")
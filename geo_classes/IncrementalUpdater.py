@@ -0,0 +1,384 @@
+import asyncio
+import os
+from collections import defaultdict
+
+import osmium
+from pymongo import DeleteOne, ReplaceOne, UpdateMany, UpdateOne
+
+from geo_classes.AddressedNodes import AddressedNodes
+from geo_classes.ConnectionMerger import ConnectionMerger
+from geo_classes.ConnectionMongoParser import ConnectionMongoParser
+from geo_classes.DirtyRegionTracker import DirtyRegionTracker
+from geo_classes.Exporters.GraphExporterNeo4J import GraphExporterNeo4J
+from geo_classes.IntersectionExtractor import IntersectionExtractor
+from geo_classes.IntersectionSplitter import IntersectionSplitter
+from geo_classes.ProcessedIntersectionMongoParser import ProcessedIntersectionMongoParser
+from geo_classes.StreamingOSMLoader import RELEVANT_TAGS
+from setup.Batching import chunks
+from setup.GeoConnector import GeoConnector
+from setup.MapBoundaries import MapBoundaries
+
+
+class IncrementalUpdater:
+    def __init__(self, geo_connector: GeoConnector, map_boundaries: MapBoundaries | None = None):
+        """
+        Applies OSM change files (.osc) to an existing build instead of running stages 0-7 again. A change file is
+        processed in the stages of DirtyRegionTracker, each only touching the affected region:
+
+        - applied: the changes are written to nodes_helper and highways_helper, the intersection status of the nodes
+          on the changed ways is computed again (see IntersectionExtractor) and the paths derived from the changed
+          ways (found by their way_ids) are removed, together with the paths merged with them.
+        - paths: new intersections get their elevation (stage 3) and the paths of the region are generated again
+          (stage 4).
+        - merged: the paths around the intersections of the region are merged (stage 5).
+        - split: the intersections of the region are split again and their paths rerouted (stage 6).
+        - exported: the Neo4j nodes of the region are replaced (stage 7).
+
+        Paths generated before the paths carried way_ids are not found, run stage 4 again once before the first
+        update.
+        :param geo_connector: A GeoConnector object for connecting to MongoDB, Redis and Neo4j.
+        :param map_boundaries: New highways are only added when one of their nodes lies inside of the boundaries
+        """
+        self.geo_connector = geo_connector
+        self.map_boundaries = map_boundaries or MapBoundaries()
+        self.intersection_extractor = IntersectionExtractor()
+        self.database = geo_connector.mongo_db().get_database("geo_data")
+        self.tracker = DirtyRegionTracker(self.database.dirty_regions)
+
+    def update(self, change_file: str) -> dict:
+        """
+        Apply a change file, continuing with the first unfinished stage if it was applied before.
+        :param change_file: Location of the .osc (or .osc.gz) file
+        :return: The region document
+        """
+        name = os.path.basename(change_file)
+        region = self.tracker.get(name)
+        if region is None:
+            region = self.tracker.start(name, self.apply_changes(change_file))
+        self.finish_region(region)
+        return region
+
+    def finish_region(self, region: dict) -> None:
+        """Run the unfinished stages of an applied region."""
+        print(
+            f"Region {region['_id']}: {len(region['ways'])} changed ways, {len(region['rebuilt_ways'])} rebuilt ways, "
+            f"{len(region['intersections'])} intersections, stage {region['stage']}"
+        )
+        if not self.tracker.done(region, "paths"):
+            self.tracker.finish(region, "paths", intersections=self.regenerate_paths(region))
+        if not self.tracker.done(region, "merged"):
+            merger = ConnectionMerger(self.geo_connector)
+            self.tracker.finish(region, "merged", intersections=sorted(merger.merge_region(region["intersections"])))
+        if not self.tracker.done(region, "split"):
+            self.split_region(region)
+            self.tracker.finish(region, "split")
+        if not self.tracker.done(region, "exported"):
+            self.export_region(region)
+            self.tracker.finish(region, "exported")
+
+    @staticmethod
+    def read_changes(change_file: str) -> tuple[dict, dict]:
+        """
+        Read the final version of every node and way of a change file.
+        :param change_file: Location of the change file
+        :return: Nodes (id -> dict with lat, lon and tags) and highway ways (id -> dict with tags and refs), None for
+        deleted objects and ways which are no longer highways
+        """
+        nodes = {}
+        ways = {}
+        for obj in osmium.FileProcessor(change_file, osmium.osm.NODE | osmium.osm.WAY):
+            if obj.is_node():
+                if obj.deleted or not obj.location.valid():
+                    nodes[obj.id] = None
+                else:
+                    nodes[obj.id] = {"lat": obj.location.lat, "lon": obj.location.lon, "tags": dict(obj.tags)}
+            elif obj.deleted or "highway" not in obj.tags:
+                ways[obj.id] = None
+            else:
+                ways[obj.id] = {"tags": dict(obj.tags), "refs": [node.ref for node in obj.nodes]}
+        return nodes, ways
+
+    def apply_changes(self, change_file: str) -> dict:
+        """
+        Stage "applied": update the helper collections and the intersections, remove the affected paths.
+        :param change_file: Location of the change file
+        :return: Region fields for DirtyRegionTracker.start
+        """
+        nodes_helper = self.database.nodes_helper
+        highways_helper = self.database.highways_helper
+        print(f"Reading {change_file}...")
+        changed_nodes, changed_ways = self.read_changes(change_file)
+
+        old_ways = {
+            doc["_id"]: [node["_id"] for node in doc["nodes"] if "_id" in node]
+            for doc in highways_helper.find({"_id": {"$in": list(changed_ways)}}, {"nodes._id": 1})
+        }
+        locations = {
+            doc["_id"]: doc
+            for doc in nodes_helper.find(
+                {"_id": {"$in": list({ref for way in changed_ways.values() if way for ref in way["refs"]})}},
+                {"lat": 1, "lon": 1},
+            )
+        }
+        new_ways = {}
+        for way_id, way in changed_ways.items():
+            if way is not None and (way_id in old_ways or self.in_boundaries(way["refs"], changed_nodes, locations)):
+                new_ways[way_id] = way
+        ways = set(old_ways) | set(new_ways)
+        print(f"Changes: {len(changed_nodes)} nodes, {len(changed_ways)} ways, {len(ways)} of them highways")
+
+        # nodes_helper: locations and tags, then the way memberships
+        referenced = {ref for way in new_ways.values() for ref in way["refs"]}
+        known_nodes = {doc["_id"] for doc in nodes_helper.find({"_id": {"$in": list(changed_nodes)}}, {"_id": 1})}
+        moved_nodes = set()
+        operations = []
+        for node_id, node in changed_nodes.items():
+            if node is None and node_id in known_nodes:
+                operations.append(DeleteOne({"_id": node_id}))
+            elif node is not None and (node_id in known_nodes or node_id in referenced):
+                operations.append(
+                    UpdateOne({"_id": node_id}, {"$set": node, "$setOnInsert": {"ways": []}}, upsert=True)
+                )
+                moved_nodes.add(node_id)
+        removed_ways = defaultdict(set)
+        added_ways = defaultdict(set)
+        for way_id in ways:
+            old_refs = set(old_ways.get(way_id, []))
+            new_refs = set(new_ways[way_id]["refs"]) if way_id in new_ways else set()
+            for node_id in old_refs - new_refs:
+                removed_ways[node_id].add(way_id)
+            for node_id in new_refs - old_refs:
+                added_ways[node_id].add(way_id)
+        for node_id, way_ids in removed_ways.items():
+            operations.append(UpdateOne({"_id": node_id}, {"$pull": {"ways": {"$in": list(way_ids)}}}))
+        for node_id, way_ids in added_ways.items():
+            operations.append(
+                UpdateOne({"_id": node_id}, {"$addToSet": {"ways": {"$each": list(way_ids)}}}, upsert=True)
+            )
+        if operations:
+            nodes_helper.bulk_write(operations, ordered=True)
+
+        # highways_helper: the changed ways and the embedded copies of the changed nodes in the other ways
+        touched_nodes = moved_nodes | set(removed_ways) | set(added_ways)
+        documents = nodes_helper.find({"_id": {"$in": list(referenced | touched_nodes)}})
+        node_documents = {doc["_id"]: doc for doc in documents}
+        operations = [DeleteOne({"_id": way_id}) for way_id in ways if way_id not in new_ways]
+        for way_id, way in new_ways.items():
+            nodes = [self.embedded_node(node_documents.get(ref)) for ref in way["refs"]]
+            tags = {k: v for k, v in way["tags"].items() if k in RELEVANT_TAGS}
+            operations.append(ReplaceOne({"_id": way_id}, {"_id": way_id, "tags": tags, "nodes": nodes}, upsert=True))
+        node_ways = {}  # Ways of the nodes, after the changes
+        for node_id in touched_nodes:
+            document = node_documents.get(node_id)
+            if document is None:
+                continue
+            node_ways[node_id] = document.get("ways", [])
+            other_ways = [way_id for way_id in node_ways[node_id] if way_id not in new_ways]
+            if other_ways:
+                operations.append(
+                    UpdateMany(
+                        {"_id": {"$in": other_ways}},
+                        {"$set": {"nodes.$[node]": self.embedded_node(document)}},
+                        array_filters=[{"node._id": node_id}],
+                    )
+                )
+        if operations:
+            highways_helper.bulk_write(operations, ordered=False)
+
+        # Ways with moved nodes change their geometry, their paths are generated again as well
+        changed = ways | {way_id for node_id in moved_nodes for way_id in node_ways.get(node_id, [])}
+        nodes = {ref for way_id in ways for ref in old_ways.get(way_id, [])} | referenced | moved_nodes
+        status_changed, intersections, bounds = self.update_intersections(nodes)
+
+        status_ways = {
+            way_id
+            for doc in nodes_helper.find({"_id": {"$in": list(status_changed)}}, {"ways": 1})
+            for way_id in doc.get("ways", [])
+        }
+        rebuilt_ways, removed_paths = self.remove_paths(changed | status_ways)
+        region_intersections = (
+            intersections
+            | status_changed
+            | {path["start_node"] for path in removed_paths}
+            | {path["end_node"] for path in removed_paths}
+        )
+
+        # Force stage 4 to process the region again
+        AddressedNodes(self.geo_connector.redis_db()).remove(list(region_intersections))
+        segment_memo = ConnectionMongoParser.segment_memo()
+        if segment_memo is not None:
+            segment_memo.forget(changed)  # Only frees them, moved nodes fail the checksum anyway
+
+        print("Rebuilding the intersection index and the node store...")
+        ConnectionMongoParser(self.geo_connector).build_intersection_index()
+        ConnectionMongoParser.way_cache().clear()
+        self.geo_connector.node_store(rebuild=True)
+
+        return {
+            "ways": sorted(changed),
+            "rebuilt_ways": sorted(rebuilt_ways),
+            "intersections": sorted(region_intersections),
+            "removed_paths": len(removed_paths),
+            "bounds": bounds,
+        }
+
+    def in_boundaries(self, refs: list[int], changed_nodes: dict, locations: dict) -> bool:
+        lats, lons = [], []
+        for ref in refs:
+            node = changed_nodes.get(ref) or locations.get(ref)
+            if node is not None and "lat" in node:
+                lats.append(node["lat"])
+                lons.append(node["lon"])
+        return bool(self.map_boundaries.contains(lats, lons).any())
+
+    @staticmethod
+    def embedded_node(document: dict | None) -> dict:
+        """Node of a highways_helper way, in the format of StreamingOSMLoader."""
+        if document is None or "lat" not in document:
+            return {"ways": document.get("ways", []) if document else []}  # Node missing from the extract
+        return {
+            "ways": document.get("ways", []),
+            "_id": document["_id"],
+            "lat": document["lat"],
+            "lon": document["lon"],
+            "tags": document.get("tags", {}),
+        }
+
+    def update_intersections(self, node_ids: set) -> tuple[set, set, list | None]:
+        """
+        Compute the way links of nodes from the updated helper collections and update their intersections. The
+        remaining intersections lose their elevation, so stage 3 processes their location, tags and ways again.
+        :param node_ids: Nodes of the changed ways
+        :return: Nodes which became or stopped being intersections, intersections among the nodes and the bounding
+        box [min_lat, min_lon, max_lat, max_lon] of the nodes
+        """
+        nodes = {doc["_id"]: doc for doc in self.database.nodes_helper.find({"_id": {"$in": list(node_ids)}})}
+        way_ids = {way_id for node in nodes.values() for way_id in node.get("ways", [])}
+        links = defaultdict(int)
+        for way in self.database.highways_helper.find({"_id": {"$in": list(way_ids)}}, {"nodes._id": 1}):
+            refs = [node.get("_id") for node in way["nodes"]]
+            for ref, weight in zip(refs, IntersectionExtractor.link_weights(len(refs))):
+                if ref in nodes:
+                    links[ref] += weight
+
+        collection = self.database.intersections
+        existing = {doc["_id"] for doc in collection.find({"_id": {"$in": list(node_ids)}}, {"_id": 1})}
+        intersections = {
+            node_id
+            for node_id, node in nodes.items()
+            if "lat" in node and self.intersection_extractor.is_intersection(links[node_id])
+        }
+        operations = [DeleteOne({"_id": node_id}) for node_id in existing - intersections]
+        for node_id in intersections:
+            node = nodes[node_id]
+            operations.append(
+                UpdateOne(
+                    {"_id": node_id},
+                    {
+                        "$set": {"lat": node["lat"], "lon": node["lon"], "tags": node.get("tags", {})},
+                        "$unset": {"elevation": ""},
+                    },
+                    upsert=True,
+                )
+            )
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        print(
+            f"Intersections: {len(intersections - existing)} added, {len(existing - intersections)} removed, "
+            f"{len(intersections & existing)} updated"
+        )
+
+        located = [node for node in nodes.values() if "lat" in node]
+        bounds = None
+        if located:
+            lats = [node["lat"] for node in located]
+            lons = [node["lon"] for node in located]
+            bounds = [min(lats), min(lons), max(lats), max(lons)]
+        return (intersections ^ existing), intersections, bounds
+
+    def remove_paths(self, way_ids: set) -> tuple[set, list[dict]]:
+        """
+        Remove the paths derived from the given ways. Merged paths also contain other ways, whose paths are removed
+        as well, until no further ways are found.
+        :param way_ids: Changed ways
+        :return: All ways whose paths were removed and the removed paths (_id, start_node, end_node, way_ids)
+        """
+        paths = self.database.paths
+        rebuilt_ways = set(way_ids)
+        removed = {}
+        frontier = set(way_ids)
+        while frontier:
+            found = paths.find(
+                {"way_ids": {"$in": list(frontier)}, "_id": {"$nin": list(removed)}},
+                {"start_node": 1, "end_node": 1, "way_ids": 1},
+            )
+            frontier = set()
+            for path in found:
+                removed[path["_id"]] = path
+                frontier.update(set(path.get("way_ids", [])) - rebuilt_ways)
+            rebuilt_ways |= frontier
+        if removed:
+            paths.delete_many({"_id": {"$in": list(removed)}})
+        print(f"Removed {len(removed)} paths derived from {len(rebuilt_ways)} ways")
+        return rebuilt_ways, list(removed.values())
+
+    def regenerate_paths(self, region: dict) -> list[int]:
+        """
+        Stage "paths": process the intersections of the region (stage 3) and generate their paths (stage 4).
+        :return: The intersections of the region extended with the ends of the new paths
+        """
+        intersections = region["intersections"]
+        processor = ProcessedIntersectionMongoParser(self.geo_connector)
+        query = {"_id": {"$in": intersections}, "elevation": {"$exists": False}}
+        asyncio.run(processor.generate_nodes({"batch_id": 1, "total_batches": 1, "query": query}))
+
+        ConnectionMongoParser(self.geo_connector).parse_query_to_graph({"_id": {"$in": intersections}})
+
+        new_paths = self.database.paths.find(
+            {"way_ids": {"$in": region["rebuilt_ways"]}}, {"start_node": 1, "end_node": 1}
+        )
+        ends = {node_id for path in new_paths for node_id in (path["start_node"], path["end_node"])}
+        return sorted(set(intersections) | ends)
+
+    def split_region(self, region: dict) -> None:
+        """Stage "split": replace the split intersections of the region and their paths."""
+        intersections = region["intersections"]
+        intersections_splitted = self.database.intersections_splitted
+        split_ids = self.split_ids(intersections)
+        intersections_splitted.delete_many({"original_id": {"$in": intersections}})
+        self.database.paths_splitted.delete_many(
+            {"$or": [{"start_node": {"$in": split_ids}}, {"end_node": {"$in": split_ids}}]}
+        )
+
+        splitter = IntersectionSplitter(self.geo_connector)
+        splitter.generate_nodes(query={"_id": {"$in": intersections}})
+        splitter.reroute_original_paths(
+            query={"$or": [{"start_node": {"$in": intersections}}, {"end_node": {"$in": intersections}}]}
+        )
+        print(f"Split {len(intersections)} intersections into {len(self.split_ids(intersections))} nodes")
+
+    def export_region(self, region: dict) -> None:
+        """Stage "exported": replace the Neo4j nodes of the region and their relationships."""
+        intersections = region["intersections"]
+        neo4j = self.geo_connector.neo4j_db()
+        neo4j.run("CREATE INDEX intersections_original_id IF NOT EXISTS FOR (i:Intersection) ON (i.original_id)")
+        for batch in chunks([str(node_id) for node_id in intersections], 10000):
+            neo4j.run("MATCH (i:Intersection) WHERE i.original_id IN $ids DETACH DELETE i", ids=batch)
+
+        split_ids = self.split_ids(intersections)
+        exporter = GraphExporterNeo4J(
+            self.geo_connector, collection_nodes="intersections_splitted", collection_paths="paths_splitted"
+        )
+        exporter.export_to_neo4j(
+            query_nodes={"original_id": {"$in": intersections}},
+            query_paths={"$or": [{"start_node": {"$in": split_ids}}, {"end_node": {"$in": split_ids}}]},
+        )
+
+    def split_ids(self, intersections: list[int]) -> list[str]:
+        return [
+            doc["_id"]
+            for doc in self.database.intersections_splitted.find({"original_id": {"$in": intersections}}, {"_id": 1})
+        ]
+
+    def pending(self) -> list[dict]:
+        return self.tracker.pending()
@@ -0,0 +1,35 @@
+from pymongo import UpdateOne
+
+
+class IntersectionExtractor:
+    def __init__(self, min_links: int = 3):
+        """
+        Offline replacement of the Overpass query node(way_link.streets:3-) of stage 2, based on the way links of
+        every node: a node inside a way has two links, the first and last node of a way one. Nodes with at least
+        min_links links are intersections (e.g. a way passing through the end of another way, but not two ways
+        continuing each other).
+        :param min_links: Minimum number of links of an intersection
+        """
+        self.min_links = min_links
+
+    @staticmethod
+    def link_weights(length: int) -> list[int]:
+        """
+        Way links contributed by the nodes of a way.
+        :param length: Number of nodes of the way
+        :return: List of link counts, in the order of the nodes
+        """
+        if length < 2:
+            return [0] * length
+        return [1] + [2] * (length - 2) + [1]
+
+    def is_intersection(self, links: int) -> bool:
+        return links >= self.min_links
+
+    @staticmethod
+    def operation(node_id: int, lat: float, lon: float, tags: dict) -> UpdateOne:
+        """
+        Upsert of an intersection, in the document format of stage 2. Existing documents are kept.
+        :return: UpdateOne operation for the intersections collection
+        """
+        return UpdateOne({"_id": node_id}, {"$setOnInsert": {"lat": lat, "lon": lon, "tags": tags}}, upsert=True)
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+from pymongo.collection import Collection
+
+
+class IntersectionIndex:
+    def __init__(self, ids: np.ndarray):
+        """
+        Compact index of intersection IDs, stored as a sorted int64 array and queried with binary search.
+        :param ids: Sorted array of unique intersection IDs (in memory or memory-mapped)
+        """
+        self.ids = ids
+
+    @staticmethod
+    def build(collection: Collection, path: str) -> "IntersectionIndex":
+        """
+        Read all intersection IDs from MongoDB and save them as a sorted .npy file.
+        :param collection: The intersections collection
+        :param path: Location of the index file
+        :return: The memory-mapped index
+        """
+        ids = np.fromiter((doc["_id"] for doc in collection.find({}, {"_id": 1})), dtype=np.int64)
+        ids = np.unique(ids)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first, so workers never map a half written index
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as f:
+            np.save(f, ids)
+        os.replace(temporary_path, path)
+
+        return IntersectionIndex.load(path)
+
+    @staticmethod
+    def load(path: str) -> "IntersectionIndex":
+        """
+        Memory-map an index file, so all worker processes share it through the OS page cache.
+        :param path: Location of the index file
+        :return: The memory-mapped index
+        """
+        return IntersectionIndex(np.load(path, mmap_mode="r"))
+
+    def contains(self, node_ids) -> np.ndarray:
+        """
+        Vectorized membership test.
+        :param node_ids: Iterable of node IDs
+        :return: Boolean array, True where the node is an intersection
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if len(self.ids) == 0 or len(node_ids) == 0:
+            return np.zeros(len(node_ids), dtype=bool)
+        positions = np.searchsorted(self.ids, node_ids)
+        positions = np.minimum(positions, len(self.ids) - 1)
+        return self.ids[positions] == node_ids
+
+    def count(self, node_ids) -> int:
+        """
+        Count the distinct intersections in a list of node IDs.
+        :param node_ids: Iterable of node IDs
+        :return: Number of distinct node IDs that are intersections
+        """
+        return int(self.contains(np.unique(np.asarray(node_ids, dtype=np.int64))).sum())
+
+    def __contains__(self, node_id) -> bool:
+        return bool(self.contains([node_id])[0])
+
+    def __len__(self):
+        return len(self.ids)
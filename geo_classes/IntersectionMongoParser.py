@@ -1,43 +1,93 @@
-from collections import namedtuple
+import asyncio
+import heapq
+import random
+import socket
+import threading
+import time
+from collections import deque, namedtuple
+
+import overpy
+from pymongo import UpdateOne
+
+from geo_classes.QuadTreeTiler import QuadTreeTiler, Tile
+from geo_classes.TileCheckpoint import TileCheckpoint
+from setup.Constants import OVERPASS_TIMEOUT, TILE_MAX_NODES, TILE_MIN_SIZE, TILE_ROOT_SIZE, TILING_REDIS_DB
 from setup.GeoConnector import GeoConnector
 from setup.MapBoundaries import MapBoundaries
-import concurrent
-from concurrent.futures import ThreadPoolExecutor
 
 Intersection = namedtuple("Intersection", ["id", "lat", "lon", "tags"])
+SaveResult = namedtuple("SaveResult", ["upserted", "matched", "skipped"])
 
 
 class IntersectionMongoParser:
-    def __init__(self, geo_connector: GeoConnector, map_boundaries: MapBoundaries):
+    def __init__(
+        self,
+        geo_connector: GeoConnector,
+        map_boundaries: MapBoundaries,
+        batch_size: int = 1000,
+        max_attempts: int = 5,
+        retry_delay: float = 10,
+    ):
         """
         Class for parsing intersections from Overpass API to MongoDB.
         :param geo_connector: A GeoConnector object for connecting to the Redis, Neo4j, MongoDB, Overpass API.
         :param map_boundaries: A MapBoundaries object for defining the boundaries of the map.
+        :param batch_size: Number of upserts sent to MongoDB in one bulk write.
+        :param max_attempts: Number of attempts of a failing tile in one run.
+        :param retry_delay: Seconds before the first retry of a failed tile, doubled on every further attempt.
         """
         self.geo_connector = geo_connector
         self.map_boundaries = map_boundaries
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # IDs already written in this run, the overlapping borders of neighbouring squares return the same nodes
+        self.saved_ids = set()
+        self.saved_ids_lock = threading.Lock()
+        self.tiler = QuadTreeTiler(
+            geo_connector.redis_db(TILING_REDIS_DB),
+            map_boundaries,
+            root_size=TILE_ROOT_SIZE,
+            min_size=TILE_MIN_SIZE,
+            max_nodes=TILE_MAX_NODES,
+        )
+        self.checkpoint = TileCheckpoint(geo_connector.redis_db(TILING_REDIS_DB))
 
-    def save_to_mongo_db(self, nodes: list[Intersection]) -> None:
+    def save_to_mongo_db(self, nodes: list[Intersection]) -> SaveResult:
         """
-        Save a list of intersection nodes to a MongoDB database.
+        Save a list of intersection nodes to a MongoDB database with unordered bulk writes. Nodes already saved in
+        this run are skipped.
         :param nodes: A list of Intersection named tuples, each representing an intersection with attributes id, lat
         (latitude), lon (longitude), and tags.
-        :return:
+        :return: SaveResult with the number of inserted, already existing and skipped nodes.
         """
+        unique_nodes = {node.id: node for node in nodes}
+        with self.saved_ids_lock:
+            new_nodes = [node for node_id, node in unique_nodes.items() if node_id not in self.saved_ids]
+
         collection = self.geo_connector.mongo_db().get_database("geo_data").get_collection("intersections")
-        for node in nodes:
-            node_dict = {
-                "lat": node.lat,
-                "lon": node.lon,
-                "tags": node.tags,
-            }
-            collection.update_one(
-                {"_id": node.id},  # Filter criteria
-                {"$setOnInsert": node_dict},  # Insert document if it does not exist
-                upsert=True,
-            )
+        upserted = 0
+        matched = 0
+        for i in range(0, len(new_nodes), self.batch_size):
+            operations = [
+                UpdateOne(
+                    {"_id": node.id},  # Filter criteria
+                    {"$setOnInsert": {"lat": node.lat, "lon": node.lon, "tags": node.tags}},  # Insert if missing
+                    upsert=True,
+                )
+                for node in new_nodes[i : i + self.batch_size]
+            ]
+            result = collection.bulk_write(operations, ordered=False)
+            upserted += result.upserted_count
+            matched += result.matched_count
+            # Only written nodes are skipped later, a failed batch is written again when its tile is retried
+            with self.saved_ids_lock:
+                self.saved_ids.update(node.id for node in new_nodes[i : i + self.batch_size])
+        return SaveResult(upserted=upserted, matched=matched, skipped=len(nodes) - len(new_nodes))
 
-    def overpass_query(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list[Intersection]:
+    async def overpass_query(
+        self, min_lat: float, min_lon: float, max_lat: float, max_lon: float
+    ) -> list[Intersection]:
         """
         Query Overpass API for intersections in a given area.
         :param min_lat: Minimum latitude
@@ -45,78 +95,115 @@ class IntersectionMongoParser:
         :param max_lat: Maximum latitude
         :param max_lon: Maximum longitude
         :return: List of intersection nodes
+        :raises overpy.exception.OverpassError: If the query fails
         """
-        q = f"""way["highway"]({str(min_lat)}, {str(min_lon)}, {str(max_lat)}, {str(max_lon)})->.streets; node(way_link.streets:3-)->.intersections; .intersections out;"""
-        overpass_api = self.geo_connector.overpass_api()
-        try:
-            result = overpass_api.query(q)
-        except Exception as e:
-            print(f"Query failed: {e}")
-            return []
+        q = (
+            f"[timeout:{OVERPASS_TIMEOUT}]; "
+            f'way["highway"]({str(min_lat)}, {str(min_lon)}, {str(max_lat)}, {str(max_lon)})->.streets; '
+            "node(way_link.streets:3-)->.intersections; .intersections out;"
+        )
+        overpass_api = self.geo_connector.async_overpass_api()
+        result = await overpass_api.query(q)
         nodes = []
         for node in result.nodes:
             nodes.append(Intersection(id=node.id, lat=float(node.lat), lon=float(node.lon), tags=node.tags))
         return nodes
 
-    def process_square(self, square, parser_square: float) -> None:
-        """
-        Process a square of the map by calling overpass_query() and save_to_db().
-        :param square: coordinates of the square
-        :param parser_square: coordinate step
-        :return:
-        """
-        intersection_nodes = self.overpass_query(
-            min_lat=square[0],
-            max_lat=square[0] + parser_square,
-            min_lon=square[1],
-            max_lon=square[1] + parser_square,
-        )
-        self.save_to_mongo_db(intersection_nodes)
+    @staticmethod
+    def is_timeout(exception: Exception) -> bool:
+        """Check if a failed Overpass query ran out of time (or memory) on the server or in the connection."""
+        if isinstance(exception, (socket.timeout, TimeoutError, overpy.exception.OverpassGatewayTimeout)):
+            return True
+        if isinstance(exception, overpy.exception.OverpassRuntimeError):
+            return "timed out" in str(exception) or "out of memory" in str(exception)
+        return False
 
-    def generate_coordinate_grid_for_parsing(self) -> list[list[tuple[float, float]]]:
+    async def process_tile(self, tile: Tile) -> list[Tile]:
         """
-        Prepare a list of all squares to parse based on the squares that have already been parsed. :return:  A list
-        of lists, where each inner list contains tuples of latitude and longitude coordinates of a square.
+        Query and save the intersections of a tile. A tile that times out is split and its quadrants are returned
+        for querying, a tile with too many intersections is saved and split for the next runs.
+        :param tile: Tile to process
+        :return: Tiles that still have to be processed
         """
-        map_boundaries = MapBoundaries()
-        parser_square = 0.03
-        """Initial values for current_lat and current_lon are set to the minimum values of the map boundaries."""
+        overlap = 0.00010  # Neighbouring tiles overlap, so intersections on the border are not missed
         try:
-            current_lat = float(self.geo_connector.redis_db().get("current_lat"))
-            current_lon = float(self.geo_connector.redis_db().get("current_lon"))
+            intersection_nodes = await self.overpass_query(
+                min_lat=tile.min_lat - overlap,
+                max_lat=tile.max_lat,
+                min_lon=tile.min_lon - overlap,
+                max_lon=tile.max_lon,
+            )
         except Exception as e:
-            print("lat / lon not in db")
-            print(e)
-            current_lat = map_boundaries.min_lat
-            current_lon = map_boundaries.min_lon
-        squares = []
-        while current_lat < map_boundaries.max_lat + parser_square:
-            lat_square = []
-            while current_lon < map_boundaries.max_lon + parser_square:
-                lat_square.append((current_lat, current_lon))
-                current_lon += parser_square - 0.00010
-            squares.append(lat_square)
-            current_lon = map_boundaries.min_lon
-            current_lat += parser_square - 0.00010
-        return squares
+            if self.is_timeout(e) and self.tiler.can_split(tile):
+                print(f"Tile {tile.id}: query timed out, splitting")
+                return await asyncio.to_thread(self.tiler.split, tile)
+            raise
+
+        # The database calls are blocking, they run in a thread so the event loop keeps serving other queries
+        await asyncio.to_thread(self.save_tile, tile, intersection_nodes)
+        return []
+
+    def save_tile(self, tile: Tile, intersection_nodes: list[Intersection]) -> None:
+        result = self.save_to_mongo_db(intersection_nodes)
+        if len(intersection_nodes) > self.tiler.max_nodes and self.tiler.can_split(tile):
+            self.tiler.split(tile)
+        else:
+            self.tiler.record(tile, len(intersection_nodes))
+        self.checkpoint.mark_done(tile)
+        print(
+            f"Tile {tile.id}: {len(intersection_nodes)} intersections, "
+            f"{result.upserted} inserted, {result.matched} existing, {result.skipped} duplicates"
+        )
 
     def parse_map(self) -> None:
-        """Parse map and save intersections to MongoDB by calling save_to_db()"""
-        map_boundaries = MapBoundaries()
-        parser_square = 0.03
-        squares = self.generate_coordinate_grid_for_parsing()
-
-        with ThreadPoolExecutor(max_workers=8) as executor:  # Adjust the number of workers as needed
-            for lat_square in squares:
-                future_to_square = {
-                    executor.submit(self.process_square, square, parser_square): square for square in lat_square
-                }
-                for future in concurrent.futures.as_completed(future_to_square):
-                    square = future_to_square[future]
-                    try:
-                        future.result()
-                    except Exception as exc:
-                        print("%r generated an exception: %s" % (square, exc))
-                self.geo_connector.redis_db().set("current_lat", lat_square[0][0])
-        self.geo_connector.redis_db().delete("current_lat")
-        self.geo_connector.redis_db().delete("current_lon")
+        """
+        Parse map and save intersections to MongoDB by calling process_tile() on the tiles of the adaptive tiling.
+        Tiles finished by an earlier, interrupted run are skipped, failed tiles are retried with exponential backoff.
+        """
+        asyncio.run(self.parse_tiles())
+
+    async def parse_tiles(self) -> None:
+        tiles = self.tiler.leaves()
+        print(self.tiler)
+        print(self.checkpoint.summary(tiles))
+        queue = deque(tile for tile, done in zip(tiles, self.checkpoint.done(tiles)) if not done)
+
+        overpass_api = self.geo_connector.async_overpass_api()
+        window = 2 * overpass_api.max_concurrency  # Tiles in progress, the client limits the concurrent queries
+        attempts = {}
+        retries = []  # Heap of (retry time, tile id, tile)
+        task_to_tile = {}
+        while queue or retries or task_to_tile:
+            while retries and retries[0][0] <= time.monotonic():
+                queue.append(heapq.heappop(retries)[2])
+            while queue and len(task_to_tile) < window:
+                tile = queue.popleft()
+                task_to_tile[asyncio.create_task(self.process_tile(tile))] = tile
+            timeout = max(retries[0][0] - time.monotonic(), 0) if retries else None
+            if not task_to_tile:
+                await asyncio.sleep(timeout)
+                continue
+
+            done, _ = await asyncio.wait(task_to_tile, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tile = task_to_tile.pop(task)
+                try:
+                    split_tiles = task.result()
+                except Exception as exc:
+                    self.checkpoint.mark_failed(tile)
+                    attempts[tile.id] = attempts.get(tile.id, 0) + 1
+                    print("%r generated an exception (attempt %d): %s" % (tile.id, attempts[tile.id], exc))
+                    if attempts[tile.id] < self.max_attempts:
+                        delay = self.retry_delay * 2 ** (attempts[tile.id] - 1) * random.uniform(0.5, 1.5)
+                        heapq.heappush(retries, (time.monotonic() + delay, tile.id, tile))
+                    continue
+                queue.extendleft(split_tiles)
+        await overpass_api.close()
+        print(overpass_api)
+
+        tiles = self.tiler.leaves()
+        print(self.checkpoint.summary(tiles))
+        if all(self.checkpoint.done(tiles)):
+            self.checkpoint.clear()
+        else:
+            print("Run the script again to query the remaining tiles.")
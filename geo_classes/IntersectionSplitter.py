@@ -2,6 +2,7 @@ from pymongo.collection import Collection
 from pymongo.database import Database
 
 from graph.IntersectionPathway import IntersectionPathway
+from setup.CollectionPartitioner import CollectionPartitioner
 from setup.Constants import MULTI
 import multiprocessing
 
@@ -23,12 +24,13 @@ class IntersectionSplitter:
         print("Rerouting original paths...")
         self.reroute_original_paths()
 
-    def reroute_original_paths(self):
+    def reroute_original_paths(self, query=None):
         mongo = self.geo_connector.mongo_db()
         database = mongo.get_database("geo_data")
         collection_paths = database.get_collection("paths")
 
         update_pipeline = [
+            {"$match": query or {}},
             {
                 "$set": {
                     "start_node": {"$concat": [{"$toString": "$start_node"}, "_", {"$toString": "$_id"}]},
@@ -50,23 +52,14 @@ class IntersectionSplitter:
         mongo = self.geo_connector.mongo_db()
         database: Database = mongo.get_database("geo_data")
         collection_intersections: Collection = database.get_collection("intersections")
-        count = collection_intersections.count_documents({})
-        skip = 0
-        limit = self.limit
+        partitioner = CollectionPartitioner(collection_intersections, batch_size=self.limit)
         pool = multiprocessing.Pool(processes=multiprocessing.cpu_count() - 1)
-        while skip < count:
-            pool.apply_async(
-                self.generate_nodes,
-                args=(
-                    skip,
-                    limit,
-                ),
-            )
-            skip += limit
+        for query in partitioner.partitions():
+            pool.apply_async(self.generate_nodes, args=(query,))
         pool.close()
         pool.join()
 
-    def generate_nodes(self, skip=None, limit=None):
+    def generate_nodes(self, query=None):
         mongo = self.geo_connector.mongo_db()
         database: Database = mongo.get_database("geo_data")
         collection_paths: Collection = database.get_collection("paths")
@@ -78,12 +71,8 @@ class IntersectionSplitter:
         new_paths = 0
 
         index = 0
-        if skip is None or limit is None:
-            cursor = collection_intersections.find()
-            count = collection_intersections.count_documents({})
-        else:
-            cursor = collection_intersections.find().skip(skip).limit(limit)
-            count = limit
+        cursor = collection_intersections.find(query or {})
+        count = collection_intersections.count_documents(query or {})
         for i in cursor:
             fromto_b = list(collection_paths.find({"end_node": i["_id"]}, {"_id": 1, "nodes": 1}))
             fromto_a = list(collection_paths.find({"start_node": i["_id"]}, {"_id": 1, "nodes": 1}))
@@ -116,5 +105,5 @@ class IntersectionSplitter:
                     ip.calculate_curviness(ftb["nodes"][-2:-1] + fta["nodes"][:2])
                     collection_new_paths.insert_one(ip.__dict__)
             index += 1
-            if index % 1000 == 0 and skip is None:
+            if index % 1000 == 0 and query is None:
                 print(f"Progress generate nodes single: {index}/{count}", end="\r")
@@ -0,0 +1,86 @@
+import time
+
+import osmium
+from osmium.filter import EntityFilter, KeyFilter
+
+
+class OSMPruner:
+    def __init__(self, input_file: str, area=None, location_storage: str = "flex_mem"):
+        """
+        Reduces an OpenStreetMap extract to the highway ways and their nodes. Both passes filter in the C++ layer
+        of osmium, only the highway ways of the first pass are handed to Python:
+
+        1. Ways with a highway key: the ways with at least one node inside of the area are kept, their IDs and node
+           references are collected into an IdTracker (C++ ID bitmaps).
+        2. Tracked nodes and ways are written by the osmium writers directly, relations and all other objects are
+           dropped before reaching a handler.
+
+        Ways crossing the border of the area are kept complete, with their nodes outside of it.
+        :param input_file: OSM file (.osm.pbf, .osm, .osm.bz2, ...)
+        :param area: Area to clip to, any object with a vectorized contains(lats, lons) such as MapBoundaries or
+        MapPolygon, None to keep all highways
+        :param location_storage: osmium node location storage used for clipping, e.g. "flex_mem" or
+        "dense_file_array,locations.bin" for extracts whose locations do not fit in memory
+        """
+        self.input_file = input_file
+        self.area = area
+        self.location_storage = location_storage
+        self.tracker = osmium.IdTracker()
+        self.highway_ways = 0
+        self.outside_ways = 0
+
+    def collect_highway_nodes(self) -> None:
+        """Pass 1: collect the highway ways inside of the area and the nodes referenced by them."""
+        start = time.perf_counter()
+        if self.area is None:
+            processor = osmium.FileProcessor(self.input_file, osmium.osm.WAY).with_filter(KeyFilter("highway"))
+        else:
+            # Node locations are needed to clip, the nodes are read by the location handler but never yielded
+            processor = (
+                osmium.FileProcessor(self.input_file, osmium.osm.NODE | osmium.osm.WAY)
+                .with_locations(self.location_storage)
+                .with_filter(EntityFilter(osmium.osm.WAY))
+                .with_filter(KeyFilter("highway"))
+            )
+        for way in processor:
+            if self.area is not None and not self.way_in_area(way):
+                self.outside_ways += 1
+                continue
+            self.tracker.add_way(way.id)
+            self.tracker.add_references(way)
+            self.highway_ways += 1
+        outside = f" ({self.outside_ways} outside of the area dropped)" if self.area is not None else ""
+        print(
+            f"Pass 1: {self.highway_ways} highway ways{outside} referencing {len(self.tracker.node_ids())} nodes "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+    def way_in_area(self, way) -> bool:
+        locations = [(node.location.lat, node.location.lon) for node in way.nodes if node.location.valid()]
+        if not locations:
+            return False
+        lats, lons = zip(*locations)
+        return bool(self.area.contains(lats, lons).any())
+
+    def write(self, output_files: list[str]) -> None:
+        """
+        Pass 2: write the highway nodes and ways to every output file, the format follows the file extension.
+        :param output_files: Paths of the output files
+        """
+        start = time.perf_counter()
+        writers = [osmium.SimpleWriter(output_file) for output_file in output_files]
+        try:
+            osmium.apply(
+                self.input_file,
+                EntityFilter(osmium.osm.NODE | osmium.osm.WAY),
+                self.tracker.id_filter(),
+                *writers,
+            )
+        finally:
+            for writer in writers:
+                writer.close()
+        print(f"Pass 2: written {', '.join(output_files)} in {time.perf_counter() - start:.1f} s")
+
+    def prune(self, output_files: list[str]) -> None:
+        self.collect_highway_nodes()
+        self.write(output_files)
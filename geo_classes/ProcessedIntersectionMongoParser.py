@@ -1,10 +1,14 @@
 from setup.GeoConnector import GeoConnector
 import multiprocessing as mp
-from sport_activities_features import ElevationIdentification
 import asyncio
+import math
+import threading
 from pymongo.collection import Collection
 from setup.Constants import MULTI
 from pymongo import UpdateOne
+from setup.Batching import batched
+from setup.BulkWriter import BulkWriter
+from setup.CollectionPartitioner import CollectionPartitioner
 
 
 class ProcessedIntersectionMongoParser:
@@ -15,125 +19,136 @@ class ProcessedIntersectionMongoParser:
         """
         self.geo_connector = geo_connector
         self.BATCH_SIZE = 500
+        # Each range is processed in chunks of BATCH_SIZE, so its elevation requests overlap with the writes
+        self.RANGE_SIZE = 10 * self.BATCH_SIZE
 
     async def parse_to_mongo(self):
         collection: Collection = self.geo_connector.mongo_db().get_database("geo_data").get_collection("intersections")
-        total_documents = collection.count_documents({"elevation": {"$exists": False}})
-        total_queries = (total_documents // self.BATCH_SIZE) + (1 if total_documents % self.BATCH_SIZE != 0 else 0)
-
-        id_batches = []
-        for i in range(total_queries):
-            skip_count = i * self.BATCH_SIZE
-            ids = list(
-                collection.find({"elevation": {"$exists": False}}, {"_id": 1}).skip(skip_count).limit(self.BATCH_SIZE)
-            )
-            id_batches.append({"batch_id": i + 1, "total_batches": total_queries, "ids": [doc["_id"] for doc in ids]})
+        query = {"elevation": {"$exists": False}}
+        total_documents = collection.count_documents(query)
+        total_queries = math.ceil(total_documents / self.RANGE_SIZE)
+
+        # The ranges are read from a single _id cursor while the workers process the earlier ones
+        partitioner = CollectionPartitioner(collection, query=query, batch_size=self.RANGE_SIZE)
+        batches = (
+            {"batch_id": i + 1, "total_batches": total_queries, "query": range_query}
+            for i, range_query in enumerate(partitioner.stream_ranges())
+        )
 
         print(f"Total documents: {total_documents}")
+        print(f"Node store: {len(self.geo_connector.node_store())} nodes")
         print(f"Total queries: {total_queries}")
 
+        processed = failed = 0
+        errors = []
         if MULTI:
-            pool = mp.Pool(mp.cpu_count())
             print("Adding nodes to MongoDB...")
-            results = pool.map(self.generate_nodes_sync, id_batches)
+            processes = mp.cpu_count()
+            # Pool.imap_unordered reads its input eagerly, the window keeps at most 2 ranges per worker in flight
+            window = threading.Semaphore(2 * processes)
+            with mp.Pool(processes) as pool:
+                try:
+                    for result in pool.imap_unordered(self.generate_nodes_sync, bounded(batches, window)):
+                        window.release()
+                        processed += result["processed"]
+                        failed += result["failed"]
+                        errors.extend(result["errors"])
+                finally:
+                    window.release()  # Unblocks the feeding thread if the loop stops early, so the pool can terminate
             print("Done.")
         else:
-            results = []
-            for batch in id_batches:
-                results.append(await self.generate_nodes(batch))
+            for batch in batches:
+                result = await self.generate_nodes(batch)
+                processed += result["processed"]
+                failed += result["failed"]
+                errors.extend(result["errors"])
 
-    async def find_ways_of_node(self, node, nodes_helper):
-        # Optimized query to retrieve only way IDs
-        q = f"""[out:json];node({node['_id']});way(bn);out ids;"""
-        max_retries = 3
+        print(f"Processed {processed} intersections, {failed} without elevation, {len(errors)} failed ranges")
+        for error in errors:
+            print(error)
 
-        for i in range(max_retries):
-            try:
-                query = nodes_helper.find_one({"_id": node["_id"]})["ways"]
-                return query
-            except Exception as e:
-                print(f"Error in find_ways_of_node: {e}")
-                print(f"Retrying... {i + 1}/{max_retries}")
-                return None
-
-    async def find_elevation_of_node(self, node):
-        return await self.find_elevation_of_node([node])
+    def find_ways_of_nodes(self, ids: list) -> list:
+        """
+        Get the way IDs of several nodes with one vectorized lookup in the memory-mapped node store. Nodes missing
+        from the store (e.g. a store older than nodes_helper) are looked up with a single $in query.
+        :param ids: Node IDs
+        :return: List of way ID lists in the order of ids, None for nodes which are not part of a highway
+        """
+        ways = self.geo_connector.node_store().ways_of_nodes(ids)
+        missing = [node_id for node_id, node_ways in zip(ids, ways) if node_ways is None]
+        if missing:
+            nodes_helper = self.geo_connector.mongo_db().get_database("geo_data").get_collection("nodes_helper")
+            found = {
+                node["_id"]: node.get("ways") for node in nodes_helper.find({"_id": {"$in": missing}}, {"ways": 1})
+            }
+            ways = [node_ways if node_ways is not None else found.get(node_id) for node_id, node_ways in zip(ids, ways)]
+        return ways
 
     async def find_elevation_of_nodes(self, nodes):
         retry = 5
         for i in range(retry):
             try:
-                elevation_identification = ElevationIdentification(
-                    open_elevation_api=self.geo_connector.open_elevation_api(),
-                    positions=[(node["lat"], node["lon"]) for node in nodes],
+                elevation = self.geo_connector.elevation_provider().elevations(
+                    [node["lat"] for node in nodes], [node["lon"] for node in nodes]
                 )
-                elevation = elevation_identification.fetch_elevation_data()
-                return elevation
+                return elevation.tolist()
             except Exception as e:
                 print(f"Error in find_elevation_of_nodes: {e}")
                 print(f"Retrying... {i + 1}/{retry}")
                 # wait for 3 seconds
                 await asyncio.sleep(3)
-        return -1000
-
-    async def generate_node(self, node, elevation=None, nodes_helper: Collection = None):
-        if elevation is None:
-            elevation_promise = self.find_elevation_of_node(node)
-        ways = self.find_ways_of_node(node, nodes_helper)  # async
-        traffic_signals = check_traffic_signals(node)  # sync
-
-        if elevation is None:
-            elevation = await elevation_promise[0]
-
-        ways_result = await ways
+        return None
 
+    @staticmethod
+    def generate_node(node, elevation, ways):
         node["elevation"] = elevation
-        node["traffic_signals"] = traffic_signals
-        node["way_ids"] = ways_result
-
+        node["traffic_signals"] = check_traffic_signals(node)
+        node["way_ids"] = ways
         return node
 
     async def generate_nodes(self, batch):
-        ids = batch["ids"]
-
-        print(batch["batch_id"], "/", batch["total_batches"], "Processing", len(ids), "nodes")
-
+        """
+        Add the elevation, traffic signals and way IDs to the intersections of a range. The range is processed in
+        chunks of BATCH_SIZE nodes: the updates of a chunk are sent by a background BulkWriter while the elevations
+        of the next chunk are fetched, so the elevation backend and MongoDB work at the same time.
+        :param batch: {"batch_id": ..., "total_batches": ..., "query": filter of the intersections}
+        :return: {"processed": number of processed nodes, "failed": number of nodes left without elevation,
+        "errors": []}
+        """
         collection: Collection = self.geo_connector.mongo_db().get_database("geo_data").get_collection("intersections")
-        nodes_helper: Collection = self.geo_connector.mongo_db().get_database("geo_data").get_collection("nodes_helper")
-
-        nodes = list(collection.find({"_id": {"$in": ids}, "elevation": {"$exists": False}}))
-
-        elevations = await self.find_elevation_of_nodes(nodes)  # async
-
-        operations = []
-
-        for i, node in enumerate(nodes):
-            retries = 3
-            for attempt in range(retries):
-                try:
-                    processed_node = await self.generate_node(node, elevation=elevations[i], nodes_helper=nodes_helper)
-                    operations.append(UpdateOne({"_id": processed_node["_id"]}, {"$set": processed_node}, upsert=True))
-                    # print(f'Added: {node["_id"]}')
-                    break
-                except Exception as e:
-                    print(f"Error in add_nodes: {e}")
-                    print(f"Retrying... {attempt + 1}/{retries}")
-                    if attempt == retries - 1:
-                        # Handle the failure case if all retries are exhausted
-                        print(f"Failed to process node after {retries} retries: {node['_id']}")
-
-        if operations:
-            try:
-                result = collection.bulk_write(operations, ordered=False)
-                print(f"Bulk update completed with {result.modified_count} operations.")
-            except Exception as e:
-                print(f"Error in bulk_write: {e}")
-
-        print(batch["batch_id"], "/", batch["total_batches"], "Completed", len(ids), "nodes")
-        return [op._doc for op in operations if op._doc]
-
-    def generate_nodes_sync(self, ids):
-        return asyncio.run(self.generate_nodes(ids))
+        writer = BulkWriter(collection, batch_size=self.BATCH_SIZE, queue_size=1)
+        processed = failed = 0
+
+        cursor = collection.find(batch["query"], batch_size=self.BATCH_SIZE)
+        try:
+            for nodes in batched(cursor, self.BATCH_SIZE):
+                elevations = await self.find_elevation_of_nodes(nodes)
+                if elevations is None:
+                    # Left without elevation, the next run picks them up again
+                    failed += len(nodes)
+                    continue
+                ways = self.find_ways_of_nodes([node["_id"] for node in nodes])
+
+                for node, elevation, node_ways in zip(nodes, elevations, ways):
+                    node = self.generate_node(node, elevation, node_ways)
+                    writer.add(UpdateOne({"_id": node["_id"]}, {"$set": node}, upsert=True))
+                    processed += 1
+                writer.flush()
+        finally:
+            cursor.close()
+            writer.close()
+
+        without_elevation = f", {failed} without elevation" if failed else ""
+        print(f'{batch["batch_id"]} / {batch["total_batches"]} Completed {processed} nodes{without_elevation}')
+        print(self.geo_connector.elevation_provider())
+        return {"processed": processed, "failed": failed, "errors": []}
+
+    def generate_nodes_sync(self, batch):
+        """Worker entry point, errors are returned instead of raised so one failed range does not stop the pool."""
+        try:
+            return asyncio.run(self.generate_nodes(batch))
+        except Exception as e:
+            return {"processed": 0, "failed": 0, "errors": [f'Range {batch["batch_id"]} failed: {e!r}']}
 
     def get_nodes_by_ids(self, ids):
         nodes = (
@@ -153,7 +168,8 @@ def check_traffic_signals(node: dict):
     return False
 
 
-# chunk into sizes of n
-def chunks(array: list, n: int):
-    for i in range(0, len(array), n):
-        yield array[i : i + n]
+# yield the items of an iterable after acquiring the semaphore, the consumer releases it per finished item
+def bounded(iterable, semaphore: threading.Semaphore):
+    for item in iterable:
+        semaphore.acquire()
+        yield item
@@ -0,0 +1,122 @@
+import math
+from collections import namedtuple
+
+import redis
+
+from setup.MapBoundaries import MapBoundaries
+
+Tile = namedtuple("Tile", ["id", "min_lat", "min_lon", "max_lat", "max_lon"])
+
+
+class QuadTreeTiler:
+    SPLIT = "split"
+
+    def __init__(
+        self,
+        redis_db: redis.client.Redis,
+        map_boundaries: MapBoundaries,
+        root_size: float = 0.12,
+        min_size: float = 0.0075,
+        max_nodes: int = 5000,
+        key: str = "tiling",
+    ):
+        """
+        Adaptive tiling of the map for the Overpass intersection queries. The map is covered with a grid of root
+        tiles, a tile whose query times out or returns more than max_nodes intersections is split into four quadrants.
+        The decisions are stored in a Redis hash (tile id -> "split" or the number of intersections found), so reruns
+        start from the learned tiling and skip tiles known to be empty.
+
+        Tile ids are "row_column" for root tiles, every split appends the quadrant ("/0" south-west, "/1" south-east,
+        "/2" north-west, "/3" north-east).
+        :param redis_db: Redis client storing the decisions
+        :param map_boundaries: Area to cover
+        :param root_size: Size of the root tiles in degrees
+        :param min_size: Tiles of this size (or smaller) are never split
+        :param max_nodes: Split tiles returning more intersections
+        :param key: Name of the Redis hash, the root size is appended so a different grid starts a new tiling
+        """
+        self.redis_db = redis_db
+        self.map_boundaries = map_boundaries
+        self.root_size = root_size
+        self.min_size = min_size
+        self.max_nodes = max_nodes
+        self.key = f"{key}:{root_size}"
+
+    def tile(self, tile_id: str) -> Tile:
+        """
+        Compute the bounds of a tile from its id.
+        :param tile_id: Tile id
+        :return: Tile
+        """
+        root, *quadrants = tile_id.split("/")
+        row, column = (int(value) for value in root.split("_"))
+        min_lat = self.map_boundaries.min_lat + row * self.root_size
+        min_lon = self.map_boundaries.min_lon + column * self.root_size
+        size = self.root_size
+        for quadrant in quadrants:
+            size /= 2
+            min_lat += size * (int(quadrant) // 2)
+            min_lon += size * (int(quadrant) % 2)
+        return Tile(tile_id, min_lat, min_lon, min_lat + size, min_lon + size)
+
+    def root_tiles(self) -> list[Tile]:
+        # The epsilon keeps rounding errors from adding an empty row or column when the size divides the area
+        rows = math.ceil((self.map_boundaries.max_lat - self.map_boundaries.min_lat) / self.root_size - 1e-9)
+        columns = math.ceil((self.map_boundaries.max_lon - self.map_boundaries.min_lon) / self.root_size - 1e-9)
+        return [self.tile(f"{row}_{column}") for row in range(rows) for column in range(columns)]
+
+    def children(self, tile: Tile) -> list[Tile]:
+        return [self.tile(f"{tile.id}/{quadrant}") for quadrant in range(4)]
+
+    def can_split(self, tile: Tile) -> bool:
+        return tile.max_lat - tile.min_lat > self.min_size
+
+    def leaves(self) -> list[Tile]:
+        """
+        Expand the root tiles with the stored split decisions.
+        :return: Tiles to query, without the tiles known to be empty
+        """
+        decisions = {key.decode(): value.decode() for key, value in self.redis_db.hgetall(self.key).items()}
+        leaves = []
+        stack = list(reversed(self.root_tiles()))
+        while stack:
+            tile = stack.pop()
+            decision = decisions.get(tile.id)
+            if decision == self.SPLIT:
+                stack.extend(reversed(self.children(tile)))
+            elif decision != "0":
+                leaves.append(tile)
+        return leaves
+
+    def split(self, tile: Tile) -> list[Tile]:
+        """
+        Store the decision to split a tile.
+        :param tile: Tile that timed out or returned too many intersections
+        :return: The four quadrants of the tile
+        """
+        self.redis_db.hset(self.key, tile.id, self.SPLIT)
+        return self.children(tile)
+
+    def record(self, tile: Tile, count: int) -> None:
+        """
+        Store the number of intersections of a queried tile. When all quadrants of a split tile turn out to be empty,
+        they are merged back into an empty parent.
+        :param tile: Queried tile
+        :param count: Number of intersections found
+        """
+        self.redis_db.hset(self.key, tile.id, count)
+        tile_id = tile.id
+        while count == 0 and "/" in tile_id:
+            parent_id = tile_id.rsplit("/", 1)[0]
+            siblings = [f"{parent_id}/{quadrant}" for quadrant in range(4)]
+            if any(value != b"0" for value in self.redis_db.hmget(self.key, siblings)):
+                break
+            self.redis_db.hdel(self.key, *siblings)
+            self.redis_db.hset(self.key, parent_id, 0)
+            tile_id = parent_id
+
+    def __str__(self):
+        return (
+            f"Quadtree tiling: {self.root_size} degree root tiles, split above {self.max_nodes} intersections "
+            f"down to {self.min_size} degrees"
+        )
@@ -0,0 +1,236 @@
+import time
+from array import array
+
+import numpy as np
+import osmium
+from pymongo import InsertOne
+from pymongo.database import Database
+
+from geo_classes.IntersectionExtractor import IntersectionExtractor
+from setup.BulkWriter import BulkWriter
+from setup.NodeStore import MISSING_COORDINATE, NodeStore
+
+# Way tags kept in highways_helper
+RELEVANT_TAGS = {
+    "bicycle",
+    "foot",
+    "highway",
+    "oneway",
+    "surface",
+    "sidewalk",
+    "access",
+    "motorcar",
+    "motor_vehicle",
+    "crossing",
+    "bridge",
+    "traffic_signals",
+    "cycleway",
+}
+
+
+def peak_memory_mb() -> float | None:
+    """Peak resident memory of the process in MB, None where the resource module is not available (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StreamingOSMLoader:
+    def __init__(
+        self,
+        database: Database,
+        batch_size: int = 10000,
+        queue_size: int = 4,
+        save_intersections: bool = False,
+        location_storage: str = "flex_mem",
+        node_store_directory: str | None = None,
+    ):
+        """
+        Loads the highways_helper and nodes_helper collections (and optionally the intersections) from a PBF file
+        in two streaming passes, without keeping the documents in memory:
+
+        1. Ways only: collect the (node, way) references of the highway ways into a compressed node -> ways index.
+        2. Nodes and ways with node locations: write every node with its ways and every highway way with its
+           resolved nodes, while background threads insert the previous batches.
+
+        Memory is bounded by the node -> ways index, the node location storage of osmium, the tags of the tagged
+        highway nodes and batch_size * queue_size pending documents per collection.
+        :param database: The geo_data database
+        :param batch_size: Documents per bulk write
+        :param queue_size: Full batches per collection waiting for the writer thread
+        :param save_intersections: Also save the nodes with at least three way links to the intersections collection
+        (see IntersectionExtractor)
+        :param location_storage: osmium node location storage, e.g. "flex_mem" or "dense_file_array,locations.bin"
+        for extracts whose locations do not fit in memory
+        :param node_store_directory: Also save the node -> ways index with the node locations as a NodeStore, None
+        to skip it
+        """
+        self.database = database
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.save_intersections = save_intersections
+        self.location_storage = location_storage
+        self.node_store_directory = node_store_directory
+        self.intersection_extractor = IntersectionExtractor()
+
+        # Node -> ways index (CSR): the ways of node_ids[i] are way_refs[offsets[i]:offsets[i + 1]]
+        self.node_ids = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.way_refs = np.zeros(0, dtype=np.int64)
+        self.links = np.zeros(0, dtype=np.int64)
+        # Locations of the indexed nodes in 1e-7 degrees (see NodeStore), filled in pass 2
+        self.lat = np.zeros(0, dtype=np.int32)
+        self.lon = np.zeros(0, dtype=np.int32)
+        # Memory views of the index, they are indexed per node without creating NumPy scalars (about twice as fast)
+        self.offsets_view = memoryview(self.offsets)
+        self.way_refs_view = memoryview(self.way_refs)
+
+    def load(self, input_file: str) -> None:
+        self.index_ways(input_file)
+        self.write_documents(input_file)
+        if self.node_store_directory is not None:
+            self.save_node_store()
+
+    def index_ways(self, input_file: str) -> None:
+        """Pass 1: build the node -> ways index and the way link count of every highway node."""
+        start = time.perf_counter()
+        node_refs = array("q")
+        way_refs = array("q")
+        weights = array("b")  # Way links of a reference, 1 for the ends of a way, 2 inside of it
+        way_count = 0
+        for way in osmium.FileProcessor(input_file, osmium.osm.WAY):
+            if "highway" not in way.tags:
+                continue
+            refs = [node.ref for node in way.nodes]
+            node_refs.extend(refs)
+            way_refs.extend([way.id] * len(refs))
+            weights.extend(IntersectionExtractor.link_weights(len(refs)))
+            way_count += 1
+            if way_count % 100000 == 0:
+                print(f"Indexed {way_count} ways...")
+
+        node_refs = np.frombuffer(node_refs, dtype=np.int64)
+        order = np.argsort(node_refs, kind="stable")  # Stable, the ways of a node stay in file order
+        sorted_refs = node_refs[order]
+        if len(order):
+            starts = np.flatnonzero(np.concatenate([[True], sorted_refs[1:] != sorted_refs[:-1]]))
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+        self.node_ids = sorted_refs[starts]
+        self.offsets = np.append(starts, len(sorted_refs)).astype(np.int64)
+        self.way_refs = np.frombuffer(way_refs, dtype=np.int64)[order]
+        weights = np.frombuffer(weights, dtype=np.int8).astype(np.int64)[order]
+        self.links = np.add.reduceat(weights, starts) if len(order) else np.zeros(0, dtype=np.int64)
+        self.offsets_view = memoryview(self.offsets)
+        self.way_refs_view = memoryview(self.way_refs)
+        self.lat = np.full(len(self.node_ids), MISSING_COORDINATE, dtype=np.int32)
+        self.lon = np.full(len(self.node_ids), MISSING_COORDINATE, dtype=np.int32)
+
+        self.report("Pass 1 (ways)", way_count, "ways", start)
+        print(f"Node -> ways index: {len(self.node_ids)} nodes, {len(self.way_refs)} references")
+
+    def positions(self, node_refs) -> np.ndarray:
+        """
+        Find nodes in the node -> ways index.
+        :param node_refs: Node ids
+        :return: Array of index positions, -1 for nodes not referenced by a highway way
+        """
+        node_refs = np.asarray(node_refs, dtype=np.int64)
+        if len(self.node_ids) == 0:
+            return np.full(len(node_refs), -1)
+        positions = np.minimum(np.searchsorted(self.node_ids, node_refs), len(self.node_ids) - 1)
+        return np.where(self.node_ids[positions] == node_refs, positions, -1)
+
+    def ways_at(self, position: int) -> list[int]:
+        if position < 0:
+            return []
+        return self.way_refs_view[self.offsets_view[position] : self.offsets_view[position + 1]].tolist()
+
+    def write_documents(self, input_file: str) -> None:
+        """Pass 2: write the nodes, the highway ways and the intersections."""
+        start = time.perf_counter()
+        phase_start = start
+        nodes_writer = BulkWriter(self.database["nodes_helper"], self.batch_size, self.queue_size)
+        highways_writer = BulkWriter(self.database["highways_helper"], self.batch_size, self.queue_size)
+        intersections_writer = None
+        if self.save_intersections:
+            intersections_writer = BulkWriter(self.database["intersections"], self.batch_size, self.queue_size)
+        highway_node_tags = {}  # Tags of the tagged highway nodes, embedded into the ways
+
+        node_count = 0
+        way_count = 0
+        cursor = 0  # Nodes of a PBF file are sorted by id, so the index is scanned instead of searched per node
+        node_ids = memoryview(self.node_ids)
+        processor = osmium.FileProcessor(input_file, osmium.osm.NODE | osmium.osm.WAY)
+        for obj in processor.with_locations(self.location_storage):
+            if obj.is_node():
+                if cursor > 0 and cursor <= len(node_ids) and node_ids[cursor - 1] > obj.id:
+                    cursor = int(np.searchsorted(self.node_ids, obj.id))  # Unsorted input
+                while cursor < len(node_ids) and node_ids[cursor] < obj.id:
+                    cursor += 1
+                position = cursor if cursor < len(node_ids) and node_ids[cursor] == obj.id else -1
+                tags = dict(obj.tags)
+                lat, lon = obj.location.lat, obj.location.lon
+                nodes_writer.add(
+                    InsertOne({"ways": self.ways_at(position), "_id": obj.id, "lat": lat, "lon": lon, "tags": tags})
+                )
+                if position >= 0:
+                    self.lat[position] = obj.location.y  # Fixed-point coordinates, as stored by osmium
+                    self.lon[position] = obj.location.x
+                    if tags:
+                        highway_node_tags[obj.id] = tags
+                if (
+                    intersections_writer is not None
+                    and position >= 0
+                    and self.intersection_extractor.is_intersection(int(self.links[position]))
+                ):
+                    intersections_writer.add(IntersectionExtractor.operation(obj.id, lat, lon, tags))
+                node_count += 1
+                if node_count % 1000000 == 0:
+                    print(f"Written {node_count} nodes...")
+            elif obj.is_way() and "highway" in obj.tags:
+                if way_count == 0:
+                    self.report("Pass 2 (nodes)", node_count, "nodes", phase_start)
+                    phase_start = time.perf_counter()
+                nodes = []
+                positions = self.positions([node.ref for node in obj.nodes]).tolist()
+                for node, position in zip(obj.nodes, positions):
+                    if node.location.valid():
+                        nodes.append(
+                            {
+                                "ways": self.ways_at(position),
+                                "_id": node.ref,
+                                "lat": node.location.lat,
+                                "lon": node.location.lon,
+                                "tags": highway_node_tags.get(node.ref, {}),
+                            }
+                        )
+                    else:
+                        nodes.append({"ways": self.ways_at(position)})  # Node missing from the extract
+                tags = {k: v for k, v in dict(obj.tags).items() if k in RELEVANT_TAGS}
+                highways_writer.add(InsertOne({"_id": obj.id, "tags": tags, "nodes": nodes}))
+                way_count += 1
+                if way_count % 100000 == 0:
+                    print(f"Written {way_count} ways...")
+
+        if way_count:
+            self.report("Pass 2 (ways)", way_count, "ways", phase_start)
+        for writer in [nodes_writer, highways_writer, intersections_writer]:
+            if writer is not None:
+                writer.close()
+                print(writer)
+        self.report("Pass 2 (until written)", node_count + way_count, "objects", start)
+
+    def save_node_store(self) -> None:
+        start = time.perf_counter()
+        NodeStore.save(self.node_store_directory, self.node_ids, self.lat, self.lon, self.offsets, self.way_refs)
+        self.report("Node store", len(self.node_ids), "nodes", start)
+
+    @staticmethod
+    def report(phase: str, count: int, unit: str, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        memory = peak_memory_mb()
+        memory_text = f", peak memory {memory:.0f} MB" if memory is not None else ""
+        print(f"{phase}: {count} {unit} in {elapsed:.1f} s ({count / max(elapsed, 1e-9):.0f} {unit}/s){memory_text}")
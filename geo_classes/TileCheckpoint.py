@@ -0,0 +1,61 @@
+import redis
+
+from geo_classes.QuadTreeTiler import Tile
+
+
+class TileCheckpoint:
+    def __init__(self, redis_db: redis.client.Redis, key: str = "tiles"):
+        """
+        Progress of a stage 2 run: a Redis set of finished tile ids and a hash of failed tile ids with their number of
+        failed attempts. The state is kept until a run finishes without failures, so a restarted run only queries the
+        missing and failed tiles.
+        :param redis_db: Redis client storing the progress
+        :param key: Prefix of the Redis keys
+        """
+        self.redis_db = redis_db
+        self.done_key = f"{key}:done"
+        self.failed_key = f"{key}:failed"
+
+    def done(self, tiles: list[Tile]) -> list[bool]:
+        """
+        Check which tiles are finished. A tile also counts as finished when one of its ancestors was finished before
+        the ancestor got split.
+        :param tiles: Tiles to check
+        :return: List of booleans, in the order of tiles
+        """
+        pipeline = self.redis_db.pipeline(transaction=False)
+        for tile in tiles:
+            parts = tile.id.split("/")
+            pipeline.smismember(self.done_key, ["/".join(parts[:i]) for i in range(1, len(parts) + 1)])
+        return [any(result) for result in pipeline.execute()]
+
+    def mark_done(self, tile: Tile) -> None:
+        pipeline = self.redis_db.pipeline(transaction=False)
+        pipeline.sadd(self.done_key, tile.id)
+        pipeline.hdel(self.failed_key, tile.id)
+        pipeline.execute()
+
+    def mark_failed(self, tile: Tile) -> int:
+        """
+        Count a failed attempt of a tile.
+        :param tile: Failed tile
+        :return: Number of failed attempts of the tile, over all runs
+        """
+        return self.redis_db.hincrby(self.failed_key, tile.id, 1)
+
+    def failed(self) -> dict[str, int]:
+        return {key.decode(): int(value) for key, value in self.redis_db.hgetall(self.failed_key).items()}
+
+    def clear(self) -> None:
+        """Forget the progress, the next run queries all tiles again."""
+        self.redis_db.delete(self.done_key, self.failed_key)
+
+    def summary(self, tiles: list[Tile]) -> str:
+        """
+        Summarize the progress of a run.
+        :param tiles: All tiles of the run
+        :return: Number of finished, remaining and failed tiles
+        """
+        done = sum(self.done(tiles))
+        failed = self.failed()
+        return f"Tiles: {done} done, {len(tiles) - done} remaining, {len(failed)} failed"
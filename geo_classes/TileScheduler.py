@@ -0,0 +1,66 @@
+import multiprocessing
+import queue
+import time
+from typing import Callable
+
+
+class TileScheduler:
+    def __init__(self, tiles: list[dict], processes: int):
+        """
+        Runs grid tiles on one long-lived worker pool. Waiting tiles are ordered by their estimated cost (most
+        expensive first, so a slow tile does not start last), a tile starts as soon as a worker is free and none of
+        its 8 neighbouring tiles is running. Neighbouring tiles never run at the same time, like with the colour
+        classes of MapBoundaries.generate_grid_queries(), but without waiting for a whole colour to finish.
+        :param tiles: List of {"cell": (row, column), "query": worker argument, "cost": estimated cost}
+        :param processes: Number of worker processes
+        """
+        self.tiles = tiles
+        self.processes = processes
+
+    @staticmethod
+    def neighbours(cell: tuple[int, int], other: tuple[int, int]) -> bool:
+        return abs(cell[0] - other[0]) <= 1 and abs(cell[1] - other[1]) <= 1
+
+    def startable(self, cell: tuple[int, int], running: set) -> bool:
+        return not any(self.neighbours(cell, other) for other in running)
+
+    def run(self, worker: Callable[[dict], None]) -> list[tuple[int, int]]:
+        """
+        Process all tiles.
+        :param worker: Function processing the query of one tile, must be picklable
+        :return: Cells of the failed tiles
+        """
+        pending = sorted(self.tiles, key=lambda tile: tile["cost"], reverse=True)
+        running = set()
+        finished = queue.Queue()  # (cell, error) from the result handler thread of the pool
+        failed = []
+        total = len(pending)
+        start = time.perf_counter()
+
+        with multiprocessing.Pool(processes=self.processes) as pool:
+            while pending or running:
+                for tile in list(pending):
+                    if len(running) >= self.processes:
+                        break
+                    if not self.startable(tile["cell"], running):
+                        continue
+                    pending.remove(tile)
+                    running.add(tile["cell"])
+                    pool.apply_async(
+                        worker,
+                        (tile["query"],),
+                        callback=lambda _, cell=tile["cell"]: finished.put((cell, None)),
+                        error_callback=lambda error, cell=tile["cell"]: finished.put((cell, error)),
+                    )
+
+                cell, error = finished.get()
+                running.discard(cell)
+                if error is not None:
+                    print(f"Tile {cell} failed: {error!r}")
+                    failed.append(cell)
+                done = total - len(pending) - len(running)
+                print(
+                    f"Tiles: {done}/{total} done, {len(running)} running, {len(failed)} failed "
+                    f"({time.perf_counter() - start:.0f} s)"
+                )
+        return failed
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from typing import Callable
+
+from pymongo.collection import Collection
+
+# Fields of highways_helper read by Pathway.generate, the way IDs of the embedded nodes are left out
+WAY_PROJECTION = {"tags": 1, "nodes._id": 1, "nodes.lat": 1, "nodes.lon": 1, "nodes.tags": 1}
+
+
+class WayCache:
+    def __init__(self, parse: Callable[[dict], object], size: int = 20000, projection: dict | None = None):
+        """
+        In-process LRU cache of parsed highways_helper ways. A long way passes through many intersections of a tile,
+        with the cache it is read and parsed once instead of once per intersection. Misses of a lookup are read with
+        a single $in query.
+        :param parse: Turns a highways_helper document into the cached way object
+        :param size: Maximum number of cached ways
+        :param projection: Projection of the highways_helper queries
+        """
+        self.parse = parse
+        self.size = size
+        self.projection = WAY_PROJECTION if projection is None else projection
+        self.ways = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, collection: Collection, way_ids: list[int]) -> list:
+        """
+        Get parsed ways.
+        :param collection: The highways_helper collection, read on cache misses
+        :param way_ids: Way IDs
+        :return: List of parsed ways in the order of way_ids, ways missing from the collection are left out
+        """
+        found = {}
+        missing = []
+        for way_id in dict.fromkeys(way_ids):
+            if way_id in self.ways:
+                self.ways.move_to_end(way_id)
+                found[way_id] = self.ways[way_id]
+                self.hits += 1
+            else:
+                missing.append(way_id)
+
+        if missing:
+            self.misses += len(missing)
+            fetched = {}
+            for document in collection.find({"_id": {"$in": missing}}, self.projection):
+                way_id = document["_id"]  # Read first, parse may rename the field
+                fetched[way_id] = self.parse(document)
+            self.ways.update(fetched)
+            found.update(fetched)
+            while len(self.ways) > self.size:
+                self.ways.popitem(last=False)
+
+        return [found[way_id] for way_id in way_ids if way_id in found]
+
+    def clear(self) -> None:
+        """Forget the cached ways, e.g. after highways_helper was updated."""
+        self.ways.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.ways),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __str__(self):
+        stats = self.stats()
+        return (
+            f"Way cache: {stats['size']} ways, {stats['hits']} hits, {stats['misses']} misses, "
+            f"hit rate {stats['hit_rate']:.2%}"
+        )
@@ -1,6 +1,8 @@
 import numpy as np
 from bson import ObjectId
 
+from graph.PathwayHelpers.PathMetrics import turn_angles
+
 
 class IntersectionPathway:
     def __init__(
@@ -61,42 +63,8 @@ class IntersectionPathway:
         self.car_access = car_access
         self.valid = valid
 
-    def latlon_to_cartesian(self, lat, lon):
-        R = 6371  # Earth radius in kilometers
-        phi = np.radians(float(lat))
-        theta = np.radians(float(lon))
-
-        x = R * np.cos(phi) * np.cos(theta)
-        y = R * np.cos(phi) * np.sin(theta)
-        z = R * np.sin(phi)
-
-        return np.array([x, y, z])
-
-    # Function to calculate the angle between three points using the dot product
-    def calculate_angle(self, p1, p2, p3):
-        try:
-            v1 = p2 - p1
-            v2 = p3 - p2
-            dot_product = np.dot(v1, v2)
-            norm_product = np.linalg.norm(v1) * np.linalg.norm(v2)
-            cos_angle = dot_product / norm_product
-            cos_angle = np.clip(cos_angle, -1.0, 1.0)
-            angle = np.arccos(cos_angle)
-        except Exception:
-            print("Error calculating angle")
-
-        return np.degrees(angle)
-
     def calculate_curviness(self, nodes):
-        # map nodes array into lat lon touples
-        nodes_map = [(node["lat"], node["lon"]) for node in nodes]
-
-        cartesian_nodes = [self.latlon_to_cartesian(lat, lon) for lat, lon in nodes_map]
-
-        # Calculate angles and sum them
-        angle = sum(
-            self.calculate_angle(cartesian_nodes[i], cartesian_nodes[i + 1], cartesian_nodes[i + 2])
-            for i in range(len(cartesian_nodes) - 2)
-        )
+        lats = np.array([float(node["lat"]) for node in nodes])
+        lons = np.array([float(node["lon"]) for node in nodes])
 
-        self.total_angle = angle
+        self.total_angle = float(turn_angles(lats, lons).sum())
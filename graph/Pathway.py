@@ -2,11 +2,11 @@ from __future__ import annotations
 
 import numpy as np
 import overpy
-from sport_activities_features.overpy_node_manipulation import OverpyNodesReader
 
 from graph.PathwayHelpers.HillAscent import HillAscentContainer
-from setup.Constants import OPEN_ELEVATION_API_URL
-import time
+from graph.PathwayHelpers.PathMetrics import path_metrics, turn_angles
+from graph.PathwayHelpers.SegmentMemo import SegmentMemo
+from setup.GeoConnector import GeoConnector
 
 
 class Pathway:
@@ -28,6 +28,7 @@ class Pathway:
         bicycle_access: bool | None = True,
         foot_access: bool | None = True,
         car_access: bool | None = True,
+        way_ids: set[int] | None = None,
     ):
         self.traffic_lights = traffic_lights
         self.intersection_a = intersection_a
@@ -47,6 +48,7 @@ class Pathway:
         self.bicycle_access = bicycle_access
         self.foot_access = foot_access
         self.car_access = car_access
+        self.way_ids = set(way_ids or [])  # OSM ways the pathway is derived from, see IncrementalUpdater
 
     def road_type_check_access(self, way: overpy.Way):
         highway_type = way.tags.get("highway")
@@ -140,39 +142,47 @@ class Pathway:
             self.bicycle_access = False
             self.foot_access = False
 
-    def generate(self, nodes, path_type=None, surface_type=None, way: overpy.Way = None):
-        reader = OverpyNodesReader(open_elevation_api=OPEN_ELEVATION_API_URL)
-
+    def generate(
+        self,
+        nodes,
+        path_type=None,
+        surface_type=None,
+        way: overpy.Way = None,
+        memo: SegmentMemo = None,
+        altitudes=None,
+    ):
+        """
+        Compute the pathway along the nodes of a way.
+        :param nodes: Nodes of the pathway, in way order
+        :param path_type: Highway type
+        :param surface_type: Surface type
+        :param way: Way of the nodes, its tags set the direction and access
+        :param memo: Segment memo reused for segments computed before (needs way), None to always compute
+        :param altitudes: Elevations of the nodes fetched in advance, None to fetch them from the elevation provider
+        """
         if way is not None:
             if way.tags.get("oneway") == "yes":
                 self.backward = False
             self.road_type_check_access(way)
             self.tag_type_check_access(way)
+            self.way_ids = {way.id}
             # Vehicle check
 
-        while True:
-            try:
-                reader_nodes = reader.read_nodes(nodes)
-            except Exception as e:
-                print(e)
-                print("reader_nodes = reader.read_nodes(nodes)")
-                time.sleep(2)
-            else:
-                break
-        while True:
-            try:
-                self.total_ascent = self.calculate_ascent(reader_nodes["altitudes"])
-                self.total_descent = self.calculate_descent(reader_nodes["altitudes"])
-
-            except Exception as e:
-                print(e)
-                print("hill_identificator.identify_hills()")
-                time.sleep(2)
-            else:
-                break
-        self.distance = reader_nodes["total_distance"]
-
-        self.calculate_curviness(nodes)
+        metrics = memo.get(nodes, way.id) if memo is not None and way is not None else None
+        if metrics is None:
+            lats = [float(node.lat) for node in nodes]
+            lons = [float(node.lon) for node in nodes]
+            if altitudes is None:
+                # The providers retry on their own, failures are raised to the caller
+                altitudes = GeoConnector.elevation_provider().elevations(lats, lons)
+            metrics = path_metrics(lats, lons, altitudes)
+            if memo is not None and way is not None:
+                memo.set(nodes, way.id, metrics)
+        self.total_ascent = metrics.ascent
+        self.total_descent = metrics.descent
+        self.distance = metrics.distance
+        self.total_angle = metrics.total_angle
+        self.curviness = metrics.curviness
 
         # Traffic lights count
         if len(nodes) > 2:
@@ -181,7 +191,7 @@ class Pathway:
             self.traffic_lights = 0
 
         hills = HillAscentContainer()
-        hills.add_to_ascent(reader_nodes["distances"], reader_nodes["altitudes"])
+        hills.add_buckets(metrics.hill_buckets)
         self.hill_ascent_container = hills
 
         self.intersection_a = nodes[0]
@@ -205,53 +215,15 @@ class Pathway:
         return 0
 
     def calculate_ascent(self, altitudes):
-        ascent = 0
-        for i in range(1, len(altitudes)):
-            if altitudes[i] > altitudes[i - 1]:
-                ascent += altitudes[i] - altitudes[i - 1]
-        return ascent
+        return float(np.maximum(np.diff(np.asarray(altitudes, dtype=float)), 0).sum())
 
     def calculate_descent(self, altitudes):
-        descent = 0
-        for i in range(1, len(altitudes)):
-            if altitudes[i] < altitudes[i - 1]:
-                descent += altitudes[i - 1] - altitudes[i]
-        return descent
-
-    def latlon_to_cartesian(self, lat, lon):
-        R = 6371  # Earth radius in kilometers
-        phi = np.radians(float(lat))
-        theta = np.radians(float(lon))
-
-        x = R * np.cos(phi) * np.cos(theta)
-        y = R * np.cos(phi) * np.sin(theta)
-        z = R * np.sin(phi)
-
-        return np.array([x, y, z])
-
-    # Function to calculate the angle between three points using the dot product
-    def calculate_angle(self, p1, p2, p3):
-        v1 = p2 - p1
-        v2 = p3 - p2
-        dot_product = np.dot(v1, v2)
-        norm_product = np.linalg.norm(v1) * np.linalg.norm(v2)
-        cos_angle = dot_product / norm_product
-        cos_angle = np.clip(cos_angle, -1.0, 1.0)
-        angle = np.arccos(cos_angle)
-
-        return np.degrees(angle)
+        return float(np.maximum(-np.diff(np.asarray(altitudes, dtype=float)), 0).sum())
 
     def calculate_curviness(self, nodes):
-        # map nodes array into lat lon touples
-        nodes_map = [(node.lat, node.lon) for node in nodes]
-
-        cartesian_nodes = [self.latlon_to_cartesian(lat, lon) for lat, lon in nodes_map]
-
-        # Calculate angles and sum them
-        angle = sum(
-            self.calculate_angle(cartesian_nodes[i], cartesian_nodes[i + 1], cartesian_nodes[i + 2])
-            for i in range(len(cartesian_nodes) - 2)
-        )
+        lats = np.array([float(node.lat) for node in nodes])
+        lons = np.array([float(node.lon) for node in nodes])
+        angle = float(turn_angles(lats, lons).sum())
 
         self.total_angle = angle
         self.curviness = angle / self.distance
@@ -287,6 +259,7 @@ class Pathway:
             "bicycle_access": self.bicycle_access,
             "foot_access": self.foot_access,
             "car_access": self.car_access,
+            "way_ids": sorted(self.way_ids),
         }
 
         # Create backward relationship object
@@ -313,6 +286,7 @@ class Pathway:
             "bicycle_access": self.bicycle_access,
             "foot_access": self.foot_access,
             "car_access": self.car_access,
+            "way_ids": sorted(self.way_ids),
         }
 
         return [relationship_a, relationship_b]
@@ -335,6 +309,7 @@ class Pathway:
             nodes_list=self.nodes_list.copy(),
             traffic_lights=self.traffic_lights,
             total_angle=self.total_angle,
+            way_ids=self.way_ids | second.way_ids,
         )
 
         # Always same
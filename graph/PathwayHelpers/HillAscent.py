@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import numpy as np
+
+from graph.PathwayHelpers.PathMetrics import hill_buckets
+
 
 class HillAscent:
     def __init__(
@@ -82,33 +86,26 @@ class HillAscentContainer:
         """
 
         # Calculate gradient for each pair of points [0,1], [1,2], [2,3], ...
-        for i in range(len(altitudes) - 1):
-            altitude = altitudes[i + 1] - altitudes[i]
-            distance = distances[i + 1] - distances[i]
-            gradient = altitude / distance if distance != 0 else 0
-            if gradient < -0.15:
-                self.backward.extremely_steep_climb += distance
-            elif gradient < -0.09:
-                self.backward.steep_climb += distance
-            elif gradient < -0.06:
-                self.backward.challenging_climb += distance
-            elif gradient < -0.03:
-                self.backward.moderate_climb += distance
-            elif gradient < -0.01:
-                self.backward.gentle_climb += distance
-            elif gradient < 0.01:
-                self.forward.flat_terrain += distance
-                self.backward.flat_terrain += distance
-            elif gradient < 0.03:
-                self.forward.gentle_climb += distance
-            elif gradient < 0.06:
-                self.forward.moderate_climb += distance
-            elif gradient < 0.09:
-                self.forward.challenging_climb += distance
-            elif gradient < 0.15:
-                self.forward.steep_climb += distance
-            else:
-                self.forward.extremely_steep_climb += distance
+        self.add_buckets(hill_buckets(np.diff(distances), np.diff(altitudes)))
+
+    def add_buckets(self, buckets):
+        """
+        Adds distances already summed by hill category (see PathMetrics.hill_buckets).
+        :param buckets: distances of the 11 gradient buckets, from backward extremely steep to forward extremely steep
+        :return: None
+        """
+        self.backward.extremely_steep_climb += float(buckets[0])
+        self.backward.steep_climb += float(buckets[1])
+        self.backward.challenging_climb += float(buckets[2])
+        self.backward.moderate_climb += float(buckets[3])
+        self.backward.gentle_climb += float(buckets[4])
+        self.forward.flat_terrain += float(buckets[5])
+        self.backward.flat_terrain += float(buckets[5])
+        self.forward.gentle_climb += float(buckets[6])
+        self.forward.moderate_climb += float(buckets[7])
+        self.forward.challenging_climb += float(buckets[8])
+        self.forward.steep_climb += float(buckets[9])
+        self.forward.extremely_steep_climb += float(buckets[10])
 
     def __add__(self, other: HillAscentContainer):
         return HillAscentContainer(
@@ -0,0 +1,145 @@
+from collections import namedtuple
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # Mean earth radius in meters
+
+# Gradient bin edges of the hill categories, see HillAscentContainer.add_to_ascent(). np.digitize maps a gradient to
+# 0 (backward extremely steep) ... 5 (flat) ... 10 (forward extremely steep)
+HILL_GRADIENT_BINS = np.array([-0.15, -0.09, -0.06, -0.03, -0.01, 0.01, 0.03, 0.06, 0.09, 0.15])
+HILL_BUCKETS = len(HILL_GRADIENT_BINS) + 1
+
+PathMetrics = namedtuple(
+    "PathMetrics", ["distance", "ascent", "descent", "total_angle", "curviness", "hill_buckets", "distances"]
+)
+
+
+def haversine_distances(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Great circle distances between consecutive points.
+    :param lats: Latitudes in degrees
+    :param lons: Longitudes in degrees
+    :return: Array of len(lats) - 1 distances in meters
+    """
+    phi = np.radians(lats)
+    lam = np.radians(lons)
+    a = np.sin(np.diff(phi) / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(np.diff(lam) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def turn_angles(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Angles (in degrees) between consecutive segments, computed on cartesian coordinates of the points.
+    :param lats: Latitudes in degrees
+    :param lons: Longitudes in degrees
+    :return: Array of len(lats) - 2 angles, 0 where a segment has zero length
+    """
+    phi = np.radians(lats)
+    theta = np.radians(lons)
+    points = np.stack([np.cos(phi) * np.cos(theta), np.cos(phi) * np.sin(theta), np.sin(phi)], axis=1)
+    vectors = np.diff(points, axis=0)
+    v1 = vectors[:-1]
+    v2 = vectors[1:]
+    norm_product = np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1)
+    dot_product = np.einsum("ij,ij->i", v1, v2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_angle = np.where(norm_product > 0, dot_product / norm_product, 1.0)
+    return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+
+def hill_buckets(distances: np.ndarray, altitude_differences: np.ndarray) -> np.ndarray:
+    """
+    Sum the segment distances into hill categories by gradient.
+    :param distances: Segment distances
+    :param altitude_differences: Segment altitude differences
+    :return: Array of HILL_BUCKETS distances, ordered like HILL_GRADIENT_BINS
+    """
+    return np.bincount(hill_bucket_indices(distances, altitude_differences), weights=distances, minlength=HILL_BUCKETS)
+
+
+def hill_bucket_indices(distances: np.ndarray, altitude_differences: np.ndarray) -> np.ndarray:
+    """
+    Classify segments into hill categories by gradient, segments of zero length count as flat.
+    :param distances: Segment distances
+    :param altitude_differences: Segment altitude differences
+    :return: Array of bucket indices, see HILL_GRADIENT_BINS
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gradients = np.where(distances != 0, altitude_differences / distances, 0.0)
+    return np.digitize(gradients, HILL_GRADIENT_BINS)
+
+
+def _valid_indices(indices: np.ndarray, length: int) -> np.ndarray:
+    return indices[(indices >= 0) & (indices < length)]
+
+
+def batch_path_metrics(lats, lons, altitudes, offsets) -> list[PathMetrics]:
+    """
+    Compute the metrics of many paths at once. The paths are passed as ragged arrays, path i consists of the points
+    offsets[i]:offsets[i + 1] of the coordinate arrays.
+    :param lats: Latitudes of all paths
+    :param lons: Longitudes of all paths
+    :param altitudes: Altitudes of all paths
+    :param offsets: Array of len(paths) + 1 start offsets
+    :return: List of PathMetrics, one per path
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    altitudes = np.asarray(altitudes, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    paths = len(offsets) - 1
+    counts = np.diff(offsets)
+
+    # Segments (and angles) crossing the border of two paths are computed, but dropped by the masks below
+    segment_mask = np.ones(max(len(lats) - 1, 0), dtype=bool)
+    segment_mask[_valid_indices(offsets[1:-1] - 1, len(segment_mask))] = False
+    segment_paths = np.repeat(np.arange(paths), np.maximum(counts - 1, 0))
+
+    altitude_differences = np.diff(altitudes)[segment_mask]
+    flat_distances = haversine_distances(lats, lons)[segment_mask]
+    distances = np.sqrt(flat_distances**2 + altitude_differences**2)
+
+    angle_mask = np.ones(max(len(lats) - 2, 0), dtype=bool)
+    angle_mask[_valid_indices(np.concatenate([offsets[1:-1] - 1, offsets[1:-1] - 2]), len(angle_mask))] = False
+    angle_paths = np.repeat(np.arange(paths), np.maximum(counts - 2, 0))
+    angles = turn_angles(lats, lons)[angle_mask] if len(lats) > 2 else np.zeros(0)
+
+    total_distances = np.bincount(segment_paths, weights=distances, minlength=paths)
+    ascents = np.bincount(segment_paths, weights=np.maximum(altitude_differences, 0), minlength=paths)
+    descents = np.bincount(segment_paths, weights=np.maximum(-altitude_differences, 0), minlength=paths)
+    total_angles = np.bincount(angle_paths, weights=angles, minlength=paths)
+
+    buckets = np.bincount(
+        segment_paths * HILL_BUCKETS + hill_bucket_indices(distances, altitude_differences),
+        weights=distances,
+        minlength=paths * HILL_BUCKETS,
+    ).reshape(paths, HILL_BUCKETS)
+
+    segment_offsets = offsets[:-1] - np.arange(paths)
+    metrics = []
+    for i in range(paths):
+        distance = float(total_distances[i])
+        path_distances = distances[segment_offsets[i] : segment_offsets[i] + max(counts[i] - 1, 0)]
+        metrics.append(
+            PathMetrics(
+                distance=distance,
+                ascent=float(ascents[i]),
+                descent=float(descents[i]),
+                total_angle=float(total_angles[i]),
+                curviness=float(total_angles[i]) / distance if distance != 0 else 0.0,
+                hill_buckets=buckets[i],
+                distances=np.concatenate([[0.0], np.cumsum(path_distances)]),
+            )
+        )
+    return metrics
+
+
+def path_metrics(lats, lons, altitudes) -> PathMetrics:
+    """
+    Compute distance, ascent, descent, total angle, curviness and hill categories of a single path.
+    :param lats: Latitudes in degrees
+    :param lons: Longitudes in degrees
+    :param altitudes: Altitudes in meters
+    :return: PathMetrics
+    """
+    return batch_path_metrics(lats, lons, altitudes, [0, len(lats)])[0]
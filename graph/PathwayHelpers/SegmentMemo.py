@@ -0,0 +1,181 @@
+from collections import OrderedDict
+
+import msgpack
+import redis
+
+from graph.PathwayHelpers.PathMetrics import PathMetrics
+
+
+class RedisSegmentStore:
+    def __init__(self, redis_db: redis.client.Redis, key: str = "segments"):
+        """
+        Persistent segment memo tier, stored as one Redis hash per way (fields "first:last" node ID), so the segments
+        of a changed way are forgotten by deleting a single key.
+        :param redis_db: Redis client
+        :param key: Prefix of the hashes
+        """
+        self.redis_db = redis_db
+        self.key = key
+
+    def get(self, way_id: int, field: str) -> bytes | None:
+        return self.redis_db.hget(f"{self.key}:{way_id}", field)
+
+    def set(self, way_id: int, field: str, value: bytes):
+        self.redis_db.hset(f"{self.key}:{way_id}", field, value)
+
+    def forget(self, way_ids: list[int]):
+        if way_ids:
+            self.redis_db.delete(*[f"{self.key}:{way_id}" for way_id in way_ids])
+
+    def clear(self, batch_size: int = 10000):
+        keys = []
+        for key in self.redis_db.scan_iter(match=f"{self.key}:*", count=batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                self.redis_db.delete(*keys)
+                keys = []
+        if keys:
+            self.redis_db.delete(*keys)
+
+
+class SegmentMemo:
+    def __init__(self, store=None, size: int = 100000):
+        """
+        Memo of the metrics of way segments (the nodes of one way between two intersections). Stage 4 reaches every
+        segment from both of its ends, with the same nodes in way order, so the elevation lookup and the metrics of
+        the second visit come from the memo. Entries are keyed by the canonical (min endpoint, max endpoint, way ID)
+        and checked against a checksum of the node IDs and coordinates, so segments of closed ways sharing both
+        endpoints and moved nodes are computed again. Only the metrics are kept, the tags of the way are always read
+        from the live way.
+        :param store: Persistent tier shared by the workers (RedisSegmentStore), None for the in-process tier only
+        :param size: Maximum number of entries of the in-process tier
+        """
+        self.store = store
+        self.size = size
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(nodes, way_id: int) -> tuple[int, int, int]:
+        first, last = nodes[0].id, nodes[-1].id
+        return min(first, last), max(first, last), way_id
+
+    @staticmethod
+    def checksum(nodes) -> int:
+        # Hashes of ints and floats do not depend on PYTHONHASHSEED, so all workers agree on the checksum
+        return hash(tuple((node.id, float(node.lat), float(node.lon)) for node in nodes))
+
+    def get(self, nodes, way_id: int) -> PathMetrics | None:
+        """
+        Look up the metrics of a segment.
+        :param nodes: Nodes of the segment, in way order
+        :param way_id: ID of the way
+        :return: PathMetrics (without the cumulative distances), None on a miss
+        """
+        key = self.key(nodes, way_id)
+        checksum = self.checksum(nodes)
+        value = self.memory.get(key)
+        if value is not None and value[0] == checksum:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+        elif self.store is not None:
+            stored = self.store.get(way_id, f"{key[0]}:{key[1]}")
+            value = msgpack.unpackb(stored) if stored is not None else None
+            if value is not None and value[0] == checksum:
+                self.remember(key, value)
+                self.store_hits += 1
+            else:
+                value = None
+        else:
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+        return PathMetrics(*value[1:6], hill_buckets=value[6], distances=None)
+
+    def contains(self, nodes, way_id: int) -> bool:
+        """
+        Check if the metrics of a segment are memoized, without counting a hit or miss. Segments found in the
+        persistent tier are kept in the in-process tier, so the following get() does not read them again.
+        :param nodes: Nodes of the segment, in way order
+        :param way_id: ID of the way
+        :return: True if get() would return the metrics
+        """
+        key = self.key(nodes, way_id)
+        checksum = self.checksum(nodes)
+        value = self.memory.get(key)
+        if value is not None and value[0] == checksum:
+            return True
+        if self.store is None:
+            return False
+        stored = self.store.get(way_id, f"{key[0]}:{key[1]}")
+        value = msgpack.unpackb(stored) if stored is not None else None
+        if value is None or value[0] != checksum:
+            return False
+        self.remember(key, value)
+        return True
+
+    def set(self, nodes, way_id: int, metrics: PathMetrics):
+        """
+        Remember the metrics of a segment.
+        :param nodes: Nodes of the segment, in way order
+        :param way_id: ID of the way
+        :param metrics: Metrics computed for the nodes
+        """
+        key = self.key(nodes, way_id)
+        value = [
+            self.checksum(nodes),
+            float(metrics.distance),
+            float(metrics.ascent),
+            float(metrics.descent),
+            float(metrics.total_angle),
+            float(metrics.curviness),
+            [float(bucket) for bucket in metrics.hill_buckets],
+        ]
+        self.remember(key, value)
+        if self.store is not None:
+            self.store.set(way_id, f"{key[0]}:{key[1]}", msgpack.packb(value))
+
+    def remember(self, key: tuple, value: list):
+        self.memory[key] = value
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def forget(self, way_ids) -> None:
+        """
+        Forget the segments of the given ways, e.g. after they were changed.
+        :param way_ids: Way IDs
+        """
+        way_ids = set(way_ids)
+        for key in [key for key in self.memory if key[2] in way_ids]:
+            del self.memory[key]
+        if self.store is not None:
+            self.store.forget(list(way_ids))
+
+    def clear(self) -> None:
+        """
+        Forget all segments, including the persistent tier. The checksum only covers the nodes, so the elevations of
+        an earlier run (e.g. with another ELEVATION_BACKEND or DEM) would otherwise be reused.
+        """
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.store_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.store_hits) / lookups if lookups else 0.0,
+        }
+
+    def __str__(self):
+        stats = self.stats()
+        return (
+            f"Segment memo: {stats['memory_hits']} memory hits, {stats['store_hits']} persistent hits, "
+            f"{stats['misses']} misses, hit rate {stats['hit_rate']:.2%}"
+        )
@@ -0,0 +1,14 @@
+from itertools import islice
+
+
+# chunk an iterable (e.g. a cursor) into lists of size n
+def batched(iterable, n: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, n)):
+        yield batch
+
+
+# chunk into sizes of n
+def chunks(array: list, n: int):
+    for i in range(0, len(array), n):
+        yield array[i : i + n]
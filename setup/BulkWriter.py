@@ -0,0 +1,75 @@
+import queue
+import threading
+
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+
+class BulkWriter:
+    def __init__(self, collection: Collection, batch_size: int = 10000, queue_size: int = 4):
+        """
+        Writes pymongo operations (InsertOne, UpdateOne, ...) in unordered bulk writes from a background thread, so
+        the producer keeps parsing while the previous batches are sent. At most queue_size full batches wait for the
+        writer, add() blocks when the queue is full, which bounds the memory used by pending documents.
+        Duplicate key errors (documents of an earlier, interrupted run) are counted and ignored.
+        :param collection: Target collection
+        :param batch_size: Number of operations per bulk write
+        :param queue_size: Number of batches waiting for the writer thread
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.batch = []
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.inserted = 0
+        self.upserted = 0
+        self.duplicates = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.write_batches, daemon=True)
+        self.thread.start()
+
+    def add(self, operation) -> None:
+        self.batch.append(operation)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.error is not None:
+            raise self.error
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def close(self) -> None:
+        """Send the remaining operations and wait for the writer thread."""
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def write_batches(self) -> None:
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                continue  # Keep draining the queue, so the producer does not block on a failed writer
+            try:
+                result = self.collection.bulk_write(batch, ordered=False)
+                self.inserted += result.inserted_count
+                self.upserted += result.upserted_count
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                self.inserted += e.details.get("nInserted", 0)
+                self.upserted += e.details.get("nUpserted", 0)
+                self.duplicates += sum(1 for error in errors if error.get("code") == 11000)
+                if any(error.get("code") != 11000 for error in errors):
+                    self.error = e
+            except Exception as e:
+                self.error = e
+
+    def __str__(self):
+        return (
+            f"{self.collection.name}: {self.inserted} inserted, {self.upserted} upserted, "
+            f"{self.duplicates} already existing"
+        )
@@ -0,0 +1,101 @@
+import math
+
+from pymongo.collection import Collection
+
+
+class CollectionPartitioner:
+    def __init__(self, collection: Collection, query: dict | None = None, batch_size: int = 1000, method="bucket"):
+        """
+        Splits a collection into contiguous _id ranges of roughly batch_size documents, so workers can read their
+        batch with an indexed range query instead of skip / limit.
+        :param collection: The collection to split
+        :param query: Filter of the documents to process
+        :param batch_size: Approximate number of documents per range
+        :param method: "bucket" computes exact boundaries with $bucketAuto, "sample" estimates them from a $sample of
+        the collection (cheaper on very large collections)
+        """
+        self.collection = collection
+        self.query = query or {}
+        self.batch_size = batch_size
+        self.method = method
+
+    def split_points(self) -> list:
+        """
+        Compute the _id values at which the ranges are split.
+        :return: Sorted list of split points
+        """
+        count = self.collection.count_documents(self.query)
+        buckets = math.ceil(count / self.batch_size)
+        if buckets <= 1:
+            return []
+
+        if self.method == "sample":
+            oversampling = 10
+            sample = self.collection.aggregate(
+                [
+                    {"$match": self.query},
+                    {"$sample": {"size": min(count, buckets * oversampling)}},
+                    {"$project": {"_id": 1}},
+                    {"$sort": {"_id": 1}},
+                ],
+                allowDiskUse=True,
+            )
+            ids = [doc["_id"] for doc in sample]
+            step = len(ids) / buckets
+            return sorted(set(ids[int(i * step)] for i in range(1, buckets)))
+
+        result = self.collection.aggregate(
+            [
+                {"$match": self.query},
+                {"$bucketAuto": {"groupBy": "$_id", "buckets": buckets}},
+                {"$sort": {"_id.min": 1}},
+            ],
+            allowDiskUse=True,
+        )
+        return [bucket["_id"]["min"] for bucket in result][1:]
+
+    def partitions(self) -> list[dict]:
+        """
+        Generate one filter per range. The first and last range are open ended, so documents inserted while the
+        ranges are processed are still assigned to exactly one range.
+        :return: List of filters in the form {"$and": [query, {"_id": {"$gte": a, "$lt": b}}]}
+        """
+        split_points = self.split_points()
+        bounds = [None, *split_points, None]
+        partitions = []
+        for lower, upper in zip(bounds, bounds[1:]):
+            id_range = {}
+            if lower is not None:
+                id_range["$gte"] = lower
+            if upper is not None:
+                id_range["$lt"] = upper
+            partitions.append(self.range_query(id_range))
+        return partitions
+
+    def stream_ranges(self):
+        """
+        Generate the same range filters as partitions() while reading the _id values of a single sorted cursor, so
+        the first ranges are handed to the workers before the collection has been read and no split points are
+        kept in memory.
+        :return: Generator of filters in the form {"$and": [query, {"_id": {"$gte": a, "$lt": b}}]}
+        """
+        cursor = self.collection.find(self.query, {"_id": 1}, batch_size=self.batch_size).sort("_id", 1)
+        lower = None
+        try:
+            for i, document in enumerate(cursor):
+                if i > 0 and i % self.batch_size == 0:
+                    id_range = {"$lt": document["_id"]}
+                    if lower is not None:
+                        id_range["$gte"] = lower
+                    yield self.range_query(id_range)
+                    lower = document["_id"]
+        finally:
+            cursor.close()
+        yield self.range_query({"$gte": lower} if lower is not None else {})
+
+    def range_query(self, id_range: dict) -> dict:
+        if not id_range:
+            return self.query
+        if not self.query:
+            return {"_id": id_range}
+        return {"$and": [self.query, {"_id": id_range}]}
@@ -16,14 +16,82 @@ MONGO_DB_PORT = 27018
 MONGO_DB_USERNAME = "MONGOPASSWORD"
 MONGO_DB_PASSWORD = "MONGOPASSWORD"
 
+# Maximum number of pooled connections of each process to the databases (clients are shared within a process)
+REDIS_DB_MAX_CONNECTIONS = 16
+MONGO_DB_MAX_POOL_SIZE = 16
+NEO4J_DB_MAX_POOL_SIZE = 4
+
 # WHOLE SLOVENIA
 MAXIMUM_LATITUDE = 46.9
 MINIMUM_LATITUDE = 45.4
 MAXIMUM_LONGITUDE = 16.6
 MINIMUM_LONGITUDE = 13.6
 
+# Optional polygon (.poly file, e.g. a country border from Geofabrik) the prune step clips to instead of the bounding
+# box above. Highways crossing the border are kept complete
+MAP_POLYGON_FILE = None
+
 # If you want the process to run on multiple cores, set MULTI to True else set it to False
 MULTI = True
 
+# Sorted intersection ID index used by the connection parser (memory-mapped by all worker processes)
+INTERSECTION_INDEX_FILE = "data/intersection_index.npy"
+
+# Engine used for generating paths: "recursive" searches outward from every intersection (ConnectionMongoParser),
+# "stream" reads every way of highways_helper once and splits it at intersections (ConnectionStreamBuilder)
+CONNECTION_BUILDER = "recursive"
+
+# Elevation source: "remote" queries the OpenElevation API, "raster" samples local DEM tiles (.hgt or uncompressed
+# GeoTIFF in geographic coordinates) from DEM_DIRECTORY and uses the OpenElevation API only outside of them
+ELEVATION_BACKEND = "remote"
+DEM_DIRECTORY = "data/dem"
+
+# Elevation cache keyed by coordinates rounded to ELEVATION_CACHE_PRECISION decimal places: "redis" (hash in the Redis
+# database ELEVATION_CACHE_REDIS_DB), "file" (SQLite file ELEVATION_CACHE_FILE), "memory" (in-process only) or None
+ELEVATION_CACHE = "redis"
+ELEVATION_CACHE_SIZE = 1000000  # Entries of the in-process LRU tier
+ELEVATION_CACHE_PRECISION = 6
+ELEVATION_CACHE_REDIS_DB = 1
+ELEVATION_CACHE_FILE = "data/elevation_cache.sqlite"
+
+# Memo of the way segment metrics of stage 4, which reaches every segment from both of its ends: "redis" (one hash per
+# way in the Redis database SEGMENT_MEMO_REDIS_DB, shared by the workers and kept for incremental updates, cleared when
+# the full stage 4 starts), "memory" (in-process only) or None
+SEGMENT_MEMO = "memory"
+SEGMENT_MEMO_SIZE = 100000  # Entries of the in-process LRU tier
+SEGMENT_MEMO_REDIS_DB = 3
+
+# Stage 1 writes documents in unordered batches of LOADER_BATCH_SIZE from a background thread per collection, at most
+# LOADER_QUEUE_SIZE batches per collection wait for it (bounds the memory of pending documents)
+LOADER_BATCH_SIZE = 10000
+LOADER_QUEUE_SIZE = 4
+
+# Columnar store of the highway nodes (id -> location and ways) written in stage 1, memory-mapped by the later stages
+# instead of querying nodes_helper (built from nodes_helper on first use if missing)
+NODE_STORE_DIRECTORY = "data/node_store"
+
+# Stage 4 marks the addressed intersections of a tile in the Redis set "addressed_nodes" of database 0, in batches of
+# ADDRESSED_FLUSH_SIZE (an interrupted tile repeats at most this many intersections)
+ADDRESSED_FLUSH_SIZE = 100
+
+# Maximum number of parsed highways_helper ways cached by each stage 4 worker
+WAY_CACHE_SIZE = 20000
+# Coordinates per elevation request when stage 4 prefetches the elevations of the nodes of a tile
+TILE_ELEVATION_BATCH_SIZE = 5000
+
+# Source of the intersections: "overpass" queries them tile by tile in stage 2, "pbf" derives them from the way
+# references of the pruned PBF file in stage 1 (stage 2 is then skipped)
+INTERSECTION_SOURCE = "overpass"
+
+# Adaptive tiling of the Overpass intersection queries (stage 2): root tiles of TILE_ROOT_SIZE degrees are split into
+# quadrants when their query times out or returns more than TILE_MAX_NODES intersections, down to TILE_MIN_SIZE.
+# The learned tiling is kept in the Redis database TILING_REDIS_DB
+TILE_ROOT_SIZE = 0.12
+TILE_MIN_SIZE = 0.0075
+TILE_MAX_NODES = 5000
+TILING_REDIS_DB = 2
+OVERPASS_TIMEOUT = 180  # Seconds, sent with every intersection query
+OVERPASS_MAX_CONCURRENCY = 16  # Upper limit of concurrent Overpass queries, the actual limit adapts to the server
+
 
 # End of configuration, leave the rest of the file as it is
@@ -0,0 +1,153 @@
+import os
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+import redis
+
+from setup.ElevationProvider import ElevationProvider
+
+
+class RedisElevationStore:
+    def __init__(self, redis_db: redis.client.Redis, key: str = "elevation_cache"):
+        """
+        Persistent elevation cache tier, stored as a single Redis hash shared by all processes.
+        :param redis_db: Redis client
+        :param key: Name of the hash
+        """
+        self.redis_db = redis_db
+        self.key = key
+
+    def get_many(self, keys: list[tuple[int, int]]) -> dict:
+        values = self.redis_db.hmget(self.key, [f"{lat}:{lon}" for lat, lon in keys])
+        return {key: float(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, values: dict):
+        if values:
+            self.redis_db.hset(self.key, mapping={f"{lat}:{lon}": value for (lat, lon), value in values.items()})
+
+
+class FileElevationStore:
+    def __init__(self, path: str):
+        """
+        Persistent elevation cache tier, stored in a local SQLite file (safe to share between processes).
+        :param path: Location of the SQLite file
+        """
+        self.path = path
+        self.connection = None
+        self.pid = None
+
+    def connect(self) -> sqlite3.Connection:
+        # Connect lazily and again after a fork, so every worker process uses its own connection
+        if self.connection is None or self.pid != os.getpid():
+            self.pid = os.getpid()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS elevation "
+                "(lat INTEGER, lon INTEGER, elevation REAL, PRIMARY KEY (lat, lon))"
+            )
+        return self.connection
+
+    def get_many(self, keys: list[tuple[int, int]]) -> dict:
+        connection = self.connect()
+        result = {}
+        for i in range(0, len(keys), 400):  # 2 parameters per key, SQLite allows 999 per statement
+            chunk = keys[i : i + 400]
+            placeholders = ", ".join(["(?, ?)"] * len(chunk))
+            rows = connection.execute(
+                f"SELECT lat, lon, elevation FROM elevation WHERE (lat, lon) IN (VALUES {placeholders})",
+                [value for key in chunk for value in key],
+            )
+            for lat, lon, elevation in rows:
+                result[(lat, lon)] = elevation
+        return result
+
+    def set_many(self, values: dict):
+        if values:
+            connection = self.connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO elevation (lat, lon, elevation) VALUES (?, ?, ?)",
+                    [(lat, lon, value) for (lat, lon), value in values.items()],
+                )
+
+
+class ElevationCache(ElevationProvider):
+    def __init__(self, backend: ElevationProvider, store=None, size: int = 1000000, precision: int = 6):
+        """
+        Elevation provider wrapper, caching elevations by quantized coordinates. Lookups go through an in-process LRU
+        tier and an optional persistent tier, only the misses of both are sent to the backend.
+        :param backend: Elevation provider queried on cache misses
+        :param store: Persistent tier (RedisElevationStore or FileElevationStore), None for the in-process tier only
+        :param size: Maximum number of entries of the in-process tier
+        :param precision: Number of decimal places of the quantized coordinates
+        """
+        self.backend = backend
+        self.store = store
+        self.size = size
+        self.scale = 10**precision
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def elevations(self, lats, lons) -> np.ndarray:
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        lat_keys = np.round(lats * self.scale).astype(np.int64).tolist()
+        lon_keys = np.round(lons * self.scale).astype(np.int64).tolist()
+        keys = list(zip(lat_keys, lon_keys))
+
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                found[key] = self.memory[key]
+                self.memory_hits += 1
+            else:
+                missing.append(key)
+
+        if missing and self.store is not None:
+            stored = self.store.get_many(missing)
+            self.store_hits += len(stored)
+            self.remember(stored)
+            found.update(stored)
+            missing = [key for key in missing if key not in stored]
+
+        if missing:
+            self.misses += len(missing)
+            missing_lats = np.array([lat for lat, _ in missing], dtype=np.float64) / self.scale
+            missing_lons = np.array([lon for _, lon in missing], dtype=np.float64) / self.scale
+            fetched = dict(zip(missing, self.backend.elevations(missing_lats, missing_lons).tolist()))
+            if self.store is not None:
+                self.store.set_many(fetched)
+            self.remember(fetched)
+            found.update(fetched)
+
+        return np.array([found[key] for key in keys], dtype=np.float64)
+
+    def remember(self, values: dict):
+        self.memory.update(values)
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.store_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.store_hits) / lookups if lookups else 0.0,
+        }
+
+    def __str__(self):
+        stats = self.stats()
+        return (
+            f"Elevation cache: {stats['memory_hits']} memory hits, {stats['store_hits']} persistent hits, "
+            f"{stats['misses']} misses, hit rate {stats['hit_rate']:.2%}"
+        )
@@ -0,0 +1,217 @@
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+from sport_activities_features import ElevationIdentification
+
+from setup.Constants import OPEN_ELEVATION_API_URL
+
+
+class ElevationProvider(ABC):
+    """Base class for elevation sources, returning elevations for arrays of coordinates."""
+
+    @abstractmethod
+    def elevations(self, lats, lons) -> np.ndarray:
+        """
+        Get the elevations of the given coordinates.
+        :param lats: Latitudes in degrees
+        :param lons: Longitudes in degrees
+        :return: Array of elevations in meters
+        """
+
+    def __str__(self):
+        return f"Elevation provider: {type(self).__name__}"
+
+
+class RemoteElevationProvider(ElevationProvider):
+    def __init__(self, open_elevation_api: str = OPEN_ELEVATION_API_URL, retries: int = 5, retry_delay: float = 2):
+        """
+        Elevation source querying an OpenElevation API instance.
+        :param open_elevation_api: Lookup URL of the OpenElevation API
+        :param retries: Number of attempts before giving up
+        :param retry_delay: Seconds to wait between attempts
+        """
+        self.open_elevation_api = open_elevation_api
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def elevations(self, lats, lons) -> np.ndarray:
+        positions = [(float(lat), float(lon)) for lat, lon in zip(lats, lons)]
+        if not positions:
+            return np.zeros(0)
+        for i in range(self.retries):
+            try:
+                elevation_identification = ElevationIdentification(
+                    open_elevation_api=self.open_elevation_api, positions=positions
+                )
+                return np.asarray(elevation_identification.fetch_elevation_data(), dtype=np.float64)
+            except Exception as e:
+                print(f"Error in RemoteElevationProvider.elevations: {e}")
+                print(f"Retrying... {i + 1}/{self.retries}")
+                if i == self.retries - 1:
+                    raise
+                time.sleep(self.retry_delay)
+
+
+class RasterTile:
+    def __init__(self, data: np.ndarray, min_lat: float, max_lat: float, min_lon: float, max_lon: float, nodata=None):
+        """
+        A DEM raster in geographic coordinates. The first row of data is the northern edge, the first column the
+        western edge, and the outer rows and columns lie exactly on the tile boundaries (like in SRTM .hgt files).
+        :param data: 2D array of elevations, usually a np.memmap so only the sampled pages are read from disk
+        :param min_lat: Latitude of the last row
+        :param max_lat: Latitude of the first row
+        :param min_lon: Longitude of the first column
+        :param max_lon: Longitude of the last column
+        :param nodata: Value marking missing elevations
+        """
+        self.data = data
+        self.min_lat = min_lat
+        self.max_lat = max_lat
+        self.min_lon = min_lon
+        self.max_lon = max_lon
+        self.nodata = nodata
+
+    @staticmethod
+    def from_hgt(path: str) -> "RasterTile":
+        """
+        Memory-map an SRTM .hgt tile (big-endian int16 samples), named after its south-west corner, e.g. N46E014.hgt.
+        :param path: Location of the .hgt file
+        :return: RasterTile
+        """
+        match = re.match(r"([NS])(\d+)([EW])(\d+)", os.path.basename(path).upper())
+        if match is None:
+            raise ValueError(f"Can not read tile coordinates from file name {path}")
+        lat = int(match.group(2)) * (1 if match.group(1) == "N" else -1)
+        lon = int(match.group(4)) * (1 if match.group(3) == "E" else -1)
+        size = int(round((os.path.getsize(path) // 2) ** 0.5))
+        data = np.memmap(path, dtype=">i2", mode="r", shape=(size, size))
+        return RasterTile(data, min_lat=lat, max_lat=lat + 1, min_lon=lon, max_lon=lon + 1, nodata=-32768)
+
+    @staticmethod
+    def from_geotiff(path: str) -> "RasterTile":
+        """
+        Memory-map an uncompressed single band GeoTIFF in geographic coordinates (e.g. EU-DEM in EPSG:4258).
+        Requires the optional tifffile package.
+        :param path: Location of the .tif file
+        :return: RasterTile
+        """
+        try:
+            import tifffile
+        except ImportError as e:
+            raise ImportError("Reading GeoTIFF DEM tiles requires the tifffile package (pip install tifffile)") from e
+
+        with tifffile.TiffFile(path) as tif:
+            tags = tif.pages[0].tags
+            scale_x, scale_y = tags["ModelPixelScaleTag"].value[:2]
+            origin_x, origin_y = tags["ModelTiepointTag"].value[3:5]
+            nodata = float(tags["GDAL_NODATA"].value) if "GDAL_NODATA" in tags else None
+        data = tifffile.memmap(path, mode="r")
+        height, width = data.shape
+        # GeoTIFF rasters default to PixelIsArea, sample positions are the pixel centers
+        min_lon = origin_x + scale_x / 2
+        max_lat = origin_y - scale_y / 2
+        return RasterTile(
+            data,
+            min_lat=max_lat - (height - 1) * scale_y,
+            max_lat=max_lat,
+            min_lon=min_lon,
+            max_lon=min_lon + (width - 1) * scale_x,
+            nodata=nodata,
+        )
+
+    def covers(self, lats: np.ndarray, lons: np.ndarray, margin: bool = False) -> np.ndarray:
+        """
+        Check which points lie inside the tile.
+        :param lats: Latitudes in degrees
+        :param lons: Longitudes in degrees
+        :param margin: Also accept points in the half sample wide border around the outer samples (e.g. the edge of
+        a GeoTIFF with pixel centered samples)
+        :return: Boolean array
+        """
+        height, width = self.data.shape
+        lat_margin = (self.max_lat - self.min_lat) / (height - 1) / 2 if margin else 0
+        lon_margin = (self.max_lon - self.min_lon) / (width - 1) / 2 if margin else 0
+        return (
+            (lats >= self.min_lat - lat_margin)
+            & (lats <= self.max_lat + lat_margin)
+            & (lons >= self.min_lon - lon_margin)
+            & (lons <= self.max_lon + lon_margin)
+        )
+
+    def sample(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """
+        Bilinear interpolation of the elevations of points inside the tile.
+        :param lats: Latitudes in degrees
+        :param lons: Longitudes in degrees
+        :return: Array of elevations, NaN where one of the surrounding samples is missing
+        """
+        height, width = self.data.shape
+        rows = np.clip((self.max_lat - lats) / (self.max_lat - self.min_lat) * (height - 1), 0, height - 1)
+        columns = np.clip((lons - self.min_lon) / (self.max_lon - self.min_lon) * (width - 1), 0, width - 1)
+        row = np.clip(np.floor(rows).astype(np.int64), 0, height - 2)
+        column = np.clip(np.floor(columns).astype(np.int64), 0, width - 2)
+        row_fraction = rows - row
+        column_fraction = columns - column
+
+        corners = [
+            self.data[row, column],
+            self.data[row, column + 1],
+            self.data[row + 1, column],
+            self.data[row + 1, column + 1],
+        ]
+        corners = [np.asarray(corner, dtype=np.float64) for corner in corners]
+        if self.nodata is not None:
+            for corner in corners:
+                corner[corner == self.nodata] = np.nan
+        top = corners[0] * (1 - column_fraction) + corners[1] * column_fraction
+        bottom = corners[2] * (1 - column_fraction) + corners[3] * column_fraction
+        return top * (1 - row_fraction) + bottom * row_fraction
+
+
+class RasterElevationProvider(ElevationProvider):
+    def __init__(self, tiles: list[RasterTile], fallback: ElevationProvider | None = None):
+        """
+        Elevation source sampling local DEM tiles.
+        :param tiles: List of RasterTile objects
+        :param fallback: Provider for points outside of the tiles or on missing samples, None to raise an error
+        """
+        self.tiles = tiles
+        self.fallback = fallback
+
+    @staticmethod
+    def from_directory(directory: str, fallback: ElevationProvider | None = None) -> "RasterElevationProvider":
+        """
+        Load all .hgt and .tif/.tiff tiles of a directory.
+        :param directory: Directory with DEM tiles
+        :param fallback: Provider for points outside of the tiles
+        :return: RasterElevationProvider
+        """
+        tiles = []
+        for file in sorted(os.listdir(directory)):
+            path = os.path.join(directory, file)
+            if file.lower().endswith(".hgt"):
+                tiles.append(RasterTile.from_hgt(path))
+            elif file.lower().endswith((".tif", ".tiff")):
+                tiles.append(RasterTile.from_geotiff(path))
+        print(f"Loaded {len(tiles)} DEM tiles from {directory}")
+        return RasterElevationProvider(tiles, fallback=fallback)
+
+    def elevations(self, lats, lons) -> np.ndarray:
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(len(lats), np.nan)
+        for margin in (False, True):
+            for tile in self.tiles:
+                mask = np.isnan(result) & tile.covers(lats, lons, margin=margin)
+                if mask.any():
+                    result[mask] = tile.sample(lats[mask], lons[mask])
+
+        missing = np.isnan(result)
+        if missing.any():
+            if self.fallback is None:
+                raise ValueError(f"No DEM data for {missing.sum()} of {len(result)} points")
+            result[missing] = self.fallback.elevations(lats[missing], lons[missing])
+        return result
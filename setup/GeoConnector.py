@@ -1,3 +1,5 @@
+import os
+
 import overpy
 import py2neo
 import pymongo
@@ -7,16 +9,40 @@ from setup.Constants import (
     REDIS_DB_ADDRESS,
     REDIS_DB_PORT,
     REDIS_DB_PASSWORD,
+    REDIS_DB_MAX_CONNECTIONS,
     MONGO_DB_ADDRESS,
     MONGO_DB_PORT,
     MONGO_DB_USERNAME,
     MONGO_DB_PASSWORD,
+    MONGO_DB_MAX_POOL_SIZE,
     NEO4J_DB_ADDRESS,
     NEO4J_DB_USERNAME,
     NEO4J_DB_PASSWORD,
+    NEO4J_DB_MAX_POOL_SIZE,
     OVERPASS_API_URL,
+    OVERPASS_TIMEOUT,
+    OVERPASS_MAX_CONCURRENCY,
     OPEN_ELEVATION_API_URL,
+    ELEVATION_BACKEND,
+    DEM_DIRECTORY,
+    ELEVATION_CACHE,
+    ELEVATION_CACHE_SIZE,
+    ELEVATION_CACHE_PRECISION,
+    ELEVATION_CACHE_REDIS_DB,
+    ELEVATION_CACHE_FILE,
+    NODE_STORE_DIRECTORY,
 )
+from setup.ElevationCache import ElevationCache, FileElevationStore, RedisElevationStore
+from setup.ElevationProvider import ElevationProvider, RasterElevationProvider, RemoteElevationProvider
+from setup.NodeStore import NodeStore
+from setup.OverpassClient import AsyncOverpassClient
+
+# Elevation provider of the current process, see GeoConnector.elevation_provider()
+shared_elevation_provider: ElevationProvider | None = None
+
+# Database clients of the current process and the process they were created in, see GeoConnector.shared_client()
+shared_clients: dict = {}
+shared_clients_pid: int | None = None
 
 
 class GeoConnector:
@@ -41,51 +67,134 @@ class GeoConnector:
         }
 
     @staticmethod
-    def redis_db() -> redis.client.Redis:
+    def shared_client(name: str, factory):
         """
-        Get the Redis database object.s
+        Get a client cached for the current process, creating it on first use. Clients inherited through a fork are
+        dropped (not closed, the parent still uses their sockets) and created again in the child process.
+        :param name: Cache key of the client
+        :param factory: Function creating the client
         :return:
         """
+        global shared_clients, shared_clients_pid
+        if shared_clients_pid != os.getpid():
+            shared_clients = {}
+            shared_clients_pid = os.getpid()
+        if name not in shared_clients:
+            shared_clients[name] = factory()
+        return shared_clients[name]
 
-        return redis.Redis(
-            host=REDIS_DB_ADDRESS,
-            port=REDIS_DB_PORT,
-            password=REDIS_DB_PASSWORD,
-            retry_on_timeout=True,
+    @staticmethod
+    def redis_db(db: int = 0) -> redis.client.Redis:
+        """
+        Get the Redis database object, shared within the process.
+        :param db: Number of the logical Redis database
+        :return:
+        """
+        return GeoConnector.shared_client(
+            f"redis_db_{db}",
+            lambda: redis.Redis(
+                host=REDIS_DB_ADDRESS,
+                port=REDIS_DB_PORT,
+                password=REDIS_DB_PASSWORD,
+                db=db,
+                retry_on_timeout=True,
+                max_connections=REDIS_DB_MAX_CONNECTIONS,
+            ),
         )
 
     @staticmethod
     def mongo_db() -> pymongo.MongoClient:
         """
-        Get the Mongo database object.
+        Get the Mongo database object, shared within the process. Do not close it, see GeoConnector.close().
         :return:
         """
-        return pymongo.MongoClient(
-            host=MONGO_DB_ADDRESS,
-            port=MONGO_DB_PORT,
-            username=MONGO_DB_USERNAME,
-            password=MONGO_DB_PASSWORD,
+        return GeoConnector.shared_client(
+            "mongo_db",
+            lambda: pymongo.MongoClient(
+                host=MONGO_DB_ADDRESS,
+                port=MONGO_DB_PORT,
+                username=MONGO_DB_USERNAME,
+                password=MONGO_DB_PASSWORD,
+                maxPoolSize=MONGO_DB_MAX_POOL_SIZE,
+            ),
         )
 
     @staticmethod
     def neo4j_db() -> py2neo.database.Graph:
         """
-        Get the Neo4j database object.
+        Get the Neo4j database object, shared within the process.
         :return:
         """
-        return py2neo.Graph(
-            uri=NEO4J_DB_ADDRESS,
-            user=NEO4J_DB_USERNAME,
-            password=NEO4J_DB_PASSWORD,
+        return GeoConnector.shared_client(
+            "neo4j_db",
+            lambda: py2neo.Graph(
+                uri=NEO4J_DB_ADDRESS,
+                user=NEO4J_DB_USERNAME,
+                password=NEO4J_DB_PASSWORD,
+                max_size=NEO4J_DB_MAX_POOL_SIZE,
+            ),
         )
 
+    @staticmethod
+    def close():
+        """
+        Close the database clients of the current process. Later calls of redis_db(), mongo_db() and neo4j_db()
+        create new clients. The asyncio Overpass client has to be closed in its event loop.
+        :return:
+        """
+        global shared_clients
+        if shared_clients_pid == os.getpid():
+            for name, client in shared_clients.items():
+                try:
+                    if isinstance(client, py2neo.Graph):
+                        client.service.connector.close()
+                    elif isinstance(client, (redis.Redis, pymongo.MongoClient)):
+                        client.close()
+                except Exception as e:
+                    print(f"Error closing {name}: {e}")
+        shared_clients = {}
+
     @staticmethod
     def overpass_api() -> overpy.Overpass:
         """
-        Get the Overpass API object.
+        Get the Overpass API object, shared within the process.
         :return:
         """
-        return overpy.Overpass(url=OVERPASS_API_URL)
+        return GeoConnector.shared_client("overpass_api", lambda: overpy.Overpass(url=OVERPASS_API_URL))
+
+    @staticmethod
+    def async_overpass_api() -> AsyncOverpassClient:
+        """
+        Get the asyncio Overpass API client, shared within the process. Close it with its close() coroutine before
+        the event loop ends.
+        :return:
+        """
+        return GeoConnector.shared_client(
+            "async_overpass_api",
+            lambda: AsyncOverpassClient(
+                OVERPASS_API_URL, max_concurrency=OVERPASS_MAX_CONCURRENCY, timeout=OVERPASS_TIMEOUT + 30
+            ),
+        )
+
+    @staticmethod
+    def node_store(rebuild: bool = False) -> NodeStore:
+        """
+        Get the memory-mapped node store, shared within the process. If stage 1 did not write it, it is built from
+        nodes_helper first, so call it once in the main process before starting workers.
+        :param rebuild: Build the store from nodes_helper again, after nodes_helper was changed
+        :return:
+        """
+
+        def load():
+            if rebuild or not NodeStore.exists(NODE_STORE_DIRECTORY):
+                print("Building node store from nodes_helper...")
+                collection = GeoConnector.mongo_db().get_database("geo_data").get_collection("nodes_helper")
+                return NodeStore.build(collection, NODE_STORE_DIRECTORY)
+            return NodeStore.load(NODE_STORE_DIRECTORY)
+
+        if rebuild:
+            shared_clients.pop("node_store", None)
+        return GeoConnector.shared_client("node_store", load)
 
     @staticmethod
     def open_elevation_api() -> str:
@@ -95,6 +204,34 @@ class GeoConnector:
         """
         return OPEN_ELEVATION_API_URL
 
+    @staticmethod
+    def elevation_provider() -> ElevationProvider:
+        """
+        Get the elevation provider selected with ELEVATION_BACKEND, wrapped into the ELEVATION_CACHE cache and
+        created once per process.
+        :return:
+        """
+        global shared_elevation_provider
+        if shared_elevation_provider is None:
+            remote = RemoteElevationProvider(open_elevation_api=OPEN_ELEVATION_API_URL)
+            if ELEVATION_BACKEND == "raster":
+                provider = RasterElevationProvider.from_directory(DEM_DIRECTORY, fallback=remote)
+            else:
+                provider = remote
+
+            if ELEVATION_CACHE == "redis":
+                store = RedisElevationStore(GeoConnector.redis_db(ELEVATION_CACHE_REDIS_DB))
+            elif ELEVATION_CACHE == "file":
+                store = FileElevationStore(ELEVATION_CACHE_FILE)
+            else:
+                store = None
+            if ELEVATION_CACHE is not None:
+                provider = ElevationCache(
+                    provider, store=store, size=ELEVATION_CACHE_SIZE, precision=ELEVATION_CACHE_PRECISION
+                )
+            shared_elevation_provider = provider
+        return shared_elevation_provider
+
     def __str__(self):
         return (
             f"Redis DB:\n"
@@ -111,5 +248,6 @@ class GeoConnector:
             f" User: {self.__connection_strings['neo4j_db']['user']}\n"
             f" Password: {self.__connection_strings['neo4j_db']['password']}\n\n"
             f"Overpass API: {OVERPASS_API_URL} \n"
-            f"Open Elevation API: {OPEN_ELEVATION_API_URL}"
+            f"Open Elevation API: {OPEN_ELEVATION_API_URL}\n"
+            f"Elevation backend: {ELEVATION_BACKEND} (cache: {ELEVATION_CACHE})"
         )
@@ -1,3 +1,5 @@
+import numpy as np
+
 from setup.Constants import MAXIMUM_LATITUDE, MINIMUM_LATITUDE, MAXIMUM_LONGITUDE, MINIMUM_LONGITUDE
 
 
@@ -15,6 +17,17 @@ class MapBoundaries:
         self.max_lon = max_lon
         self.min_lon = min_lon
 
+    def contains(self, lats, lons) -> np.ndarray:
+        """
+        Vectorized test whether points lie inside of the boundaries (borders included).
+        :param lats: Latitudes of the points
+        :param lons: Longitudes of the points
+        :return: Boolean array
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        return (lats >= self.min_lat) & (lats <= self.max_lat) & (lons >= self.min_lon) & (lons <= self.max_lon)
+
     def max_number_in_matrix(self, matrix):
         max_number = 0
         for i in range(len(matrix)):
@@ -66,24 +79,35 @@ class MapBoundaries:
 
 
 
+    def generate_grid_cells(self, grid_size: int) -> list[tuple[int, int, tuple[float, float, float, float]]]:
+        """
+        Divide the area into grid_size x grid_size cells.
+        :param grid_size: Number of rows and columns
+        :return: List of (row, column, (min_lat, max_lat, min_lon, max_lon)), row by row
+        """
+        lat_step = (self.max_lat - self.min_lat) / grid_size
+        lon_step = (self.max_lon - self.min_lon) / grid_size
+        return [
+            (
+                i,
+                j,
+                (
+                    self.min_lat + i * lat_step,
+                    self.min_lat + (i + 1) * lat_step,
+                    self.min_lon + j * lon_step,
+                    self.min_lon + (j + 1) * lon_step,
+                ),
+            )
+            for i in range(grid_size)
+            for j in range(grid_size)
+        ]
+
     def generate_grid_queries(self, grid_size: int):
         """Generates a list of queries to be used, divided in grid like cells.
         :param grid_size: The number of cells to divide the area into, will work on more processors if grid size is higher than 2"""
-        lat_step = (self.max_lat - self.min_lat) / grid_size
-        lon_step = (self.max_lon - self.min_lon) / grid_size
-        total_queries = []
+        total_queries = [bounds for _, _, bounds in self.generate_grid_cells(grid_size)]
         matrix = self.__fill_matrix(grid_size, grid_size)
 
-        for i in range(grid_size):
-            for j in range(grid_size):
-                total_queries.append(
-                    (
-                        self.min_lat + i * lat_step,
-                        self.min_lat + (i + 1) * lat_step,
-                        self.min_lon + j * lon_step,
-                        self.min_lon + (j + 1) * lon_step,
-                    )
-                )
         max_number = self.max_number_in_matrix(matrix)
 
         ordered_queries = []
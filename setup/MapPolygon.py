@@ -0,0 +1,77 @@
+import numpy as np
+
+from setup.MapBoundaries import MapBoundaries
+
+
+class MapPolygon:
+    def __init__(self, rings: list[np.ndarray]):
+        """
+        Area given by polygon rings, e.g. a country border. Points are inside if they are enclosed by an odd number of
+        rings, so holes are rings inside of an outer ring.
+        :param rings: List of closed rings, each an array of (lon, lat) rows
+        """
+        self.rings = rings
+        coordinates = np.concatenate(rings) if rings else np.zeros((0, 2))
+        self.boundaries = MapBoundaries(
+            max_lat=coordinates[:, 1].max(initial=-90),
+            min_lat=coordinates[:, 1].min(initial=90),
+            max_lon=coordinates[:, 0].max(initial=-180),
+            min_lon=coordinates[:, 0].min(initial=180),
+        )
+
+    @staticmethod
+    def from_poly_file(path: str) -> "MapPolygon":
+        """
+        Read an Osmosis polygon filter file (.poly, as used by osmium extract and the Geofabrik extracts).
+        :param path: Location of the file
+        :return: MapPolygon
+        """
+        rings = []
+        with open(path) as f:
+            lines = [line.strip() for line in f]
+        i = 1  # The first line is the name of the polygon
+        while i < len(lines) and lines[i] != "END":
+            i += 1  # Name of the ring, rings starting with "!" are holes
+            ring = []
+            while lines[i] != "END":
+                if lines[i]:
+                    lon, lat = lines[i].split()[:2]
+                    ring.append((float(lon), float(lat)))
+                i += 1
+            i += 1
+            if ring:
+                if ring[0] != ring[-1]:
+                    ring.append(ring[0])
+                rings.append(np.array(ring))
+        return MapPolygon(rings)
+
+    def contains(self, lats, lons) -> np.ndarray:
+        """
+        Vectorized point in polygon test (even-odd ray casting).
+        :param lats: Latitudes of the points
+        :param lons: Longitudes of the points
+        :return: Boolean array
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        inside = np.zeros(len(lats), dtype=bool)
+        candidates = np.flatnonzero(self.boundaries.contains(lats, lons))
+        if not len(candidates):
+            return inside
+        # Only points within the bounding box are tested against the rings
+        candidate_lats = lats[candidates][:, None]
+        candidate_lons = lons[candidates][:, None]
+        crossings = np.zeros(len(candidates), dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for ring in self.rings:
+                lon_a, lat_a = ring[:-1, 0], ring[:-1, 1]
+                lon_b, lat_b = ring[1:, 0], ring[1:, 1]
+                spans = (lat_a > candidate_lats) != (lat_b > candidate_lats)
+                crossing_lon = lon_a + (candidate_lats - lat_a) * (lon_b - lon_a) / (lat_b - lat_a)
+                crossings ^= (spans & (candidate_lons < crossing_lon)).sum(axis=1) % 2 == 1
+        inside[candidates] = crossings
+        return inside
+
+    def __str__(self):
+        points = sum(len(ring) for ring in self.rings)
+        return f"Map Polygon: {len(self.rings)} rings, {points} points\n{self.boundaries}"
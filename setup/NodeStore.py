@@ -0,0 +1,148 @@
+import os
+import shutil
+from array import array
+
+import numpy as np
+from pymongo.collection import Collection
+
+# Node coordinates are stored as int32 in units of 1e-7 degrees, the fixed-point precision of OSM
+COORDINATE_SCALE = 10_000_000
+# Coordinate of a node referenced by a way but missing from the extract
+MISSING_COORDINATE = np.iinfo(np.int32).min
+
+COLUMNS = ("ids", "lat", "lon", "offsets", "ways")
+
+
+class NodeStore:
+    def __init__(self, ids: np.ndarray, lat: np.ndarray, lon: np.ndarray, offsets: np.ndarray, ways: np.ndarray):
+        """
+        Columnar store of the highway nodes: node id -> location and ways. Each column is a .npy file of a store
+        directory, memory-mapped so all worker processes share it through the OS page cache. Nodes are found with
+        binary search over the sorted IDs, the ways of ids[i] are ways[offsets[i]:offsets[i + 1]].
+        :param ids: Sorted array of unique node IDs (int64)
+        :param lat: Latitudes in 1e-7 degrees (int32), MISSING_COORDINATE for nodes missing from the extract
+        :param lon: Longitudes in 1e-7 degrees (int32), MISSING_COORDINATE for nodes missing from the extract
+        :param offsets: Offsets of the ways of every node in ways (int64, one more than ids)
+        :param ways: Way IDs of the nodes (int64)
+        """
+        self.ids = ids
+        self.lat = lat
+        self.lon = lon
+        self.offsets = offsets
+        self.ways = ways
+
+    @staticmethod
+    def save(directory: str, ids, lat, lon, offsets, ways) -> "NodeStore":
+        """
+        Save the columns to a store directory, replacing an existing store.
+        :param directory: Location of the store
+        :return: The memory-mapped store
+        """
+        columns = {
+            "ids": np.asarray(ids, dtype=np.int64),
+            "lat": np.asarray(lat, dtype=np.int32),
+            "lon": np.asarray(lon, dtype=np.int32),
+            "offsets": np.asarray(offsets, dtype=np.int64),
+            "ways": np.asarray(ways, dtype=np.int64),
+        }
+        # Write to a temporary directory first, so workers never map a half written store
+        temporary_directory = f"{directory.rstrip(os.sep)}.tmp"
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        os.makedirs(temporary_directory)
+        for name, column in columns.items():
+            np.save(os.path.join(temporary_directory, f"{name}.npy"), column)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temporary_directory, directory)
+
+        return NodeStore.load(directory)
+
+    @staticmethod
+    def build(collection: Collection, directory: str) -> "NodeStore":
+        """
+        Build the store from the nodes_helper collection, for databases loaded before stage 1 wrote the store.
+        :param collection: The nodes_helper collection
+        :param directory: Location of the store
+        :return: The memory-mapped store
+        """
+        ids, lat, lon, offsets, ways = array("q"), array("i"), array("i"), array("q", [0]), array("q")
+        documents = collection.find({"ways.0": {"$exists": True}}, {"ways": 1, "lat": 1, "lon": 1}).sort("_id", 1)
+        for doc in documents:
+            ids.append(doc["_id"])
+            lat.append(round(doc["lat"] * COORDINATE_SCALE) if "lat" in doc else MISSING_COORDINATE)
+            lon.append(round(doc["lon"] * COORDINATE_SCALE) if "lon" in doc else MISSING_COORDINATE)
+            ways.extend(doc["ways"])
+            offsets.append(len(ways))
+
+        return NodeStore.save(directory, ids, lat, lon, offsets, ways)
+
+    @staticmethod
+    def load(directory: str) -> "NodeStore":
+        """
+        Memory-map a store directory.
+        :param directory: Location of the store
+        :return: The memory-mapped store
+        """
+        return NodeStore(*[np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in COLUMNS])
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return all(os.path.exists(os.path.join(directory, f"{name}.npy")) for name in COLUMNS)
+
+    def positions(self, node_ids) -> np.ndarray:
+        """
+        Vectorized lookup of nodes.
+        :param node_ids: Iterable of node IDs
+        :return: Array of positions in the store, -1 for unknown nodes
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if len(self.ids) == 0 or len(node_ids) == 0:
+            return np.full(len(node_ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, node_ids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == node_ids, positions, -1)
+
+    def ways_of(self, node_id: int) -> list[int] | None:
+        """
+        Get the ways of a node.
+        :param node_id: Node ID
+        :return: List of way IDs, None for unknown nodes
+        """
+        return self.ways_of_nodes([node_id])[0]
+
+    def ways_of_nodes(self, node_ids) -> list[list[int] | None]:
+        """
+        Get the ways of several nodes with one vectorized lookup.
+        :param node_ids: Iterable of node IDs
+        :return: List of way ID lists in the order of node_ids, None for unknown nodes
+        """
+        positions = self.positions(node_ids)
+        if len(self.ids) == 0:
+            return [None] * len(positions)
+        starts = self.offsets[np.maximum(positions, 0)].tolist()
+        ends = self.offsets[np.maximum(positions, 0) + 1].tolist()  # offsets has one more entry than ids
+        return [
+            self.ways[start:end].tolist() if position >= 0 else None
+            for position, start, end in zip(positions.tolist(), starts, ends)
+        ]
+
+    def locations(self, node_ids) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the locations of several nodes.
+        :param node_ids: Iterable of node IDs
+        :return: Arrays of latitudes and longitudes in degrees, NaN for unknown nodes and nodes without location
+        """
+        positions = self.positions(node_ids)
+        if len(self.ids) == 0:
+            return np.full(len(positions), np.nan), np.full(len(positions), np.nan)
+        lat = self.lat[np.maximum(positions, 0)]
+        lon = self.lon[np.maximum(positions, 0)]
+        valid = (positions >= 0) & (lat != MISSING_COORDINATE)
+        return (
+            np.where(valid, lat / COORDINATE_SCALE, np.nan),
+            np.where(valid, lon / COORDINATE_SCALE, np.nan),
+        )
+
+    def __contains__(self, node_id) -> bool:
+        return bool(self.positions([node_id])[0] >= 0)
+
+    def __len__(self):
+        return len(self.ids)
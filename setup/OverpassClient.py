@@ -0,0 +1,151 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+import overpy
+
+
+class AsyncOverpassClient:
+    def __init__(
+        self,
+        url: str,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        timeout: float = 210,
+        retries: int = 5,
+        retry_delay: float = 1,
+        max_retry_delay: float = 60,
+    ):
+        """
+        Asyncio Overpass API client. Queries share one keep-alive connection pool, the number of concurrent queries
+        adapts to the server: it grows by one per concurrency-worth of successful queries, is halved on HTTP 429 / 504
+        responses and shrinks when the smoothed latency rises above twice the lowest smoothed latency seen. Rejected
+        queries are retried after a jittered exponential delay (or the Retry-After header of the response).
+        :param url: Interpreter URL of the Overpass API
+        :param max_concurrency: Upper limit of concurrent queries (and pooled connections)
+        :param min_concurrency: Lower limit of concurrent queries
+        :param timeout: Seconds before a query is abandoned (should exceed the [timeout:] of the queries)
+        :param retries: Number of retries of a rejected query
+        :param retry_delay: Base delay of the retries in seconds
+        :param max_retry_delay: Upper limit of the retry delay in seconds
+        """
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.parser = overpy.Overpass(url=url)  # Only used for parsing the responses
+
+        self.concurrency = float(min(max_concurrency, max(min_concurrency, 4)))
+        self.active = 0
+        self.latency = None  # Exponentially smoothed latency of successful queries
+        self.base_latency = None
+        self.queries = 0
+        self.rejected = 0
+
+        self.session = None
+        self.condition = None
+        self.loop = None
+
+    def connect(self) -> aiohttp.ClientSession:
+        # The session and the condition belong to an event loop, create them again when used from a new one
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            self.loop = loop
+            self.condition = asyncio.Condition()
+            self.active = 0
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def query(self, query: str) -> overpy.Result:
+        """
+        Run an Overpass QL query.
+        :param query: The query string in Overpass QL
+        :return: The parsed result
+        :raises overpy.exception.OverpassError: If the query fails, after the retries for rejected queries
+        """
+        session = self.connect()
+        for attempt in range(self.retries + 1):
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.active < int(self.concurrency))
+                self.active += 1
+            start = time.monotonic()
+            try:
+                async with session.post(self.url, data=query.encode("utf-8")) as response:
+                    status = response.status
+                    content_type = response.content_type
+                    retry_after = response.headers.get("Retry-After")
+                    body = await response.read()
+            except aiohttp.ClientConnectionError as e:
+                # Dropped keep-alive connections and refused connections are retried like rejected queries
+                print(f"Overpass connection error: {e}")
+                status, content_type, retry_after, body = None, None, None, b""
+            finally:
+                async with self.condition:
+                    self.active -= 1
+                    self.condition.notify_all()
+            latency = time.monotonic() - start
+            self.queries += 1
+
+            if status == 200:
+                self.on_success(latency)
+                if content_type == "application/json":
+                    return self.parser.parse_json(body)
+                if content_type == "application/osm3s+xml":
+                    return self.parser.parse_xml(body)
+                raise overpy.exception.OverpassUnknownContentType(content_type)
+            if status == 400:
+                raise overpy.exception.OverpassBadRequest(query.encode("utf-8"), msgs=[body.decode("utf-8", "replace")])
+            if status not in (429, 504, None):
+                raise overpy.exception.OverpassUnknownHTTPStatusCode(status)
+
+            self.on_rejected()
+            if attempt == self.retries:
+                if status == 429:
+                    raise overpy.exception.OverpassTooManyRequests()
+                if status == 504:
+                    raise overpy.exception.OverpassGatewayTimeout()
+                raise ConnectionError(f"Could not connect to the Overpass API at {self.url}")
+            if retry_after is not None and retry_after.isdigit():
+                delay = min(float(retry_after), self.max_retry_delay)
+            else:
+                delay = random.uniform(0, min(self.max_retry_delay, self.retry_delay * 2**attempt))
+            await asyncio.sleep(delay)
+
+    def on_success(self, latency: float) -> None:
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.base_latency = self.latency if self.base_latency is None else min(self.base_latency, self.latency)
+        if self.latency > 2 * self.base_latency:
+            self.concurrency = max(self.min_concurrency, self.concurrency * 0.9)
+        else:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    def on_rejected(self) -> None:
+        self.rejected += 1
+        self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+
+    def stats(self) -> dict:
+        return {
+            "queries": self.queries,
+            "rejected": self.rejected,
+            "concurrency": int(self.concurrency),
+            "latency": self.latency,
+        }
+
+    def __str__(self):
+        latency = f"{self.latency:.2f} s" if self.latency is not None else "-"
+        return (
+            f"Overpass client: {self.queries} queries, {self.rejected} rejected, "
+            f"concurrency {int(self.concurrency)}, smoothed latency {latency}"
+        )